@@ -0,0 +1,131 @@
+import os
+import asyncio
+import functools
+import concurrent.futures
+
+_executor = None
+
+def shared_executor():
+    '''
+    The thread pool all `AsyncScope`s share by default.
+
+    Threads are only busy while a blocking transfer is in progress, so one
+    small pool serves many instruments.
+
+    Returns:
+        concurrent.futures.ThreadPoolExecutor: The pool.
+    '''
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor(
+            min(32, (os.cpu_count() or 1) + 4), 'rigol-aio')
+    return _executor
+
+class _AsyncProxy(object):
+    def __init__(self, obj, scope):
+        self._obj = obj
+        self._scope = scope
+
+    def __getattr__(self, name):
+        attr = getattr(self._obj, name)
+        if callable(attr):
+            @functools.wraps(attr)
+            async def call(*args, **kwargs):
+                return await self._scope.call(attr, *args, **kwargs)
+            return call
+        if hasattr(attr, '_osc'):
+            return _AsyncProxy(attr, self._scope)
+        return attr
+
+    def __getitem__(self, i):
+        return _AsyncProxy(self._obj[i], self._scope)
+
+    def __len__(self):
+        return len(self._obj)
+
+class AsyncScope(_AsyncProxy):
+    '''
+    asyncio front end to an oscilloscope driver.
+
+    Every method of the driver, its channels (`scope[1]`), `trigger` and
+    `timebase` becomes a coroutine function:
+
+        scope = AsyncScope(rigol1000z.Rigol1054z())
+        t, v = await scope[1].get_data('raw')
+        await scope.get_screenshot('screen.png')
+
+    USB transfers block, so each call runs on a thread of a pool shared by
+    all instruments rather than on a thread per instrument.  Calls on one
+    instrument are serialised by a lock, so concurrent coroutines never
+    interleave SCPI exchanges on the same device.
+
+    A call can be given a `timeout` (seconds) or be cancelled.  A
+    transfer that has started cannot be interrupted, so the instrument
+    stays locked until it has finished; the caller gets the
+    `asyncio.TimeoutError` or `asyncio.CancelledError` straight away.
+
+    Args:
+        osc: The oscilloscope driver.
+        executor (None, concurrent.futures.Executor): Runs the blocking
+            calls.  Default is `None`; `shared_executor()`.
+        timeout_s (None, float): Default timeout of each call.  Default is
+            `None`; no timeout.
+    '''
+    def __init__(self, osc, executor=None, timeout_s=None):
+        _AsyncProxy.__init__(self, osc, self)
+        self.osc = osc
+        self.executor = executor or shared_executor()
+        self.timeout_s = timeout_s
+        self._lock = asyncio.Lock()
+
+    async def call(self, func, *args, **kwargs):
+        '''
+        Run a blocking function with exclusive access to the instrument.
+
+        Args:
+            func (callable): The function.
+            *args: Its arguments.
+            timeout (None, float): Seconds to wait for the result.  Default
+                is the scope's `timeout_s`.
+            **kwargs: Its keyword arguments.
+
+        Returns:
+            The function's return value.
+        '''
+        timeout = kwargs.pop('timeout', self.timeout_s)
+        loop = asyncio.get_running_loop()
+        await self._lock.acquire()
+        try:
+            fut = loop.run_in_executor(self.executor,
+                                       functools.partial(func, *args, **kwargs))
+        except BaseException:
+            self._lock.release()
+            raise
+        # Release the lock when the transfer has really finished, not when
+        # the caller gives up waiting for it.
+        fut.add_done_callback(lambda f: self._lock.release())
+        return await asyncio.wait_for(asyncio.shield(fut), timeout)
+
+    async def close(self):
+        await self.call(self.osc.close)
+
+async def connect(factory, *args, **kwargs):
+    '''
+    Open an oscilloscope without blocking the event loop.
+
+    Args:
+        factory (callable): Creates the driver, e.g. `rigol1000z.Rigol1054z`.
+        *args: Passed on to `factory`.
+        executor (None, concurrent.futures.Executor): See `AsyncScope`.
+        timeout_s (None, float): See `AsyncScope`.
+        **kwargs: Passed on to `factory`.
+
+    Returns:
+        `AsyncScope`: The oscilloscope.
+    '''
+    executor = kwargs.pop('executor', None) or shared_executor()
+    timeout_s = kwargs.pop('timeout_s', None)
+    loop = asyncio.get_running_loop()
+    osc = await loop.run_in_executor(executor,
+                                     functools.partial(factory, *args, **kwargs))
+    return AsyncScope(osc, executor, timeout_s)
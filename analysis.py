@@ -0,0 +1,265 @@
+import concurrent.futures
+import numpy as np
+from waveform import TimeAxis
+
+# Quantities `analyze()` computes, named as in `measure.items`.
+amplitude_names = ('vmax', 'vmin', 'vpp', 'vtop', 'vbase', 'vamp', 'vavg',
+                   'vrms', 'vupper', 'vmid', 'vlower', 'variance',
+                   'overshoot', 'preshoot', 'area')
+timing_names = ('period', 'freq', 'rise_time', 'fall_time', 'pos_width',
+                'neg_width', 'pos_duty', 'neg_duty', 'tvmax', 'tvmin',
+                'pos_slew', 'neg_slew', 'pos_pulses', 'neg_pulses',
+                'pos_edges', 'neg_edges')
+names = amplitude_names + timing_names
+
+chunk_pts = 1 << 20
+
+def _chunks(codes, chunk):
+    for start in range(0, codes.size, chunk):
+        yield start, codes[start:start+chunk]
+
+def histogram(codes, chunk=chunk_pts):
+    '''
+    Number of occurrences of each of the 256 codes.
+
+    Args:
+        codes (numpy.ndarray): uint8 codes.
+        chunk (int): Points processed at a time.
+
+    Returns:
+        numpy.ndarray: int64 counts, 256 elements.
+    '''
+    counts = np.zeros(256, 'int64')
+    for _, c in _chunks(codes, chunk):
+        counts += np.bincount(c, minlength=256)
+    return counts
+
+def _code(volts, pre):
+    return volts / pre['yincrement'] + pre['yorigin'] + pre['yreference']
+
+def _levels(counts, lut):
+    # Amplitude quantities from the histogram and the lookup table.
+    nz = np.flatnonzero(counts)
+    if nz.size == 0:
+        # Nothing to measure, e.g. a zero length waveform.
+        return dict.fromkeys(amplitude_names, np.nan), None, None
+    cmin, cmax = nz[0], nz[-1]
+    split = (cmin + cmax) // 2 + 1
+    r = {}
+    n = counts.sum()
+    r['vmax'] = lut[cmax]
+    r['vmin'] = lut[cmin]
+    r['vpp'] = r['vmax'] - r['vmin']
+    r['vavg'] = counts @ lut / n
+    mean_sq = counts @ (lut*lut) / n
+    r['vrms'] = np.sqrt(mean_sq)
+    r['variance'] = max(mean_sq - r['vavg']**2, 0.)
+    r['vtop'] = lut[split + np.argmax(counts[split:])] if cmax >= split else r['vmax']
+    r['vbase'] = lut[np.argmax(counts[:split])]
+    r['vamp'] = r['vtop'] - r['vbase']
+    r['vupper'] = r['vbase'] + 0.9*r['vamp']
+    r['vmid'] = r['vbase'] + 0.5*r['vamp']
+    r['vlower'] = r['vbase'] + 0.1*r['vamp']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r['overshoot'] = 100 * (r['vmax'] - r['vtop']) / np.float64(r['vamp'])
+        r['preshoot'] = 100 * (r['vbase'] - r['vmin']) / np.float64(r['vamp'])
+    return r, cmin, cmax
+
+def _edges(codes, pre, r, cmin, cmax, chunk):
+    # One pass finding the mid level crossings, with a hysteresis of 5% of
+    # the amplitude, the time spent between the lower and upper levels
+    # while rising and falling, and the first maximum and minimum.
+    band = 0.05 * r['vamp']
+    lo = _code(r['vmid'] - band, pre)
+    hi = _code(r['vmid'] + band, pre)
+    all_codes = np.arange(256)
+    state_lut = np.where(all_codes > hi, 1, np.where(all_codes < lo, 0, -1))
+    state_lut = state_lut.astype('int8')
+    between_lut = (all_codes > _code(r['vlower'], pre)) & \
+                  (all_codes < _code(r['vupper'], pre))
+
+    rising, falling = [], []
+    up = down = 0
+    i_max = i_min = None
+    state = -1
+    prev = None
+    for start, c in _chunks(codes, chunk):
+        s = state_lut[c]
+        idx = np.where(s >= 0, np.arange(c.size), -1)
+        np.maximum.accumulate(idx, out=idx)
+        filled = np.where(idx >= 0, s[idx], state)
+        before = np.empty_like(filled)
+        before[0] = state
+        before[1:] = filled[:-1]
+        rising.append(np.flatnonzero((before == 0) & (filled == 1)) + start)
+        falling.append(np.flatnonzero((before == 1) & (filled == 0)) + start)
+        state = filled[-1]
+
+        # The slope of the first point of a chunk needs the last point of
+        # the previous one.
+        between = between_lut[c]
+        slope = np.diff(c.astype('int16'), prepend=c[0] if prev is None else prev)
+        up += np.count_nonzero(between & (slope > 0))
+        down += np.count_nonzero(between & (slope < 0))
+        prev = c[-1]
+
+        if i_max is None and c.max() == cmax:
+            i_max = start + int(np.argmax(c == cmax))
+        if i_min is None and c.min() == cmin:
+            i_min = start + int(np.argmax(c == cmin))
+    return np.concatenate(rising), np.concatenate(falling), up, down, i_max, i_min
+
+def analyze(waveform, names=names, chunk=chunk_pts):
+    '''
+    Measure a waveform from its 8-bit codes.
+
+    Amplitude quantities come from a histogram of the codes and a 256
+    entry lookup table, so the codes are never converted to volts.  Timing
+    quantities take a second pass, in chunks, detecting edges through a
+    lookup table of the code thresholds.  The definitions follow
+    `measure.items`: the top and base are the most common values above
+    and below the middle of the range; the upper, middle and lower levels
+    are 90%, 50% and 10% of the amplitude above the base; edges are
+    crossings of the middle level with a hysteresis of 5% of the
+    amplitude.
+
+    Args:
+        waveform (`waveform.Waveform`): The waveform.
+        names (list): Quantities to compute; see `names`.  Default is all.
+        chunk (int): Points processed at a time, bounding the temporary
+            memory for deep captures.  Default is 2^20.
+
+    Returns:
+        dict: The quantities by name; `nan` where not possible.
+    '''
+    codes = np.ravel(waveform.codes)
+    pre = waveform.preamble
+    lut = waveform.lut('float64')
+    dt = pre['xincrement']
+    t0 = pre['xorigin'] - pre['xreference']*dt
+
+    r, cmin, cmax = _levels(histogram(codes, chunk), lut)
+    r['area'] = r['vavg'] * codes.size * dt
+    if cmin is None:
+        r.update(dict.fromkeys(timing_names, np.nan))
+    elif any(name in timing_names for name in names):
+        r.update(_timing(codes, pre, r, cmin, cmax, chunk, dt, t0))
+    return {name: float(r[name]) for name in names}
+
+def _timing(codes, pre, r, cmin, cmax, chunk, dt, t0):
+    rising, falling, up, down, i_max, i_min = _edges(codes, pre, r, cmin,
+                                                     cmax, chunk)
+    t = {}
+    nan = float('nan')
+    t['tvmax'] = t0 + i_max*dt
+    t['tvmin'] = t0 + i_min*dt
+    t['pos_edges'] = rising.size
+    t['neg_edges'] = falling.size
+    t['pos_pulses'] = t['neg_pulses'] = min(rising.size, falling.size)
+
+    if rising.size > 1:
+        span = rising[-1] - rising[0]
+        t['period'] = span * dt / (rising.size - 1)
+        # Width of each whole pulse: from a rising edge to the next
+        # falling edge, if it comes before the next rising edge.
+        nxt = np.searchsorted(falling, rising[:-1])
+        valid = nxt < falling.size
+        f = falling[np.minimum(nxt, falling.size - 1)]
+        valid &= f < rising[1:]
+        widths = (f - rising[:-1])[valid]
+        t['pos_duty'] = 100. * widths.sum() / span if valid.all() else nan
+    else:
+        t['period'] = t['pos_duty'] = nan
+    t['freq'] = 1 / t['period']
+    t['neg_duty'] = 100 - t['pos_duty']
+    t['pos_width'] = t['pos_duty'] / 100 * t['period']
+    t['neg_width'] = t['neg_duty'] / 100 * t['period']
+
+    t['rise_time'] = up * dt / rising.size if rising.size else nan
+    t['fall_time'] = down * dt / falling.size if falling.size else nan
+    swing = r['vupper'] - r['vlower']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t['pos_slew'] = swing / np.float64(t['rise_time'])
+        t['neg_slew'] = -swing / np.float64(t['fall_time'])
+    return t
+
+def analyze_set(waveforms, names=names, chunk=chunk_pts, workers=None):
+    '''
+    Measure every channel of a `waveform.WaveformSet`, one channel per
+    thread.
+
+    NumPy releases the GIL in the bulk operations, so channels are
+    analysed in parallel.
+
+    Args:
+        waveforms (`waveform.WaveformSet`): The waveforms.
+        names (list): Quantities to compute; see `names`.
+        chunk (int): Points processed at a time.
+        workers (None, int): Threads.  Default is `None`; one per channel.
+
+    Returns:
+        numpy.ndarray: float64 values, shape `(channels, len(names))`.
+    '''
+    waveforms = list(waveforms)
+    with concurrent.futures.ThreadPoolExecutor(workers or len(waveforms)) as pool:
+        results = list(pool.map(lambda w: analyze(w, names, chunk), waveforms))
+    return np.array([[r[name] for name in names] for r in results],
+                    'float64').reshape(len(results), len(names))
+
+def envelope(waveform, bins=1000):
+    '''
+    Minimum and maximum of the waveform in each of `bins` equal spans.
+
+    Args:
+        waveform (`waveform.Waveform`): The waveform.
+        bins (int): Number of spans.  Default is 1000.
+
+    Returns:
+        3-tuple: The `TimeAxis` of the start of each span, and the minimum
+            and maximum volts of each span.
+    '''
+    codes = np.ravel(waveform.codes)
+    bins = min(bins, codes.size)
+    starts = (np.arange(bins) * codes.size) // bins
+    lut = waveform.lut()
+    lo = lut[np.minimum.reduceat(codes, starts)]
+    hi = lut[np.maximum.reduceat(codes, starts)]
+    t = TimeAxis.from_preamble(waveform.preamble, codes.size)
+    step = codes.size / bins
+    return TimeAxis(t.start, t.step*step, bins, t.dtype), lo, hi
+
+def spectrum(waveform, nfft=65536, window='hann'):
+    '''
+    One sided power spectral density, averaged over segments (Welch's
+    method without overlap).
+
+    Each segment is converted to float32 volts through the lookup table,
+    so memory is bounded by the segment length whatever the capture size.
+
+    Args:
+        waveform (`waveform.Waveform`): The waveform.
+        nfft (int): Points per segment.  Default is 65536, or the whole
+            waveform if shorter.
+        window (str, None): 'hann' or `None` for a rectangular window.
+
+    Returns:
+        2-tuple: Frequencies [Hz] and the power spectral density [V^2/Hz].
+    '''
+    codes = np.ravel(waveform.codes)
+    nfft = min(nfft, codes.size)
+    dt = waveform.preamble['xincrement']
+    lut = waveform.lut('float32')
+    w = np.hanning(nfft).astype('float32') if window == 'hann' else \
+        np.ones(nfft, 'float32')
+    scale = 1 / ((w*w).sum() / dt)
+
+    psd = np.zeros(nfft//2 + 1, 'float64')
+    segments = codes.size // nfft
+    for i in range(segments):
+        v = lut[codes[i*nfft:(i+1)*nfft]]
+        v -= v.mean()
+        v *= w
+        psd += np.abs(np.fft.rfft(v))**2
+    psd *= scale / segments
+    psd[1:-1 if nfft % 2 == 0 else None] *= 2
+    return np.fft.rfftfreq(nfft, dt), psd
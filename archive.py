@@ -0,0 +1,454 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import collections
+import numpy as np
+from waveform import Waveform, TimeAxis, WaveformSet
+from writers import Writer
+from profiles import read_profile
+
+_schema = '''
+create table if not exists acquisitions (
+    id integer primary key,
+    timestamp real not null,
+    serial text not null,
+    mode text not null,
+    settings text not null
+);
+create table if not exists captures (
+    id integer primary key,
+    acquisition integer not null references acquisitions(id),
+    channel integer not null,
+    points integer not null,
+    segment integer not null,
+    offset integer not null,
+    preamble text not null
+);
+create table if not exists settings (
+    acquisition integer not null references acquisitions(id),
+    key text not null,
+    value
+);
+create index if not exists acquisitions_time on acquisitions(timestamp);
+create index if not exists acquisitions_serial on acquisitions(serial, timestamp);
+create index if not exists captures_acquisition on captures(acquisition);
+create index if not exists captures_channel on captures(channel, acquisition);
+create index if not exists settings_key on settings(key, value, acquisition);
+'''
+
+Record = collections.namedtuple(
+    'Record',
+    'id acquisition timestamp serial channel mode points segment offset preamble')
+Record.__doc__ = '''
+One archived channel capture.
+
+Attributes:
+    id (int): Capture id.
+    acquisition (int): Id of the acquisition; the channels captured
+        together share it.
+    timestamp (float): `time.time()` of the acquisition.
+    serial (str): Serial number of the oscilloscope.
+    channel (int): Channel number.
+    mode (str): 'norm' or 'raw', or '' if unknown.
+    points (int): Number of points.
+    segment (int): Data segment holding the codes.
+    offset (int): Offset of the codes in the segment.
+    preamble (dict): The preamble.
+'''
+
+def flatten(settings):
+    '''
+    Flatten nested settings, e.g. from `Profile.to_dict()`, into dotted
+    keys such as 'channels.1.vertical_scale_V' or 'timebase.scale_s_div'.
+
+    Args:
+        settings (dict): The settings.
+
+    Returns:
+        dict: Dotted key to value.
+    '''
+    flat = {}
+    for key, value in settings.items():
+        if isinstance(value, dict):
+            for k, v in flatten(value).items():
+                flat['%s.%s' % (key, k)] = v
+        else:
+            flat[str(key)] = value
+    return flat
+
+class Archive(object):
+    '''
+    Append-only capture archive.
+
+    The 8-bit codes of every capture are appended to large data segment
+    files, `data-00000.bin` onwards, and never rewritten.  A SQLite index,
+    `index.sqlite`, holds each capture's preamble, oscilloscope serial,
+    timestamp and settings, so captures are found by time range, serial,
+    channel or any setting without reading any data.  Captures are read
+    back as `Waveform`s memory-mapped straight from their segment, so
+    looking at a capture costs nothing until its points are used, and
+    only the pages used are read.
+
+        with archive.Archive('captures') as a:
+            a.record(osc, mode='raw')
+            for r in a.find(start=time.time() - 86400, channels=[1],
+                            settings={'timebase.scale_s_div': 1e-3}):
+                t, v = a.load(r)
+
+    Codes are written before their index rows, so a crash can at worst
+    leave unreferenced bytes at the end of a segment.
+
+    Args:
+        directory (str): Directory of the archive; created if needed.
+        segment_bytes (int): Start a new segment once one reaches this
+            size.  Default is 4 GiB.
+        sync (bool): `fsync` each capture before indexing it.  Default is
+            `False`.
+    '''
+    index_name = 'index.sqlite'
+    segment_name = 'data-%05i.bin'
+    align = 64
+
+    def __init__(self, directory, segment_bytes=1 << 32, sync=False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.sync = sync
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._db = sqlite3.connect(os.path.join(directory, self.index_name),
+                                   check_same_thread=False)
+        self._db.execute('pragma journal_mode=wal')
+        self._db.executescript(_schema)
+        self._lock = threading.RLock()
+        self._maps = {}
+        segments = [int(f[5:10]) for f in os.listdir(directory)
+                    if f.startswith('data-') and f.endswith('.bin')]
+        self._segment = max(segments) if segments else 0
+
+    def _segment_file(self, segment):
+        return os.path.join(self.directory, self.segment_name % segment)
+
+    def _reserve(self, nbytes):
+        # The segment and offset the next capture is appended at.
+        filename = self._segment_file(self._segment)
+        size = os.path.getsize(filename) if os.path.exists(filename) else 0
+        offset = -(-size // self.align) * self.align
+        if offset and offset + nbytes > self.segment_bytes:
+            self._segment += 1
+            offset = 0
+        return self._segment, offset
+
+    def _append(self, segment, offset, blocks):
+        with open(self._segment_file(segment), 'ab') as fs:
+            pad = offset - fs.tell()
+            if pad:
+                fs.write(b'\0' * pad)
+            for codes in blocks:
+                fs.write(codes)
+            if self.sync:
+                fs.flush()
+                os.fsync(fs.fileno())
+
+    def _index(self, rows, serial, mode, settings, timestamp):
+        if timestamp is None:
+            timestamp = time.time()
+        settings = settings or {}
+        if hasattr(settings, 'to_dict'):
+            settings = settings.to_dict()
+        with self._db:
+            acquisition = self._db.execute(
+                'insert into acquisitions (timestamp, serial, mode, settings) '
+                'values (?, ?, ?, ?)',
+                (timestamp, serial, mode, json.dumps(settings))).lastrowid
+            self._db.executemany(
+                'insert into captures (acquisition, channel, points, segment, '
+                'offset, preamble) values (?, ?, ?, ?, ?, ?)',
+                [(acquisition, channel, points, segment, offset,
+                  json.dumps(preamble))
+                 for channel, points, segment, offset, preamble in rows])
+            self._db.executemany(
+                'insert into settings (acquisition, key, value) values (?, ?, ?)',
+                [(acquisition, k, v if isinstance(v, (int, float, str)) else
+                  json.dumps(v)) for k, v in flatten(settings).items()])
+        return acquisition
+
+    def add(self, result, channel=None, serial='', mode='', settings=None,
+            timestamp=None):
+        '''
+        Archive a downloaded capture.
+
+        Args:
+            result (`Waveform`, `WaveformSet`): The capture, e.g. from
+                `get_data()` or `get_data_multi()`.
+            channel (None, int): Channel number of a `Waveform`.
+            serial (str): Serial number of the oscilloscope.  Default is ''.
+            mode (str): 'norm' or 'raw'.  Default is ''.
+            settings (None, dict, `Profile`): Oscilloscope settings, e.g.
+                from `read_profile()`.  Default is `None`; none.
+            timestamp (None, float): `time.time()` of the acquisition.
+                Default is `None`; the frame's timestamp when given a
+                `stream.Frame`, else now.
+
+        Returns:
+            int: The acquisition id.
+        '''
+        if isinstance(result, WaveformSet):
+            channels = result.channels
+            waveforms = list(result)
+        else:
+            assert channel is not None, 'Give the channel of the waveform.'
+            channels, waveforms = [channel], [result]
+        if timestamp is None:
+            timestamp = getattr(result, 'timestamp', None)
+        codes = [np.ascontiguousarray(w.codes) for w in waveforms]
+
+        with self._lock:
+            # The channels are stored back to back, so an acquisition can
+            # be loaded as one 2-D array.
+            segment, offset = self._reserve(sum(c.size for c in codes))
+            self._append(segment, offset, codes)
+            rows = []
+            for c, w, data in zip(channels, waveforms, codes):
+                rows.append((c, data.size, segment, offset, w.preamble))
+                offset += data.size
+            return self._index(rows, serial, mode, settings, timestamp)
+
+    def writer(self, channel, serial='', mode='', settings=None,
+               timestamp=None):
+        '''
+        A sink for `get_data()` appending the capture to the archive as it
+        is downloaded, so deep captures need not be held in memory.
+
+            osc[1].get_data('raw', keep_data=False,
+                            sinks=[a.writer(1, serial)])
+
+        The archive is locked for other appends until the download ends.
+
+        Args:
+            channel (int): Channel number.
+            serial, mode, settings, timestamp: See `add()`.
+
+        Returns:
+            `ArchiveWriter`: The sink.
+        '''
+        return ArchiveWriter(self, channel, serial, mode, settings, timestamp)
+
+    def record(self, osc, channels=None, mode='norm', settings=True,
+               serial=None, timestamp=None):
+        '''
+        Download channels of the current acquisition and archive them.
+
+        Args:
+            osc: The oscilloscope.
+            channels (None, list): Channel numbers.  Default is `None`; all
+                enabled channels.
+            mode (str): 'norm' or 'raw'.  Default is 'norm'.
+            settings (bool, dict, `Profile`): Settings to store; `True`
+                reads them all with `read_profile()`.  Default is `True`.
+            serial (None, str): Serial number.  Default is `None`; from
+                `*IDN?`.
+            timestamp (None, float): See `add()`.
+
+        Returns:
+            int: The acquisition id.
+        '''
+        if timestamp is None:
+            timestamp = time.time()
+        ws = osc.get_data_multi(channels, mode)
+        if settings is True:
+            settings = read_profile(osc)
+        if serial is None:
+            idn = osc.get_id().split(',')
+            serial = idn[2].strip() if len(idn) > 2 else ''
+        return self.add(ws, serial=serial, mode=mode,
+                        settings=settings or None, timestamp=timestamp)
+
+    def find(self, start=None, stop=None, serial=None, channels=None,
+             settings=None, acquisition=None, limit=None):
+        '''
+        Look up captures in the index.
+
+        Args:
+            start (None, float): Earliest timestamp.
+            stop (None, float): Timestamp to stop before.
+            serial (None, str): Serial number.
+            channels (None, list): Channel numbers.
+            settings (None, dict): Dotted setting keys (see `flatten()`) to
+                the value required, or a `(low, high)` tuple for a range.
+            acquisition (None, int): Acquisition id.
+            limit (None, int): At most this many captures.
+
+        Returns:
+            list: `Record`s, in order of acquisition.
+        '''
+        where = []
+        args = []
+        if start is not None:
+            where.append('a.timestamp >= ?')
+            args.append(start)
+        if stop is not None:
+            where.append('a.timestamp < ?')
+            args.append(stop)
+        if serial is not None:
+            where.append('a.serial = ?')
+            args.append(serial)
+        if channels is not None:
+            channels = list(channels)
+            where.append('c.channel in (%s)' % ','.join('?' * len(channels)))
+            args.extend(channels)
+        if acquisition is not None:
+            where.append('a.id = ?')
+            args.append(acquisition)
+        for key, value in (settings or {}).items():
+            if isinstance(value, tuple):
+                where.append('a.id in (select acquisition from settings '
+                             'where key = ? and value between ? and ?)')
+                args.extend((key,) + value)
+            else:
+                where.append('a.id in (select acquisition from settings '
+                             'where key = ? and value = ?)')
+                args.extend((key, value))
+        query = ('select c.id, a.id, a.timestamp, a.serial, c.channel, a.mode, '
+                 'c.points, c.segment, c.offset, c.preamble '
+                 'from captures c join acquisitions a on c.acquisition = a.id')
+        if where:
+            query += ' where ' + ' and '.join(where)
+        query += ' order by a.timestamp, a.id, c.id'
+        if limit is not None:
+            query += ' limit %i' % limit
+        with self._lock:
+            rows = self._db.execute(query, args).fetchall()
+        return [Record(*(r[:9] + (json.loads(r[9]),))) for r in rows]
+
+    def settings(self, acquisition):
+        '''
+        Returns:
+            dict: The settings stored with an acquisition.
+        '''
+        with self._lock:
+            row = self._db.execute('select settings from acquisitions '
+                                   'where id = ?', (acquisition,)).fetchone()
+        assert row is not None, 'No acquisition %i.' % acquisition
+        return json.loads(row[0])
+
+    def _codes(self, segment, offset, points):
+        with self._lock:
+            mm = self._maps.get(segment)
+            if mm is None or mm.size < offset + points:
+                mm = np.memmap(self._segment_file(segment), 'B', 'r')
+                self._maps[segment] = mm
+        return mm[offset:offset+points]
+
+    def load(self, record, dtype='float64'):
+        '''
+        A capture, memory-mapped from its segment.
+
+        Args:
+            record (`Record`, int): The capture or its id.
+            dtype (str, numpy.dtype): Float type volts are returned as.
+                Default is 'float64'.
+
+        Returns:
+            2-tuple: The `TimeAxis` and the `Waveform`.
+        '''
+        if not isinstance(record, Record):
+            with self._lock:
+                row = self._db.execute('select acquisition from captures '
+                                       'where id = ?', (record,)).fetchone()
+            assert row is not None, 'No capture %i.' % record
+            record = [r for r in self.find(acquisition=row[0])
+                      if r.id == record][0]
+        codes = self._codes(record.segment, record.offset, record.points)
+        return (TimeAxis.from_preamble(record.preamble, record.points),
+                Waveform(codes, record.preamble, dtype))
+
+    def load_acquisition(self, acquisition, dtype='float64'):
+        '''
+        All channels of an acquisition, memory-mapped as one 2-D array.
+
+        Args:
+            acquisition (int): The acquisition id.
+            dtype (str, numpy.dtype): Float type volts are returned as.
+                Default is 'float64'.
+
+        Returns:
+            `WaveformSet`: The waveforms.
+        '''
+        records = self.find(acquisition=acquisition)
+        assert records, 'No acquisition %i.' % acquisition
+        first = records[0]
+        points = first.points
+        assert all(r.points == points for r in records), \
+            'Channels have different numbers of points.'
+        if all(r.segment == first.segment and
+               r.offset == first.offset + i*points
+               for i, r in enumerate(records)):
+            codes = self._codes(first.segment, first.offset,
+                                points*len(records)).reshape(len(records), points)
+        else:
+            codes = np.stack([self._codes(r.segment, r.offset, r.points)
+                              for r in records])
+        return WaveformSet([r.channel for r in records], codes,
+                           [r.preamble for r in records], dtype)
+
+    def close(self):
+        with self._lock:
+            self._maps.clear()
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ArchiveWriter(Writer):
+    '''
+    Appends a capture to an `Archive` block by block; see
+    `Archive.writer()`.
+    '''
+    def __init__(self, archive, channel, serial='', mode='', settings=None,
+                 timestamp=None):
+        Writer.__init__(self, archive.directory)
+        self.archive = archive
+        self.channel = channel
+        self.serial = serial
+        self.mode = mode
+        self.settings = settings
+        self.timestamp = timestamp
+        self.acquisition = None
+
+    def open(self, preamble, points):
+        Writer.open(self, preamble, points)
+        if self.timestamp is None:
+            self.timestamp = time.time()
+        a = self.archive
+        a._lock.acquire()
+        try:
+            self._segment, self._offset = a._reserve(points)
+            self._append = open(a._segment_file(self._segment), 'ab')
+            self._append.write(b'\0' * (self._offset - self._append.tell()))
+        except Exception:
+            a._lock.release()
+            raise
+
+    def write_block(self, start, codes):
+        self._append.write(codes)
+
+    def close(self):
+        a = self.archive
+        try:
+            written = self._append.tell() - self._offset
+            if a.sync:
+                self._append.flush()
+                os.fsync(self._append.fileno())
+            self._append.close()
+            if written == self.points:
+                self.acquisition = a._index(
+                    [(self.channel, self.points, self._segment, self._offset,
+                      self.preamble)],
+                    self.serial, self.mode, self.settings, self.timestamp)
+        finally:
+            a._lock.release()
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+from download import BlockDownloader
+
+def cache_dir():
+    '''
+    Directory autotuning results are cached in.
+
+    Returns:
+        str: `$XDG_CACHE_HOME/rigol`, or `~/.cache/rigol`.
+    '''
+    root = os.environ.get('XDG_CACHE_HOME',
+                          os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(root, 'rigol')
+
+class BlockSizeTuner(object):
+    '''
+    Finds the waveform block size giving the best download throughput.
+
+    Each candidate block size smaller than the raw memory of channel 1,
+    then the whole memory as one block, is downloaded a few times, from
+    small to large, until a block fails (e.g. with a USB timeout).
+    The fastest block size is chosen, preferring the larger of sizes within
+    5% of each other, and the transport timeout is set to a few times the
+    slowest block seen.  Results are cached per instrument serial, keyed
+    by model, firmware and transport, so tuning only runs once per setup.
+
+    Args:
+        osc: The oscilloscope.
+        candidates (list): Block sizes to try, in points.
+        repeats (int): Downloads per candidate.  Default is 2.
+        timeout_factor (float): The timeout is set to this many times the
+            slowest block.  Default is 3.
+        min_timeout_s (float): Lower bound of the timeout.  Default is 2s.
+        cache (bool): Read and write the cache.  Default is `True`.
+    '''
+    candidates = (125000, 250000, 500000, 1000000, 1800000, 2500000,
+                  5000000, 12000000)
+
+    def __init__(self, osc, candidates=None, repeats=2, timeout_factor=3.,
+                 min_timeout_s=2., cache=True):
+        self._osc = osc
+        if candidates is not None:
+            self.candidates = tuple(sorted(candidates))
+        self.repeats = repeats
+        self.timeout_factor = timeout_factor
+        self.min_timeout_s = min_timeout_s
+        self.cache = cache
+
+    def key(self):
+        '''
+        Identify the instrument, firmware and transport.
+
+        Returns:
+            2-tuple: The serial number and the cache key.
+        '''
+        idn = [s.strip() for s in self._osc.get_id().split(',')]
+        while len(idn) < 4:
+            idn.append('')
+        _, model, serial, firmware = idn[:4]
+        transport = getattr(self._osc, 'transport_name', type(self._osc).__name__)
+        return serial, '%s/%s/%s' % (model, firmware, transport)
+
+    def _cache_file(self, serial):
+        return os.path.join(cache_dir(), '%s.json' % (serial or 'unknown'))
+
+    def load(self):
+        '''
+        Returns:
+            None, dict: The cached result for this instrument, or `None`.
+        '''
+        serial, key = self.key()
+        try:
+            with open(self._cache_file(serial)) as fs:
+                return json.load(fs).get(key)
+        except (IOError, ValueError):
+            return None
+
+    def save(self, result):
+        serial, key = self.key()
+        filename = self._cache_file(serial)
+        try:
+            with open(filename) as fs:
+                results = json.load(fs)
+        except (IOError, ValueError):
+            results = {}
+        results[key] = result
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open(filename, 'w') as fs:
+            json.dump(results, fs, indent=2)
+
+    def _sizes(self, points):
+        # Candidates smaller than the capture, then the whole capture in
+        # one block, so there is always at least one.
+        sizes = [c for c in self.candidates if c < points]
+        if points <= max(self.candidates):
+            sizes.append(points)
+        return sizes
+
+    def measure(self):
+        '''
+        Measure the throughput of each candidate block size.
+
+        The waveform source, mode and range and the run state are restored
+        afterwards.
+
+        Returns:
+            list: `(block_pts, points_per_s, slowest_block_s)` for each
+                block size that downloaded without error.
+        '''
+        osc = self._osc
+        with osc.batch() as b:
+            saved = [b.ask(q) for q in (':trig:stat?', ':trig:swe?',
+                                        ':wav:sour?', ':wav:mode?',
+                                        ':wav:star?', ':wav:stop?')]
+        status, sweep, source, mode, start, stop = [d.value for d in saved]
+
+        results = []
+        try:
+            with osc.batch():
+                osc._write(':stop')
+                osc._write(':wav:sour chan1')
+                osc._write(':wav:mode raw')
+                osc._write(':wav:form byte')
+            points = osc[1].get_data_premable()['points']
+
+            for block_pts in self._sizes(points):
+                downloader = BlockDownloader(osc, block_pts, progress=False)
+                times = []
+                try:
+                    for _ in range(self.repeats):
+                        t0 = time.perf_counter()
+                        downloader.download(block_pts)
+                        times.append(time.perf_counter() - t0)
+                except Exception:
+                    # Drop what is left of the failed block's response.
+                    osc.transport.clear()
+                    break
+                results.append((block_pts, block_pts / min(times), max(times)))
+        finally:
+            with osc.batch():
+                osc._write(':wav:sour %s' % source)
+                osc._write(':wav:mode %s' % mode)
+                osc._write(':wav:star %s' % start)
+                osc._write(':wav:stop %s' % stop)
+                if status.upper() != 'STOP':
+                    osc._write(':sing' if sweep.upper().startswith('SING')
+                               else ':run')
+        return results
+
+    def tune(self, retune=False):
+        '''
+        Find, cache and apply the best block size and timeout.
+
+        Args:
+            retune (bool): Measure even if a cached result exists.
+                Default is `False`.
+
+        Returns:
+            dict: `block_pts`, `timeout_s` and `points_per_s`.
+        '''
+        result = None if retune or not self.cache else self.load()
+        if result is None:
+            results = self.measure()
+            if not results:
+                raise IOError('No block size downloaded successfully.')
+            best = max(r[1] for r in results)
+            block_pts, rate, _ = [r for r in results if r[1] >= 0.95*best][-1]
+            slowest = max(r[2] for r in results if r[0] <= block_pts)
+            result = {
+                'block_pts': block_pts,
+                'timeout_s': max(self.min_timeout_s, self.timeout_factor*slowest),
+                'points_per_s': rate,
+                'measured': time.time(),
+            }
+            if self.cache:
+                self.save(result)
+
+        self._osc.block_pts = result['block_pts']
+        self._osc.timeout_s = result['timeout_s']
+        return result
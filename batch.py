@@ -0,0 +1,174 @@
+import re
+
+def _is_query(cmd):
+    return cmd.strip().split(None, 1)[0].endswith('?')
+
+def _split(line, n):
+    # The responses to the `n` queries of one message.  Separators inside
+    # quoted strings are not split on.
+    if n == 1:
+        return [line]
+    parts = re.split(r';(?=(?:[^"]*"[^"]*")*[^"]*$)', line)
+    if len(parts) != n:
+        raise IOError('Expected %i responses, got %r.' % (n, line))
+    return parts
+
+class Deferred(object):
+    '''
+    The response to a query queued in a `Batch`, available once the batch
+    has been sent.
+    '''
+    def __init__(self, query):
+        self.query = query
+        self._value = None
+        self.done = False
+
+    @property
+    def value(self):
+        assert self.done, 'The batch has not been sent yet.'
+        return self._value
+
+    def _resolve(self, value):
+        self._value = value
+        self.done = True
+
+    def __repr__(self):
+        if self.done:
+            return 'Deferred(%r: %r)' % (self.query, self._value)
+        return 'Deferred(%r)' % self.query
+
+class Batch(object):
+    '''
+    Coalesces SCPI commands into semicolon separated messages.
+
+    While the batch is active, commands written to the instrument are
+    queued instead of sent.  A query, e.g. a setter reading its value
+    back, is sent together with the queued commands in one message and
+    answered straight away.  Queries queued with `ask()` are deferred:
+    they are sent with the commands when the batch ends and resolved from
+    the single combined response.
+
+    Use through `ScpiInstrument.batch()`:
+
+        with osc.batch() as b:
+            osc[1].set_coupling('dc')
+            osc.timebase.set_timebase_scale_s_div(1e-3)
+            scale = b.ask(':chan1:scal?')
+        scale.value
+
+    If the batch is disabled, or used outside a `with` block, commands are
+    sent one by one and `ask()` is answered straight away.
+
+    Args:
+        osc (`transport.ScpiInstrument`): The instrument.
+        max_length (int): Longest message sent, in characters.  Longer
+            batches are split into several messages.  Default is 500.
+        enabled (bool): Coalesce commands.  Default is `True`.
+    '''
+    def __init__(self, osc, max_length=500, enabled=True):
+        self._osc = osc
+        self.max_length = max_length
+        self.enabled = enabled
+        self._writes = []
+        self._queries = []
+        self._active = False
+
+    def __enter__(self):
+        if self.enabled and self._osc._batch is None:
+            self._osc._batch = self
+            self._active = True
+        return self._osc._batch
+
+    def __exit__(self, *exc):
+        if self._active:
+            try:
+                self.flush()
+            finally:
+                self._osc._batch = None
+                self._active = False
+
+    def ask(self, query):
+        '''
+        Queue a query whose response is needed only after the batch.
+
+        Args:
+            query (str): SCPI query.
+
+        Returns:
+            `Deferred`: Holds the response once the batch has been sent.
+        '''
+        d = Deferred(query)
+        cache = self._osc.cache
+        cached = cache.peek(query) if cache is not None else None
+        if cached is not None:
+            d._resolve(cached)
+        elif self._osc._batch is not self:
+            d._resolve(self._osc._ask(query))
+        else:
+            self._queries.append(d)
+        return d
+
+    def _groups(self, cmds):
+        # The commands sent in each message.
+        groups = []
+        length = 0
+        for cmd in cmds:
+            if groups and length + len(cmd) + 1 <= self.max_length:
+                groups[-1].append(cmd)
+                length += len(cmd) + 1
+            else:
+                groups.append([cmd])
+                length = len(cmd)
+        return groups
+
+    def _messages(self, cmds):
+        return [';'.join(g) for g in self._groups(cmds)]
+
+    def _write(self, cmd):
+        if not _is_query(cmd):
+            self._writes.append(cmd)
+            return None
+        if self._queries:
+            self.flush()
+        messages = self._messages(self._writes + [cmd])
+        self._writes = []
+        transport = self._osc.transport
+        for message in messages[:-1]:
+            transport.write(message)
+        return transport.write(messages[-1])
+
+    def flush(self):
+        '''
+        Send the queued commands and deferred queries now.
+        '''
+        osc = self._osc
+        writes, self._writes = self._writes, []
+        queries, self._queries = self._queries, []
+        if not writes and not queries:
+            return
+
+        groups = self._groups(writes + [d.query for d in queries])
+        for g in groups:
+            osc.transport.write(';'.join(g))
+        if not queries:
+            osc.completion.wait(writes[-1], osc.transport.write, osc._ask_nowait)
+            return
+
+        # Each message holding queries is answered by one line; only the
+        # separators between that message's own responses are split on.
+        counts = [n for n in (sum(map(_is_query, g)) for g in groups) if n]
+        lines = []
+        while len(lines) < len(counts):
+            lines += osc._read().split('\n')
+        responses = []
+        for line, n in zip(lines, counts):
+            responses += _split(line, n)
+        for d, r in zip(queries, responses):
+            r = r.strip()
+            d._resolve(r)
+            if osc.cache is not None:
+                osc.cache.store(d.query, r)
+
+    def __repr__(self):
+        return 'Batch(%i commands, %i queries queued)' % (len(self._writes),
+                                                         len(self._queries))
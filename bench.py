@@ -0,0 +1,262 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import numpy as np
+import simulator
+import analysis
+from waveform import Waveform
+from writers import writers, make_writer, h5py
+
+depths = (12000, 120000, 1200000, 12000000, 24000000)
+
+screenshot_types = ('png', 'jpeg', 'bmp8', 'bmp24', 'tiff')
+
+def _timed(func, *args, **kwargs):
+    t0 = time.perf_counter()
+    r = func(*args, **kwargs)
+    return time.perf_counter() - t0, r
+
+def _traced(func, *args, **kwargs):
+    # Tracing slows down allocations, so time a separate untraced run.
+    dt, r = _timed(func, *args, **kwargs)
+    del r
+    tracemalloc.start()
+    try:
+        r = func(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return dt, peak, r
+
+def bench_commands(osc, count=200):
+    '''
+    Commands per second through `_write` and `_ask`.
+
+    Args:
+        osc: The oscilloscope.
+        count (int): Number of commands of each kind.
+
+    Returns:
+        dict: `write_per_s` and `ask_per_s`.
+    '''
+    dt_write, _ = _timed(lambda: [osc._write(':tim:scal 1.0000e-03')
+                                  for _ in range(count)])
+    dt_ask, _ = _timed(lambda: [osc._ask(':tim:scal?') for _ in range(count)])
+    return {'write_per_s': count/dt_write, 'ask_per_s': count/dt_ask}
+
+def bench_get_data(osc, depths=depths):
+    '''
+    Download speed of `get_data()` in 'norm' mode and in 'raw' mode at
+    each memory depth.
+
+    Args:
+        osc: The oscilloscope, with only channel 1 enabled.
+        depths (list): Memory depths to benchmark 'raw' mode at.
+
+    Returns:
+        dict: `s`, `MB_per_s` and `points_per_s`, keyed by 'norm' and
+            'raw_<depth>'.
+    '''
+    results = {}
+    osc.run()
+    dt, (_, v) = _timed(osc[1].get_data, 'norm')
+    results['norm'] = _rates(dt, v.size)
+    for depth in depths:
+        osc.set_memory_depth(depth)
+        dt, (_, v) = _timed(osc[1].get_data, 'raw')
+        results['raw_%i' % depth] = _rates(dt, v.size)
+    osc.set_memory_depth('AUTO')
+    return results
+
+def _rates(dt, points):
+    return {'points': points, 's': dt, 'MB_per_s': points/dt/1e6,
+            'points_per_s': points/dt}
+
+def _waveform(points):
+    pre = {'format': 0, 'type': 1, 'points': points, 'count': 1,
+           'xincrement': 1e-9, 'xorigin': 0., 'xreference': 0.,
+           'yincrement': 0.04, 'yorigin': 0., 'yreference': 127.}
+    codes = np.random.default_rng(0).integers(0, 256, points, 'B')
+    return Waveform(codes, pre)
+
+def bench_conversion(points=12000000):
+    '''
+    Time and peak memory of converting codes to volts.
+
+    Compares the old `(codes - yorigin - yreference)*yincrement` with
+    `Waveform.volts()` as float64, float32 and into a preallocated buffer.
+
+    Args:
+        points (int): Number of points to convert.
+
+    Returns:
+        dict: `s` and `peak_bytes` per method.
+    '''
+    w = _waveform(points)
+    pre = w.preamble
+    results = {}
+
+    def legacy():
+        return (w.codes - pre['yorigin'] - pre['yreference']) * pre['yincrement']
+
+    out = np.empty(points, 'float32')
+    for name, func in (('legacy', legacy),
+                       ('float64', lambda: w.volts('float64')),
+                       ('float32', lambda: w.volts('float32')),
+                       ('float32_out', lambda: w.volts(out=out))):
+        dt, peak, _ = _traced(func)
+        results[name] = {'s': dt, 'peak_bytes': peak}
+    return results
+
+def bench_analysis(points=12000000):
+    '''
+    Time of measuring a waveform from its codes with `analysis.analyze()`.
+
+    Args:
+        points (int): Number of points.
+
+    Returns:
+        dict: `s` and `MB_per_s` for the amplitude quantities alone, for
+            all quantities, and for the spectrum.
+    '''
+    w = _waveform(points)
+    results = {}
+    for name, func in (
+            ('amplitude', lambda: analysis.analyze(w, analysis.amplitude_names)),
+            ('all', lambda: analysis.analyze(w)),
+            ('spectrum', lambda: analysis.spectrum(w))):
+        dt, _ = _timed(func)
+        results[name] = {'s': dt, 'MB_per_s': points/dt/1e6}
+    return results
+
+def bench_writers(points=1200000, directory=None):
+    '''
+    Time, peak memory and file size of each file writer.
+
+    Args:
+        points (int): Number of points to write.
+        directory (None, str): Where to write the files.  Default is `None`;
+            a temporary directory.
+
+    Returns:
+        dict: `s`, `peak_bytes`, `file_bytes` and `MB_per_s` per format.
+    '''
+    w = _waveform(points)
+    tmp = directory or tempfile.mkdtemp()
+    block = 250000
+    results = {}
+    try:
+        for fmt in writers:
+            if fmt == 'hdf5' and h5py is None:
+                continue
+            filename = os.path.join(tmp, 'bench.%s' % fmt)
+
+            def write():
+                writer = make_writer(filename, fmt)
+                writer.open(w.preamble, points)
+                for start in range(0, points, block):
+                    writer.write_block(start, w.codes[start:start+block])
+                writer.close()
+
+            dt, peak, _ = _traced(write)
+            size = sum(os.path.getsize(f) for f in (filename, filename + '.json')
+                       if os.path.exists(f))
+            results[fmt] = {'s': dt, 'peak_bytes': peak, 'file_bytes': size,
+                            'MB_per_s': points/dt/1e6}
+    finally:
+        if directory is None:
+            shutil.rmtree(tmp)
+    return results
+
+def bench_screenshots(osc, types=screenshot_types):
+    '''
+    Latency of downloading a screenshot in each image format.
+
+    Args:
+        osc: The oscilloscope.
+        types (list): Image formats.
+
+    Returns:
+        dict: Seconds per image format.
+    '''
+    tmp = tempfile.mkdtemp()
+    results = {}
+    try:
+        for t in types:
+            filename = os.path.join(tmp, 'screenshot.%s' % t)
+            if osc.transport.scope.model.startswith('DS2'):
+                dt, _ = _timed(osc.get_screenshot, filename)
+            else:
+                dt, _ = _timed(osc.get_screenshot, filename, t)
+            results[t] = dt
+    finally:
+        shutil.rmtree(tmp)
+    return results
+
+def run(model='DS1054Z', latency_s=0.5e-3, bytes_per_s=1e6, depths=depths,
+        completion='opc'):
+    '''
+    Run all benchmarks against a simulated oscilloscope.
+
+    Args:
+        model (str): Simulated model.
+        latency_s (float): Simulated latency of each transfer.
+        bytes_per_s (float): Simulated transfer rate.
+        depths (list): Memory depths to benchmark 'raw' downloads at.
+        completion (str): Completion mode of the driver.
+
+    Returns:
+        dict: The benchmark results and the conditions they ran under.
+    '''
+    osc = simulator.connect(model, latency_s, bytes_per_s, completion=completion)
+    osc.progress = False
+    max_depth = osc.transport.scope.limits['max_mdep']
+    depths = [d for d in depths if d <= max_depth]
+    screenshot = ('bmp',) if model.startswith('DS2') else screenshot_types
+    return {
+        'meta': {
+            'time': time.time(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'model': model,
+            'latency_s': latency_s,
+            'bytes_per_s': bytes_per_s,
+            'completion': completion,
+        },
+        'commands': bench_commands(osc),
+        'get_data': bench_get_data(osc, depths),
+        'conversion': bench_conversion(),
+        'analysis': bench_analysis(),
+        'writers': bench_writers(),
+        'screenshots': bench_screenshots(osc, screenshot),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the Rigol drivers against a simulated oscilloscope.')
+    parser.add_argument('--model', default='DS1054Z')
+    parser.add_argument('--latency-s', type=float, default=0.5e-3)
+    parser.add_argument('--bytes-per-s', type=float, default=1e6)
+    parser.add_argument('--completion', default='opc')
+    parser.add_argument('--depths', type=int, nargs='+', default=list(depths))
+    parser.add_argument('--json', help='Write the results to this file.')
+    args = parser.parse_args(argv)
+
+    results = run(args.model, args.latency_s, args.bytes_per_s, args.depths,
+                  args.completion)
+    text = json.dumps(results, indent=2)
+    if args.json:
+        with open(args.json, 'w') as fs:
+            fs.write(text)
+    else:
+        sys.stdout.write(text + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+import time
+
+# Settings that can be served from the cache.  Everything else, e.g.
+# `:trig:stat?`, `:wav:data?` or `:meas:item?`, always goes to the
+# oscilloscope.
+cacheable = (':chan', ':tim:', ':trig:edg:lev', ':trig:hold', ':acq:aver',
+             ':acq:type', ':acq:mdep', ':meas:sour')
+
+# Commands after which no cached setting can be trusted.
+invalidating = ('*rst', '*rcl', ':aut', ':clear', ':syst:pres')
+
+# Settings the oscilloscope changes itself when another setting is written.
+dependants = {
+    ':rang': (':scal',),
+    ':scal': (':rang',),
+    ':prob': (':scal', ':rang', ':off'),
+    ':unit': (),
+}
+
+def settings_queries(channels):
+    '''
+    The settings queries `refresh()` reads.
+
+    Args:
+        channels (int): Number of channels.
+
+    Returns:
+        list: SCPI queries.
+    '''
+    queries = []
+    for c in range(1, channels+1):
+        queries += [':chan%i%s?' % (c, s) for s in
+                    (':disp', ':coup', ':off', ':scal', ':rang', ':prob', ':unit')]
+    queries += [':tim:scal?', ':tim:mode?', ':tim:offs?', ':trig:edg:lev?',
+                ':trig:hold?', ':acq:aver?', ':acq:type?', ':acq:mdep?']
+    return queries
+
+def changes_settings(cmd):
+    '''
+    Whether writing a command changes the oscilloscope's settings, and so
+    possibly the waveform preamble.
+
+    Args:
+        cmd (str): SCPI command.
+
+    Returns:
+        bool: `True` for settings writes, autoscale, clear and reset.
+    '''
+    header = cmd.strip().split(None, 1)[0].lower()
+    if header.endswith('?'):
+        return False
+    return header.startswith(invalidating) or SettingsCache.key(cmd) is not None
+
+class SettingsCache(object):
+    '''
+    Remembers the last known settings of an oscilloscope.
+
+    Settings queries are answered from the cache once they have been read
+    or written.  Writes go through to the oscilloscope and update the
+    cache with the written value; settings the oscilloscope derives from
+    the written one are forgotten.  Autoscale, clear and reset forget
+    everything.
+
+    Somebody at the front panel can change settings behind the cache's
+    back.  Unless the front panel is locked (`:syst:lock`), entries are
+    only trusted for `ttl_s`.
+
+    Args:
+        ttl_s (None, float): Seconds a cached setting is trusted while the
+            front panel is unlocked.  Default is `None`; forever.
+        lock_check_s (float): Seconds between checks of the front panel
+            lock.  Default is 5s.
+    '''
+    def __init__(self, ttl_s=None, lock_check_s=5.):
+        self.ttl_s = ttl_s
+        self.lock_check_s = lock_check_s
+        self._values = {}
+        self._locked = False
+        self._lock_checked = -float('inf')
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(cmd):
+        '''
+        Cache key of a command or query, or `None` if it is not cacheable.
+        '''
+        header = cmd.strip().split(None, 1)[0].lower().rstrip('?')
+        if header.startswith(cacheable):
+            return header
+        return None
+
+    def _fresh(self, stored, ask):
+        if self.ttl_s is None or time.time() - stored < self.ttl_s:
+            return True
+        if time.time() - self._lock_checked > self.lock_check_s:
+            try:
+                self._locked = bool(int(ask(':syst:lock?')))
+            except ValueError:
+                self._locked = False
+            self._lock_checked = time.time()
+        return self._locked
+
+    def get(self, query, ask):
+        '''
+        Answer a query from the cache, asking the oscilloscope on a miss.
+
+        Args:
+            query (str): SCPI query.
+            ask (callable): Asks the oscilloscope a query.
+
+        Returns:
+            str: The response.
+        '''
+        key = self.key(query)
+        if key is None:
+            return ask(query)
+        entry = self._values.get(key)
+        if entry is not None and self._fresh(entry[1], ask):
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        value = ask(query)
+        self._values[key] = (value, time.time())
+        return value
+
+    def peek(self, query):
+        '''
+        The cached response to a query, without asking the oscilloscope.
+
+        Args:
+            query (str): SCPI query.
+
+        Returns:
+            None, str: The response, or `None` if it is not cached or has
+                expired.
+        '''
+        key = self.key(query)
+        entry = self._values.get(key) if key is not None else None
+        if entry is None:
+            return None
+        if self.ttl_s is not None and time.time() - entry[1] >= self.ttl_s \
+                and not self._locked:
+            return None
+        return entry[0]
+
+    def store(self, query, value):
+        key = self.key(query)
+        if key is not None:
+            self._values[key] = (value, time.time())
+
+    def write(self, cmd):
+        '''
+        Update the cache for a command being written.
+
+        Args:
+            cmd (str): SCPI command.
+        '''
+        parts = cmd.strip().split(None, 1)
+        header = parts[0].lower()
+        if header.startswith(invalidating):
+            self.invalidate()
+            return
+        key = self.key(cmd)
+        if key is None or header.endswith('?'):
+            return
+        for suffix, others in dependants.items():
+            if key.endswith(suffix):
+                base = key[:-len(suffix)]
+                for other in others:
+                    self._values.pop(base + other, None)
+        if len(parts) < 2:
+            self._values.pop(key, None)
+            return
+        value = parts[1].strip()
+        try:
+            float(value)
+        except ValueError:
+            value = value.upper()
+        self._values[key] = (value, time.time())
+
+    def invalidate(self, prefix=''):
+        '''
+        Forget cached settings.
+
+        Args:
+            prefix (str): Only forget settings starting with this, e.g.
+                ':chan2'.  Default is '', everything.
+        '''
+        prefix = prefix.lower()
+        for key in [k for k in self._values if k.startswith(prefix)]:
+            del self._values[key]
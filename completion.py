@@ -0,0 +1,159 @@
+import time
+
+class Completion(object):
+    '''
+    Waits for the oscilloscope to finish processing a command.
+
+    Instead of sleeping a fixed time after every command, the oscilloscope
+    can be asked whether it has finished with `*OPC?` (or by polling the
+    operation complete bit of `*ESR?`), or a delay can be learnt for each
+    command verb from a few `*OPC?` round trips and reused afterwards.
+
+    Queries never wait: the response to a query can only be read once the
+    oscilloscope has processed it.
+
+    Args:
+        mode (str): 'opc' to ask `*OPC?` after every command, 'esr' to send
+            `*OPC` and poll `*ESR?`, 'adaptive' to learn a delay for each
+            command verb, 'sleep' to always sleep `delay_s` (the old
+            behaviour) or 'none' to never wait.  Default is 'opc'.
+        delay_s (float): Delay used by 'sleep' mode.  Default is 0.3s.
+        learn_count (int): Number of `*OPC?` round trips used to learn the
+            delay of a command verb in 'adaptive' mode.  Default is 3.
+        margin (float): Factor the learnt delays are multiplied by.
+            Default is 1.5.
+        poll_s (float): Initial interval between `*ESR?` polls in 'esr'
+            mode.  The interval doubles up to 50ms.  Default is 1ms.
+    '''
+    modes = ('opc', 'esr', 'adaptive', 'sleep', 'none')
+
+    def __init__(self, mode='opc', delay_s=0.3, learn_count=3, margin=1.5,
+                 poll_s=1e-3):
+        assert mode in self.modes, 'Not a valid completion mode.'
+        self.mode = mode
+        self.delay_s = delay_s
+        self.learn_count = learn_count
+        self.margin = margin
+        self.poll_s = poll_s
+        self.delays = {}
+        self._samples = {}
+
+    @staticmethod
+    def verb(cmd):
+        '''
+        The header of a SCPI command, without its arguments.
+
+        Args:
+            cmd (str): SCPI command.
+
+        Returns:
+            str: Lower case command header, e.g. ':wav:star'.
+        '''
+        parts = cmd.strip().split(None, 1)
+        return parts[0].lower() if parts else ''
+
+    def wait(self, cmd, write, ask):
+        '''
+        Block until the oscilloscope has processed `cmd`.
+
+        Args:
+            cmd (str): The command that has just been written.
+            write (callable): Writes a command without waiting.
+            ask (callable): Writes a query and returns the response.
+        '''
+        verb = self.verb(cmd)
+        if self.mode == 'none' or verb.endswith('?'):
+            return
+
+        if self.mode == 'sleep':
+            time.sleep(self.delay_s)
+        elif self.mode == 'opc':
+            ask('*OPC?')
+        elif self.mode == 'esr':
+            self._wait_esr(write, ask)
+        elif verb in self.delays:
+            time.sleep(self.delays[verb])
+        else:
+            t0 = time.perf_counter()
+            ask('*OPC?')
+            dt = time.perf_counter() - t0
+            samples = self._samples.setdefault(verb, [])
+            samples.append(dt)
+            if len(samples) >= self.learn_count:
+                self.delays[verb] = max(samples) * self.margin
+                del self._samples[verb]
+
+    def _wait_esr(self, write, ask):
+        write('*OPC')
+        interval = self.poll_s
+        while not int(ask('*ESR?')) & 1:
+            time.sleep(interval)
+            interval = min(2*interval, 50e-3)
+
+    def forget(self, verb=None):
+        '''
+        Discard learnt delays, e.g. after a firmware update.
+
+        Args:
+            verb (None, str): Command verb to forget.  Default is `None`;
+                all learnt delays are discarded.
+        '''
+        if verb is None:
+            self.delays.clear()
+            self._samples.clear()
+        else:
+            self.delays.pop(verb, None)
+            self._samples.pop(verb, None)
+
+def wait_for_trigger(ask, timeout_s=None, poll_s=1e-3, max_poll_s=50e-3,
+                     cancelled=None):
+    '''
+    Block until a single shot acquisition has triggered and finished.
+
+    Polls `:trig:stat?` until it reads 'STOP'.  The single shot must have
+    been processed before, as `set_single_shot()` of the drivers ensures,
+    else the 'STOP' of the previous capture is taken for the new one.  The
+    interval between polls starts at `poll_s`, so fast triggers are noticed
+    quickly, and doubles up to `max_poll_s`, so waiting for a rare event
+    does not flood the bus.
+
+    Args:
+        ask (callable): Writes a query and returns the response.
+        timeout_s (None, float): Seconds to wait.  Default is `None`;
+            forever.
+        poll_s (float): Initial interval between polls.  Default is 1ms.
+        max_poll_s (float): Longest interval between polls.  Default is
+            50ms.
+        cancelled (None, callable): Stop waiting when it returns `True`.
+
+    Returns:
+        bool: `True` if the acquisition finished, `False` on timeout or
+            cancellation.
+    '''
+    t_end = None if timeout_s is None else time.perf_counter() + timeout_s
+    interval = poll_s
+    while ask(':trig:stat?') != 'STOP':
+        if cancelled is not None and cancelled():
+            return False
+        if t_end is not None:
+            remaining = t_end - time.perf_counter()
+            if remaining <= 0:
+                return False
+            interval = min(interval, remaining)
+        time.sleep(interval)
+        interval = min(2*interval, max_poll_s)
+    return True
+
+def make_completion(completion):
+    '''
+    Build a `Completion` from a mode name, or pass an instance through.
+
+    Args:
+        completion (str, Completion): Completion mode or object.
+
+    Returns:
+        Completion: The completion object.
+    '''
+    if isinstance(completion, Completion):
+        return completion
+    return Completion(completion)
@@ -0,0 +1,231 @@
+import numpy as np
+from waveform import Waveform, TimeAxis
+
+class Decimator(object):
+    '''
+    Reduces a waveform block by block as it is downloaded.
+
+    Decimators are sinks for `get_data()` (and `download.BlockDownloader`)
+    like the file writers: `open()` is called with the preamble,
+    `write_block()` with each block in order and `close()` at the end.
+    The points are split into buckets of `factor` consecutive points and
+    each bucket is reduced to one output point (two for `MinMax`), so only
+    the output and one partial bucket are held, never the whole capture.
+
+    The outputs are preallocated when the download starts and `count`
+    buckets are filled so far, so e.g. a dashboard thread can show the
+    reduced view while the capture is still downloading.
+
+        d = decimate.MinMax(2000)
+        osc[1].get_data('raw', sinks=[d], keep_data=False)
+        t, (lo, hi) = d.t, d.volts()
+
+    Args:
+        points (None, int): Number of output points.  Default is `None`;
+            `factor` is used.
+        factor (None, int): Points per bucket.  Give either `points` or
+            `factor`.
+
+    Attributes:
+        count (int): Number of buckets reduced so far.
+    '''
+    def __init__(self, points=None, factor=None):
+        assert (points is None) != (factor is None), \
+            'Give either the number of points or the factor.'
+        self.out_points = points
+        self.factor = factor
+        self.count = 0
+
+    def open(self, preamble, points):
+        self.preamble = preamble
+        self.points = points
+        if self.out_points is not None:
+            self.factor = max(1, -(-points // self.out_points))
+        self.buckets = -(-points // self.factor)
+        self.count = 0
+        self._carry = np.empty(0, 'B')
+        self._allocate(self.buckets)
+
+    def write_block(self, start, codes):
+        if self._carry.size:
+            codes = np.concatenate((self._carry, codes))
+        full = codes.size // self.factor
+        if full:
+            self._reduce(codes[:full*self.factor].reshape(full, self.factor))
+        self._carry = codes[full*self.factor:].copy()
+
+    def close(self):
+        if self._carry.size:
+            self._reduce_tail(self._carry)
+            self._carry = np.empty(0, 'B')
+
+    def _allocate(self, buckets):
+        raise NotImplementedError
+
+    def _reduce(self, buckets):
+        raise NotImplementedError
+
+    def _reduce_tail(self, codes):
+        # The last, shorter bucket.
+        self._reduce(codes[None, :])
+
+    @property
+    def t(self):
+        '''
+        `TimeAxis` of the start of each bucket.
+        '''
+        t = TimeAxis.from_preamble(self.preamble, self.points)
+        return TimeAxis(t.start, t.step*self.factor, self.count, t.dtype)
+
+    def _lut(self):
+        return Waveform(None, self.preamble).lut()
+
+class Stride(Decimator):
+    '''
+    Keeps the first point of every bucket.  The cheapest reduction, but
+    aliases signals faster than the output rate.
+    '''
+    def _allocate(self, buckets):
+        self.codes = np.empty(buckets, 'B')
+
+    def _reduce(self, buckets):
+        n = len(buckets)
+        self.codes[self.count:self.count+n] = buckets[:, 0]
+        self.count += n
+
+    def volts(self):
+        return self._lut()[self.codes[:self.count]]
+
+class Mean(Decimator):
+    '''
+    Averages every bucket, a boxcar filter that lowers the noise.  The
+    time axis is at the middle of each bucket.
+    '''
+    def _allocate(self, buckets):
+        self.means = np.empty(buckets, 'float64')
+
+    def _reduce(self, buckets):
+        n = len(buckets)
+        sums = buckets.sum(1, dtype='uint64')
+        self.means[self.count:self.count+n] = sums / buckets.shape[1]
+        self.count += n
+
+    @property
+    def t(self):
+        t = Decimator.t.fget(self)
+        return TimeAxis(t.start + 0.5*(self.factor-1)*t.step/self.factor,
+                        t.step, t.count, t.dtype)
+
+    def volts(self):
+        pre = self.preamble
+        v = self.means[:self.count] - (pre['yorigin'] + pre['yreference'])
+        return v * pre['yincrement']
+
+class MinMax(Decimator):
+    '''
+    Minimum and maximum of every bucket, the envelope that keeps every
+    peak and glitch however deep the capture.
+    '''
+    def _allocate(self, buckets):
+        self.lo = np.empty(buckets, 'B')
+        self.hi = np.empty(buckets, 'B')
+
+    def _reduce(self, buckets):
+        n = len(buckets)
+        buckets.min(1, out=self.lo[self.count:self.count+n])
+        buckets.max(1, out=self.hi[self.count:self.count+n])
+        self.count += n
+
+    def volts(self):
+        '''
+        Returns:
+            2-tuple: The minimum and the maximum volts of each bucket.
+        '''
+        lut = self._lut()
+        return lut[self.lo[:self.count]], lut[self.hi[:self.count]]
+
+class Lttb(Decimator):
+    '''
+    Largest-Triangle-Three-Buckets: keeps the point of each bucket that
+    forms the largest triangle with the point kept from the previous
+    bucket and the mean of the next bucket.  Preserves the visual shape
+    of the waveform better than a stride or a mean.
+
+    The choice in each bucket needs the mean of the next one, so one
+    bucket is held back until the next has arrived.  The first and last
+    points are always kept.
+    '''
+    def _allocate(self, buckets):
+        self.index = np.empty(buckets, 'int64')
+        self.codes = np.empty(buckets, 'B')
+        self._pending = None
+        self._pending_start = 0
+        self._prev = None
+        self._next_start = 0
+
+    def _reduce(self, buckets):
+        for bucket in buckets:
+            start = self._next_start
+            self._next_start += bucket.size
+            if self._pending is not None:
+                self._select(start + (bucket.size-1)/2., bucket.mean())
+            self._pending = bucket.copy()
+            self._pending_start = start
+
+    def _select(self, x_next, y_next):
+        codes = self._pending
+        if self._prev is None:
+            i = 0
+        else:
+            x_prev, y_prev = self._prev
+            x = self._pending_start + np.arange(codes.size)
+            area = np.abs((x_prev - x_next) * (codes - y_prev) -
+                          (x_prev - x) * (y_next - y_prev))
+            i = int(np.argmax(area))
+        self.index[self.count] = self._pending_start + i
+        self.codes[self.count] = codes[i]
+        self._prev = (self._pending_start + i, float(codes[i]))
+        self.count += 1
+
+    def close(self):
+        Decimator.close(self)
+        if self._pending is not None:
+            # The last bucket keeps its last point.
+            i = self._pending.size - 1
+            self.index[self.count] = self._pending_start + i
+            self.codes[self.count] = self._pending[i]
+            self.count += 1
+            self._pending = None
+
+    @property
+    def t(self):
+        '''
+        Times of the kept points; unevenly spaced.
+        '''
+        t = TimeAxis.from_preamble(self.preamble, self.points)
+        return t.start + self.index[:self.count] * t.step
+
+    def volts(self):
+        return self._lut()[self.codes[:self.count]]
+
+decimators = {
+    'stride': Stride,
+    'mean': Mean,
+    'minmax': MinMax,
+    'lttb': Lttb,
+}
+
+def make_decimator(method, points=None, factor=None):
+    '''
+    Build a decimator by name.
+
+    Args:
+        method (str): 'stride', 'mean', 'minmax' or 'lttb'.
+        points (None, int): Number of output points.
+        factor (None, int): Points per bucket.
+
+    Returns:
+        `Decimator`: The decimator.
+    '''
+    assert method in decimators, 'Not a valid decimation method.'
+    return decimators[method](points, factor)
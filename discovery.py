@@ -0,0 +1,168 @@
+import os
+import re
+import threading
+import collections
+
+root_usb = '/sys/bus/usb/devices/'
+root_usbtmc = '/sys/bus/usb/drivers/usbtmc/'
+
+# Model family of each known (vid, pid).
+models = {
+    ('0x1ab1', '0x04ce'): 'DS1000Z',
+    ('0x1ab1', '0x04b0'): 'DS2000A',
+}
+
+Device = collections.namedtuple('Device', 'vid pid serial usbtmc path model')
+Device.__doc__ = '''
+A USBTMC instrument.
+
+Attributes:
+    vid (str): USB vendor id, e.g. '0x1ab1'.
+    pid (str): USB product id, e.g. '0x04ce'.
+    serial (str): Serial number.
+    usbtmc (str): Kernel device name, e.g. 'usbtmc0' for `/dev/usbtmc0`.
+    path (str): USB bus path, e.g. '1-1.2'.
+    model (None, str): Model family from `models`, or `None` if unknown.
+'''
+
+_interface = re.compile(r'(\d+-[\d.]+):\d+\.\d+$')
+
+class _Cache(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.listing = None
+        self.devices = {}
+        self.by_serial = {}
+        self.by_model = {}
+
+_cache = _Cache()
+
+def _read(path):
+    with open(path) as fs:
+        return fs.read().strip()
+
+def _probe(path, interface):
+    base = root_usb + path + '/'
+    vid = '0x' + _read(base + 'idVendor')
+    pid = '0x' + _read(base + 'idProduct')
+    try:
+        serial = _read(base + 'serial')
+    except OSError:
+        serial = ''
+    usbtmc = os.listdir(root_usbtmc + interface + '/usbmisc')[0]
+    return Device(vid, pid, serial, usbtmc, path, models.get((vid, pid)))
+
+def devices(refresh=False):
+    '''
+    All instruments bound to the kernel USBTMC driver.
+
+    The driver's directory is listed on every call, which is cheap; the
+    sysfs attributes of a device are only read when it first appears, so
+    results stay cached until an instrument is plugged in or removed.
+
+    Args:
+        refresh (bool): Read every device again.  Default is `False`.
+
+    Returns:
+        list: `Device`s, ordered by bus path.
+    '''
+    return list(_snapshot(refresh)[0].values())
+
+def _snapshot(refresh=False):
+    # The devices and their lookup maps, taken together under the lock so
+    # they always belong to the same listing.
+    try:
+        listing = sorted(e for e in os.listdir(root_usbtmc) if _interface.match(e))
+    except OSError:
+        listing = []
+
+    c = _cache
+    with c.lock:
+        if refresh or listing != c.listing:
+            found = {}
+            for interface in listing:
+                path = _interface.match(interface).group(1)
+                dev = None if refresh else c.devices.get(path)
+                if dev is None:
+                    try:
+                        dev = _probe(path, interface)
+                    except OSError:
+                        # Unplugged while being read.
+                        continue
+                found[path] = dev
+            by_model = {}
+            for d in found.values():
+                by_model.setdefault(d.model, []).append(d)
+            c.devices = found
+            c.by_serial = {d.serial: d for d in found.values()}
+            c.by_model = by_model
+            c.listing = listing
+        return c.devices, c.by_serial, c.by_model
+
+def invalidate():
+    '''
+    Forget the cached devices, e.g. after re-binding the USBTMC driver.
+    '''
+    with _cache.lock:
+        _cache.listing = None
+        _cache.devices = {}
+        _cache.by_serial = {}
+        _cache.by_model = {}
+
+def find(serial=None, model=None, vid=None, pid=None):
+    '''
+    Instruments matching all the given criteria.
+
+    Lookups by serial number and by model are dictionary lookups.
+
+    Args:
+        serial (None, str): Serial number.
+        model (None, str): Model family, e.g. 'DS1000Z'.
+        vid (None, str): USB vendor id, e.g. '0x1ab1'.
+        pid (None, str): USB product id, e.g. '0x04ce'.
+
+    Returns:
+        list: Matching `Device`s.
+    '''
+    found, by_serial, by_model = _snapshot()
+    if serial is not None:
+        dev = by_serial.get(serial)
+        matches = [] if dev is None else [dev]
+    elif model is not None:
+        matches = list(by_model.get(model, []))
+    else:
+        matches = list(found.values())
+    return [d for d in matches
+            if (model is None or d.model == model) and
+               (vid is None or d.vid == vid) and
+               (pid is None or d.pid == pid)]
+
+def find_one(serial=None, model=None, vid=None, pid=None):
+    '''
+    The first instrument matching the criteria; see `find()`.
+
+    Returns:
+        `Device`: The instrument.
+    '''
+    matches = find(serial, model, vid, pid)
+    assert matches, 'No instrument found matching %s.' % ', '.join(
+        '%s=%s' % (k, v) for k, v in (('serial', serial), ('model', model),
+                                      ('vid', vid), ('pid', pid))
+        if v is not None)
+    return matches[0]
+
+def wake(device):
+    '''
+    Send `*IDN?` through the kernel USBTMC driver.
+
+    After a reboot, some oscilloscopes only answer python-usbtmc once a
+    command has been sent through the kernel driver.
+
+    Args:
+        device (`Device`): The instrument.
+    '''
+    fd = os.open('/dev/' + device.usbtmc, os.O_WRONLY)
+    try:
+        os.write(fd, b'*IDN?\n')
+    finally:
+        os.close(fd)
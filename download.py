@@ -0,0 +1,236 @@
+import threading
+import queue
+import numpy as np
+import tqdm
+import shm
+
+def parse_block_header(data):
+    '''
+    Parse the header of an IEEE 488.2 definite length block.
+
+    Blocks returned by e.g. `:wav:data?` start with `#N` followed by `N`
+    digits giving the number of data bytes, e.g. `#9000001200`.
+
+    Args:
+        data (bytes): At least the first 11 bytes of the block.
+
+    Returns:
+        2-tuple: The length of the header and the number of data bytes.
+    '''
+    assert data[:1] == b'#', 'Not a definite length block.'
+    n = int(data[1:2])
+    return 2 + n, int(data[2:2+n])
+
+def _header_missing(raw):
+    # Bytes of the block header not read yet.
+    if len(raw) < 2:
+        return 2 - len(raw)
+    assert raw[:1] == b'#', 'Not a definite length block.'
+    return max(0, 2 + int(raw[1:2]) - len(raw))
+
+def read_block(ask_raw, read_raw, cmd, num_bytes=-1):
+    '''
+    Send a query and read back the whole definite length block.
+
+    If the transport returns fewer bytes than the header announces, or
+    only part of the header, the remainder is read until the block is
+    complete.
+
+    Args:
+        ask_raw (callable): Sends a query and returns the raw response.
+        read_raw (callable): Reads more raw bytes.
+        cmd (str): The query, e.g. ':wav:data?'.
+        num_bytes (int): Number of bytes to ask the transport for on the
+            first read.  Default is -1; the transport decides.
+
+    Returns:
+        2-tuple: The raw response and the offset of the data within it.
+            The data is `raw[offset:offset+length]`.
+    '''
+    raw = ask_raw(cmd, num_bytes)
+    # The header itself can be split over several reads.
+    missing = _header_missing(raw)
+    while missing:
+        part = read_raw(missing)
+        if not part:
+            raise IOError('Block header truncated.')
+        raw += part
+        missing = _header_missing(raw)
+    head, length = parse_block_header(raw)
+    if len(raw) < head + length:
+        parts = [raw]
+        received = len(raw)
+        while received < head + length:
+            part = read_raw(head + length + 1 - received)
+            if not part:
+                raise IOError('Block truncated after %i of %i bytes.'
+                              % (received - head, length))
+            parts.append(part)
+            received += len(part)
+        raw = b''.join(parts)
+    return raw, head
+
+def block_ranges(points, block_pts):
+    '''
+    Split `points` into consecutive blocks of at most `block_pts` points.
+
+    Args:
+        points (int): Total number of points.
+        block_pts (int): Maximum number of points per block.
+
+    Returns:
+        list: `(start, count)` tuples with zero based `start`.
+    '''
+    return [(start, min(block_pts, points - start))
+            for start in range(0, points, block_pts)]
+
+class BlockDownloader(object):
+    '''
+    Download a waveform in blocks into one preallocated buffer.
+
+    The oscilloscope can only send a limited number of points per
+    `:wav:data?`.  The range of each block is set with `:wav:star` and
+    `:wav:stop`, the block is read, and while a background thread copies
+    it into its slice of the output buffer the next block's range is
+    already being sent.  Only one copy of the capture is ever held, so
+    peak memory is the size of the capture plus two blocks.
+
+    Sinks, such as the file writers in `writers`, are given each block by
+    the background thread as soon as it arrives, so they run while the
+    oscilloscope is transferring the next block.  When the capture does
+    not need to be kept, only the blocks in flight are held in memory.
+
+    Args:
+        osc: Oscilloscope providing `_write`, `_ask_raw`, `_read_raw`,
+            `_block_read_bytes` and `block_pts`.
+        block_pts (None, int): Maximum number of points per `:wav:data?`.
+            Default is `None`; the oscilloscope's `block_pts`.
+        progress (None, bool): Show a progress bar.  Default is `None`; the
+            oscilloscope's `progress`.
+    '''
+    def __init__(self, osc, block_pts=None, progress=None):
+        self._osc = osc
+        self.block_pts = osc.block_pts if block_pts is None else block_pts
+        self.progress = getattr(osc, 'progress', True) if progress is None else progress
+
+    def download(self, points, out=None, sinks=(), keep=True):
+        '''
+        Download `points` points of the currently selected source.
+
+        Args:
+            points (int): Number of points to download.
+            out (None, numpy.ndarray): uint8 buffer of at least `points`
+                elements to download into.  Default is `None`; a buffer
+                is allocated.
+            sinks (list): Objects whose `write_block(start, codes)` is
+                called with each block.  Default is no sinks.
+            keep (bool): Keep the whole capture.  If `False`, the blocks
+                are only passed to the sinks.  Default is `True`.
+
+        Returns:
+            numpy.ndarray: The raw uint8 codes, or `None` if `keep` is
+                `False`.
+        '''
+        if not keep:
+            out = None
+        elif out is None:
+            out = np.empty(points, 'B')
+        else:
+            assert out.dtype == np.uint8 and out.size >= points
+
+        blocks = queue.Queue(2)
+        errors = []
+        worker = threading.Thread(target=self._store,
+                                  args=(blocks, out, sinks, errors))
+        worker.daemon = True
+        worker.start()
+
+        ranges = block_ranges(points, self.block_pts)
+        try:
+            for start, count in tqdm.tqdm(ranges, ncols=60,
+                                          disable=not self.progress):
+                if errors:
+                    break
+                # The range and the query go in one message.
+                with self._osc.batch():
+                    self._osc._write(':wav:star %i' % (start+1))
+                    self._osc._write(':wav:stop %i' % (start+count))
+                    num_bytes = self._osc._block_read_bytes(count)
+                    raw, head = read_block(self._osc._ask_raw,
+                                           self._osc._read_raw,
+                                           ':wav:data?', num_bytes)
+                blocks.put((start, count, raw, head))
+        finally:
+            blocks.put(None)
+            worker.join()
+
+        if errors:
+            raise errors[0]
+        return None if out is None else out[:points]
+
+    def _store(self, blocks, out, sinks, errors):
+        while True:
+            item = blocks.get()
+            if item is None:
+                return
+            if errors:
+                continue
+            start, count, raw, head = item
+            try:
+                data = np.frombuffer(raw, 'B', count, head)
+                if out is not None:
+                    out[start:start+count] = data
+                for sink in sinks:
+                    sink.write_block(start, data)
+            except Exception as e:
+                errors.append(e)
+
+def download_channels(osc, channels, mode, downloader, out=None, preambles=None):
+    '''
+    Download several channels of one frozen acquisition.
+
+    The acquisition is stopped and the waveform mode and format are set
+    once; then for each channel only the source is switched, its preamble
+    read and its points downloaded into its row of one 2-D buffer.
+
+    Args:
+        osc: The oscilloscope; `osc[c]` must be channel `c`.
+        channels (list): Channel numbers to download.
+        mode (str): 'norm' or 'raw'.
+        downloader (BlockDownloader): Used to download each channel.
+        out (None, numpy.ndarray, object): Where to download the codes, of
+            shape `(len(channels), points)`; see `shm.allocate()`.  Default
+            is `None`; a buffer is allocated.
+        preambles (None, list): The channels' preambles, if already known.
+            The source switch is then sent with the first block request
+            instead of with a preamble query.  Default is `None`; the
+            preambles are read.
+
+    Returns:
+        2-tuple: The uint8 codes, one row per channel, and the list of
+            preambles.
+    '''
+    assert mode in ('norm', 'raw')
+    assert channels, 'No channels to download.'
+
+    codes = None
+    known = preambles is not None
+    preambles = list(preambles) if known else []
+    for row, c in enumerate(channels):
+        with osc.batch():
+            if row == 0:
+                osc._write(':stop')
+                osc._write(':wav:mode %s' % mode)
+                osc._write(':wav:form byte')
+            osc._write(':wav:sour chan%i' % c)
+            if known:
+                info = preambles[row]
+            else:
+                info = osc[c].get_data_premable()
+                preambles.append(info)
+            if row == 0:
+                codes = shm.allocate(out, (len(channels), info['points']))
+            assert info['points'] == codes.shape[1], \
+                'Channels have different numbers of points.'
+            downloader.download(info['points'], codes[row])
+    return codes, preambles
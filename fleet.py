@@ -0,0 +1,181 @@
+import concurrent.futures
+import discovery
+
+# Driver module and class of each supported (vid, pid).
+drivers = {
+    ('0x1ab1', '0x04ce'): ('rigol1000z', 'Rigol1054z'),
+    ('0x1ab1', '0x04b0'): ('rigol2000a', 'Rigol2072a'),
+}
+
+def _driver(vid, pid):
+    module, name = drivers[(vid, pid)]
+    return getattr(__import__(module), name)
+
+def find_scopes():
+    '''
+    All attached Rigol oscilloscopes.
+
+    Returns:
+        dict: Driver class keyed by serial number.
+    '''
+    return {d.serial: _driver(d.vid, d.pid) for d in discovery.devices()
+            if (d.vid, d.pid) in drivers}
+
+def _results(futures):
+    concurrent.futures.wait(futures.values())
+    return {s: f.result() for s, f in futures.items()}
+
+class Fleet(object):
+    '''
+    Several oscilloscopes driven in parallel.
+
+    Every operation runs on all oscilloscopes at the same time, each on
+    its own worker thread, and returns the results keyed by serial number.
+    Capturing from four oscilloscopes takes about as long as capturing
+    from the slowest one.
+
+        with Fleet.open() as fleet:
+            fleet.capture(timeout_s=5.)
+            data = fleet.get_data_multi(mode='raw')
+        for serial, waveforms in data.items():
+            ...
+
+    Args:
+        scopes (dict): Oscilloscope drivers keyed by serial number.
+    '''
+    def __init__(self, scopes):
+        self.scopes = dict(scopes)
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max(len(self.scopes), 1), 'rigol-fleet')
+
+    @classmethod
+    def open(cls, serials=None, **kwargs):
+        '''
+        Open attached oscilloscopes in parallel.
+
+        Args:
+            serials (None, list): Serial numbers to open.  Default is
+                `None`; every attached Rigol oscilloscope.
+            **kwargs: Passed on to each driver, e.g. `completion`.
+
+        Returns:
+            `Fleet`: The oscilloscopes.
+        '''
+        found = find_scopes()
+        if serials is None:
+            serials = sorted(found)
+        for serial in serials:
+            assert serial in found, 'Oscilloscope %s not found.' % serial
+        with concurrent.futures.ThreadPoolExecutor(max(len(serials), 1)) as pool:
+            futures = {s: pool.submit(found[s], serial=s, **kwargs)
+                       for s in serials}
+            concurrent.futures.wait(futures.values())
+        failed = [f for f in futures.values() if f.exception() is not None]
+        if failed:
+            # Release the oscilloscopes that did open before giving up.
+            for f in futures.values():
+                if f.exception() is None:
+                    f.result().close()
+            raise failed[0].exception()
+        return cls(_results(futures))
+
+    def map(self, func, *args, **kwargs):
+        '''
+        Call a function with every oscilloscope in parallel.
+
+        Args:
+            func (callable, str): Called as `func(osc, *args, **kwargs)`,
+                or the name of a driver method.
+            *args: Passed on to `func`.
+            **kwargs: Passed on to `func`.
+
+        Returns:
+            dict: Return values keyed by serial number.  If any call
+                raises, the first exception is raised once all calls have
+                finished.
+        '''
+        if isinstance(func, str):
+            name = func
+            func = lambda osc, *a, **kw: getattr(osc, name)(*a, **kw)
+        futures = {s: self._pool.submit(func, osc, *args, **kwargs)
+                   for s, osc in self.scopes.items()}
+        return _results(futures)
+
+    def run(self):
+        return self.map('run')
+
+    def stop(self):
+        return self.map('stop')
+
+    def force(self):
+        return self.map('force')
+
+    def arm(self):
+        '''
+        Put every oscilloscope in single shot mode.
+        '''
+        return self.map('set_single_shot')
+
+    def capture(self, timeout_s=10., force=False):
+        '''
+        Take one acquisition on every oscilloscope.
+
+        Arms all oscilloscopes, optionally forces a trigger, and waits
+        until each has stopped.
+
+        Args:
+            timeout_s (float): Seconds to wait for the triggers.
+            force (bool): Force a trigger straight after arming.  Default
+                is `False`; wait for each oscilloscope's own trigger.
+
+        Returns:
+            dict: `True` for the oscilloscopes that triggered in time,
+                keyed by serial number.
+        '''
+        def single(osc):
+            osc.set_single_shot()
+            if force:
+                osc.force()
+            return osc.wait_for_trigger(timeout_s)
+        return self.map(single)
+
+    def get_data(self, channel, mode='norm', dtype='float64'):
+        '''
+        Download one channel of every oscilloscope in parallel; see
+        `get_data()` of the drivers.
+
+        Returns:
+            dict: `(t, v)` keyed by serial number.
+        '''
+        return self.map(lambda osc: osc[channel].get_data(mode, dtype=dtype))
+
+    def get_data_multi(self, channels=None, mode='norm', dtype='float64'):
+        '''
+        Download channels of every oscilloscope in parallel; see
+        `get_data_multi()` of the drivers.
+
+        Returns:
+            dict: `waveform.WaveformSet` keyed by serial number.
+        '''
+        return self.map('get_data_multi', channels, mode, dtype)
+
+    def close(self):
+        try:
+            self.map('close')
+        finally:
+            self._pool.shutdown()
+
+    def __getitem__(self, serial):
+        return self.scopes[serial]
+
+    def __iter__(self):
+        return iter(self.scopes)
+
+    def __len__(self):
+        return len(self.scopes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
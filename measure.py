@@ -0,0 +1,143 @@
+import functools
+import collections
+import numpy as np
+import analysis
+
+# Measurement names, mapped to the short SCPI mnemonics of `:meas:item?`.
+items = collections.OrderedDict([
+    ('vmax', 'VMAX'), ('vmin', 'VMIN'), ('vpp', 'VPP'), ('vtop', 'VTOP'),
+    ('vbase', 'VBAS'), ('vamp', 'VAMP'), ('vavg', 'VAVG'), ('vrms', 'VRMS'),
+    ('vupper', 'VUP'), ('vmid', 'VMID'), ('vlower', 'VLOW'),
+    ('variance', 'VARI'), ('overshoot', 'OVER'), ('preshoot', 'PRES'),
+    ('area', 'MAR'), ('period', 'PER'), ('freq', 'FREQ'),
+    ('rise_time', 'RTIM'), ('fall_time', 'FTIM'), ('pos_width', 'PWID'),
+    ('neg_width', 'NWID'), ('pos_duty', 'PDUT'), ('neg_duty', 'NDUT'),
+    ('tvmax', 'TVMAX'), ('tvmin', 'TVMIN'), ('pos_slew', 'PSLEW'),
+    ('neg_slew', 'NSLEW'), ('pos_pulses', 'PPUL'), ('neg_pulses', 'NPUL'),
+    ('pos_edges', 'PEDG'), ('neg_edges', 'NEDG'),
+])
+
+default_items = ('vpp', 'vmax', 'vmin', 'vavg', 'vrms', 'freq', 'period',
+                 'rise_time', 'fall_time', 'pos_duty')
+
+# The oscilloscope answers 9.9E37 when a measurement is not possible.
+_invalid = 9.9e37
+
+@functools.lru_cache(None)
+def record_type(names):
+    '''
+    The record type holding one channel's measurements.
+
+    Args:
+        names (tuple): Measurement names.
+
+    Returns:
+        type: A `collections.namedtuple` with a `channel` field followed
+            by one field per measurement.
+    '''
+    return collections.namedtuple('Measurement', ('channel',) + tuple(names))
+
+class Measurements(object):
+    '''
+    Measurements of several channels.
+
+    Indexing with a channel number returns that channel's record, whose
+    fields are the measurement names.  Measurements the oscilloscope
+    could not make are `nan`.
+
+    Args:
+        channels (list): The channel numbers, in row order.
+        names (list): The measurement names, in column order.
+        values (numpy.ndarray): float64 values, shape
+            `(len(channels), len(names))`.
+    '''
+    def __init__(self, channels, names, values):
+        self.channels = list(channels)
+        self.names = tuple(names)
+        self.values = values
+        self._record = record_type(self.names)
+
+    def __getitem__(self, channel):
+        row = self.values[self.channels.index(channel)]
+        return self._record(channel, *row.tolist())
+
+    def __iter__(self):
+        return (self[c] for c in self.channels)
+
+    def __len__(self):
+        return len(self.channels)
+
+    def column(self, name):
+        '''
+        Returns:
+            numpy.ndarray: One measurement of every channel.
+        '''
+        return self.values[:, self.names.index(name)]
+
+    def to_dict(self):
+        '''
+        Returns:
+            dict: `{channel: {name: value}}`.
+        '''
+        return {c: dict(zip(self.names, row.tolist()))
+                for c, row in zip(self.channels, self.values)}
+
+    def __repr__(self):
+        return 'Measurements(channels=%r, names=%r)' % (self.channels,
+                                                        self.names)
+
+def _parse(value):
+    try:
+        v = float(value)
+    except ValueError:
+        return np.nan
+    return np.nan if abs(v) >= _invalid else v
+
+def measure(osc, names=default_items, channels=None, source='scope',
+            waveforms=None):
+    '''
+    Make many measurements on many channels at once.
+
+    With `source='scope'` the oscilloscope makes the measurements; every
+    measurement query (`osc.measure_query`) for every channel is sent in one batched
+    exchange, so the round trips do not grow with the number of
+    measurements.  With `source='host'` the channels are downloaded
+    (or `waveforms` are used) and measured by `analysis.analyze()`, which
+    is usually faster for many measurements on 'norm' captures.
+
+    Args:
+        osc: The oscilloscope.
+        names (list): Measurement names; see `items`.  Default is
+            `default_items`.
+        channels (None, list): Channel numbers.  Default is `None`; all
+            enabled channels.
+        source (str): 'scope' or 'host'.  Default is 'scope'.
+        waveforms (None, `waveform.WaveformSet`): Already downloaded
+            waveforms to measure host-side.  Default is `None`; downloaded
+            in 'norm' mode.
+
+    Returns:
+        `Measurements`: The measurements.
+    '''
+    assert source in ('scope', 'host')
+    names = tuple(names)
+    for name in names:
+        assert name in items, 'Unknown measurement %r.' % name
+    if waveforms is not None:
+        channels = waveforms.channels if channels is None else channels
+    elif channels is None:
+        channels = [i+1 for i, e in enumerate(osc.get_channels_enabled()) if e]
+
+    if source == 'host':
+        if waveforms is None:
+            waveforms = osc.get_data_multi(channels)
+        values = analysis.analyze_set([waveforms[c] for c in channels], names)
+        return Measurements(channels, names, values)
+
+    template = osc.measure_query
+    with osc.batch() as b:
+        deferred = [[b.ask(template % (items[n], c)) for n in names]
+                    for c in channels]
+    values = np.array([[_parse(d.value) for d in row] for row in deferred],
+                      'float64').reshape(len(channels), len(names))
+    return Measurements(channels, names, values)
@@ -0,0 +1,504 @@
+import re
+import json
+import time
+import base64
+import socket
+import bisect
+import threading
+import collections
+from transport import Transport
+
+# Upper bounds of the latency histogram buckets [s].
+buckets = (1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2,
+           0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+
+Event = collections.namedtuple('Event', 'op cmd start duration nbytes error')
+Event.__doc__ = '''
+One transfer, as given to hooks.
+
+Attributes:
+    op (str): 'write' or 'read'.
+    cmd (str): The message written, or the last one written before a read.
+    start (float): `time.perf_counter()` when the transfer started.
+    duration (float): Seconds the transfer took.
+    nbytes (int): Bytes transferred.
+    error (None, Exception): The error raised, if any.
+'''
+
+def command_key(cmd):
+    '''
+    The name a message's statistics are kept under: its SCPI header in
+    lower case with channel and other numbers replaced by 'N', e.g.
+    ':chanN:scal?'.  A batched message is named after its last query, or
+    'batch' if it has none.
+
+    Args:
+        cmd (str): The message.
+
+    Returns:
+        str: The key.
+    '''
+    parts = [p.strip() for p in cmd.split(';') if p.strip()]
+    if not parts:
+        return ''
+    queries = [p for p in parts if p.split(None, 1)[0].endswith('?')]
+    if len(parts) > 1 and not queries:
+        return 'batch'
+    part = queries[-1] if queries else parts[0]
+    return re.sub(r'\d+', 'N', part.split(None, 1)[0].lower())
+
+def is_timeout(error):
+    '''
+    Whether an exception raised by a transport is a timeout.
+    '''
+    return isinstance(error, (TimeoutError, socket.timeout)) or \
+        'timeout' in type(error).__name__.lower() or \
+        'timed out' in str(error).lower()
+
+class Histogram(object):
+    '''
+    Counts of values falling in each of the `buckets`, as a Prometheus
+    histogram: the count of bucket `i` includes all smaller values.
+    '''
+    def __init__(self):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        '''
+        Returns:
+            list: `(upper bound, count)` tuples, ending with `inf`.
+        '''
+        total = 0
+        result = []
+        for bound, count in zip(buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        '''
+        Upper bound of the bucket holding the `q` quantile, or `None`
+        if there are no values.
+        '''
+        if not self.count:
+            return None
+        for bound, total in self.cumulative():
+            if total >= q * self.count:
+                return bound
+
+def _json_bound(bound):
+    # JSON has no infinity.
+    return '+Inf' if bound == float('inf') else bound
+
+class CommandStats(object):
+    '''
+    Statistics of one command.
+
+    Attributes:
+        latency (`Histogram`): Seconds from writing the message to the
+            end of its response, or to the end of the write for commands
+            without a response.
+        count (int): Number of messages.
+        bytes_written (int): Bytes written.
+        bytes_read (int): Bytes read.
+        transfer_s (float): Seconds spent in writes and reads.
+        continuation_reads (int): Reads needed after the first one to
+            complete a response, e.g. for a truncated waveform block.
+        errors (int): Transfers that raised.
+        timeouts (int): Transfers that timed out.
+    '''
+    def __init__(self):
+        self.latency = Histogram()
+        self.count = 0
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.transfer_s = 0.
+        self.continuation_reads = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    @property
+    def read_bytes_per_s(self):
+        return self.bytes_read / self.transfer_s if self.transfer_s else 0.
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'bytes_written': self.bytes_written,
+            'bytes_read': self.bytes_read,
+            'transfer_s': self.transfer_s,
+            'read_bytes_per_s': self.read_bytes_per_s,
+            'continuation_reads': self.continuation_reads,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'latency': {
+                'sum_s': self.latency.sum,
+                'p50_s': _json_bound(self.latency.quantile(0.5)),
+                'p99_s': _json_bound(self.latency.quantile(0.99)),
+                'buckets': [[_json_bound(b), c]
+                            for b, c in self.latency.cumulative()],
+            },
+        }
+
+class Metrics(object):
+    '''
+    Per command latency, byte and error statistics of one instrument.
+
+    Usually made by `ScpiInstrument.enable_metrics()`, which puts a
+    `MetricsTransport` in front of the instrument's transport.  Hooks are
+    called with an `Event` after every transfer, e.g. to log slow
+    commands:
+
+        m = osc.enable_metrics()
+        m.hooks.append(lambda e: e.duration > 0.1 and print(e))
+        osc[1].get_data('raw')
+        print(m.to_prometheus())
+
+    Args:
+        labels (None, dict): Labels added to every exported metric, e.g.
+            `{'serial': 'DS1ZA000000001'}`.  Default is none.
+
+    Attributes:
+        commands (dict): `CommandStats` keyed by `command_key()`.
+        hooks (list): Callables given each `Event`.
+    '''
+    def __init__(self, labels=None):
+        self.labels = dict(labels or {})
+        self.commands = collections.defaultdict(CommandStats)
+        self.hooks = []
+        self._lock = threading.Lock()
+        self._pending = None
+        self._last = ''
+
+    def reset(self):
+        with self._lock:
+            self.commands.clear()
+            self._pending = None
+
+    def _written(self, cmd, start, duration, error):
+        key = command_key(cmd)
+        with self._lock:
+            stats = self.commands[key]
+            stats.count += 1
+            stats.transfer_s += duration
+            if error is None:
+                stats.bytes_written += len(cmd)
+            if error is not None or '?' not in cmd:
+                # No response follows.
+                stats.latency.add(duration)
+                self._pending = None
+                self._count_error(stats, error)
+            else:
+                self._pending = (key, start)
+            self._last = key
+
+    def _read(self, nbytes, start, duration, error):
+        with self._lock:
+            pending = self._pending
+            key = pending[0] if pending else self._last
+            stats = self.commands[key]
+            stats.transfer_s += duration
+            stats.bytes_read += nbytes
+            if pending is not None:
+                stats.latency.add(start + duration - pending[1])
+                self._pending = None
+            else:
+                stats.continuation_reads += 1
+            self._count_error(stats, error)
+
+    @staticmethod
+    def _count_error(stats, error):
+        if error is not None:
+            stats.errors += 1
+            if is_timeout(error):
+                stats.timeouts += 1
+
+    def _emit(self, event):
+        for hook in self.hooks:
+            hook(event)
+
+    def totals(self):
+        '''
+        Returns:
+            dict: Totals over all commands.
+        '''
+        with self._lock:
+            stats = list(self.commands.values())
+        return {
+            'count': sum(s.count for s in stats),
+            'bytes_written': sum(s.bytes_written for s in stats),
+            'bytes_read': sum(s.bytes_read for s in stats),
+            'transfer_s': sum(s.transfer_s for s in stats),
+            'continuation_reads': sum(s.continuation_reads for s in stats),
+            'errors': sum(s.errors for s in stats),
+            'timeouts': sum(s.timeouts for s in stats),
+        }
+
+    def to_dict(self):
+        with self._lock:
+            commands = dict((k, s.to_dict()) for k, s in self.commands.items())
+        return {'labels': self.labels, 'totals': self.totals(),
+                'commands': commands}
+
+    def to_json(self, filename=None):
+        '''
+        Export as JSON.
+
+        Args:
+            filename (None, str): Also write to this file.  Default is
+                `None`.
+
+        Returns:
+            str: The JSON text.
+        '''
+        text = json.dumps(self.to_dict(), indent=2, sort_keys=True)
+        if filename is not None:
+            with open(filename, 'w') as fs:
+                fs.write(text)
+        return text
+
+    def to_prometheus(self, prefix='rigol_scpi'):
+        '''
+        Export in the Prometheus text exposition format, e.g. for a
+        node_exporter textfile collector.
+
+        Args:
+            prefix (str): Prefix of the metric names.  Default is
+                'rigol_scpi'.
+
+        Returns:
+            str: The metrics.
+        '''
+        def labels(command, **extra):
+            items = sorted(self.labels.items()) + [('command', command)] + \
+                sorted(extra.items())
+            return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('"', '\\"'))
+                                     for k, v in items)
+
+        counters = (('requests', 'count', 'Messages written.'),
+                    ('bytes_written', 'bytes_written', 'Bytes written.'),
+                    ('bytes_read', 'bytes_read', 'Bytes read.'),
+                    ('transfer_seconds', 'transfer_s',
+                     'Seconds spent in transfers.'),
+                    ('continuation_reads', 'continuation_reads',
+                     'Extra reads needed to complete a response.'),
+                    ('errors', 'errors', 'Transfers that raised.'),
+                    ('timeouts', 'timeouts', 'Transfers that timed out.'))
+        with self._lock:
+            stats = sorted(self.commands.items())
+            lines = []
+            for name, attr, help in counters:
+                metric = '%s_%s_total' % (prefix, name)
+                lines.append('# HELP %s %s' % (metric, help))
+                lines.append('# TYPE %s counter' % metric)
+                for key, s in stats:
+                    lines.append('%s%s %r' % (metric, labels(key),
+                                              getattr(s, attr)))
+            metric = '%s_latency_seconds' % prefix
+            lines.append('# HELP %s Seconds from writing a message to the end '
+                         'of its response.' % metric)
+            lines.append('# TYPE %s histogram' % metric)
+            for key, s in stats:
+                for bound, total in s.latency.cumulative():
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('%s_bucket%s %i' % (metric, labels(key, le=le),
+                                                     total))
+                lines.append('%s_sum%s %r' % (metric, labels(key), s.latency.sum))
+                lines.append('%s_count%s %i' % (metric, labels(key),
+                                                s.latency.count))
+        return '\n'.join(lines) + '\n'
+
+class MetricsTransport(Transport):
+    '''
+    Wraps a transport, timing every write and read into a `Metrics`.
+
+    Args:
+        transport (`Transport`): The wrapped transport.
+        metrics (None, `Metrics`): Where to record.  Default is `None`; a
+            new `Metrics`.
+        trace (None, `TraceLog`): Also log every transfer, with the data
+            read, to this trace.  Default is `None`.
+    '''
+    def __init__(self, transport, metrics=None, trace=None):
+        self.transport = transport
+        self.metrics = Metrics() if metrics is None else metrics
+        self.trace = trace
+        self._cmd = ''
+
+    @property
+    def name(self):
+        return self.transport.name
+
+    def __getattr__(self, name):
+        # E.g. the simulated transport's `scope`.
+        return getattr(self.__dict__['transport'], name)
+
+    def write(self, cmd):
+        start = time.perf_counter()
+        error = None
+        try:
+            return self.transport.write(cmd)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            self._cmd = cmd
+            self.metrics._written(cmd, start, duration, error)
+            if self.metrics.hooks or self.trace is not None:
+                event = Event('write', cmd, start, duration, len(cmd), error)
+                self.metrics._emit(event)
+                if self.trace is not None:
+                    self.trace(event)
+
+    def _timed_read(self, read, num_bytes):
+        start = time.perf_counter()
+        error = None
+        data = b''
+        try:
+            data = read(num_bytes)
+            return data
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            raw = data.encode() if isinstance(data, str) else data
+            self.metrics._read(len(raw), start, duration, error)
+            if self.metrics.hooks or self.trace is not None:
+                event = Event('read', self._cmd, start, duration, len(raw),
+                              error)
+                self.metrics._emit(event)
+                if self.trace is not None:
+                    self.trace(event, raw)
+
+    def read_raw(self, num_bytes=-1):
+        return self._timed_read(self.transport.read_raw, num_bytes)
+
+    def read(self, num_bytes=-1):
+        return self._timed_read(self.transport.read, num_bytes)
+
+    def block_read_bytes(self, count):
+        return self.transport.block_read_bytes(count)
+
+    def clear(self):
+        self.transport.clear()
+
+    @property
+    def timeout_s(self):
+        return self.transport.timeout_s
+
+    @timeout_s.setter
+    def timeout_s(self, timeout):
+        self.transport.timeout_s = timeout
+
+    def close(self):
+        self.transport.close()
+        if self.trace is not None:
+            self.trace.close()
+
+class TraceLog(object):
+    '''
+    A hook writing every transfer to a JSON lines file, which
+    `ReplayTransport` can play back.
+
+    Each line has the operation, the command, the start time relative to
+    the first transfer, the duration and the number of bytes, plus the
+    data read (base64) if `data` is set and the error if one was raised.
+
+    Args:
+        filename (str, file): File name, or file-like object open for
+            writing text.
+        data (bool): Record the data read, needed for replay.  Default is
+            `True`.
+    '''
+    def __init__(self, filename, data=True):
+        self._own = not hasattr(filename, 'write')
+        self._fs = open(filename, 'w') if self._own else filename
+        self.data = data
+        self._t0 = None
+        self._lock = threading.Lock()
+
+    def __call__(self, event, data=None):
+        if self._t0 is None:
+            self._t0 = event.start
+        entry = {'op': event.op, 'cmd': event.cmd,
+                 't': event.start - self._t0, 'dt': event.duration,
+                 'bytes': event.nbytes}
+        if event.error is not None:
+            entry['error'] = repr(event.error)
+        if data is not None and self.data and event.op == 'read':
+            entry['data'] = base64.b64encode(data).decode()
+        with self._lock:
+            self._fs.write(json.dumps(entry) + '\n')
+
+    def close(self):
+        if self._own:
+            self._fs.close()
+        else:
+            self._fs.flush()
+
+class ReplayTransport(Transport):
+    '''
+    Plays back a `TraceLog` recorded with data, so a session can be
+    re-run and profiled without the oscilloscope.
+
+    Args:
+        trace (str, list): The trace file, or its entries as dicts.
+        strict (bool): Check every write matches the recorded command.
+            Default is `True`.
+        timing (bool): Sleep for the recorded duration of each transfer.
+            Default is `False`.
+    '''
+    name = 'replay'
+
+    def __init__(self, trace, strict=True, timing=False):
+        if isinstance(trace, str):
+            with open(trace) as fs:
+                trace = [json.loads(line) for line in fs if line.strip()]
+        self._entries = collections.deque(trace)
+        self.strict = strict
+        self.timing = timing
+        self._timeout_s = 5.
+
+    def _next(self, op):
+        while self._entries:
+            entry = self._entries.popleft()
+            if entry['op'] == op:
+                return entry
+            assert not self.strict, 'Expected a %s, the trace has a %s of %r.' % (
+                op, entry['op'], entry['cmd'])
+        raise IOError('End of the trace.')
+
+    def write(self, cmd):
+        entry = self._next('write')
+        assert not self.strict or entry['cmd'] == cmd, \
+            'Wrote %r, the trace has %r.' % (cmd, entry['cmd'])
+        if self.timing:
+            time.sleep(entry['dt'])
+
+    def read_raw(self, num_bytes=-1):
+        entry = self._next('read')
+        if self.timing:
+            time.sleep(entry['dt'])
+        if 'error' in entry:
+            raise IOError('Replayed error: %s' % entry['error'])
+        assert 'data' in entry, 'The trace was recorded without data.'
+        return base64.b64decode(entry['data'])
+
+    def clear(self):
+        pass
+
+    @property
+    def remaining(self):
+        '''
+        Number of trace entries not played back yet.
+        '''
+        return len(self._entries)
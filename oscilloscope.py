@@ -0,0 +1,293 @@
+import measure
+import screenshot
+from transport import ScpiInstrument
+from download import BlockDownloader, download_channels
+from waveform import WaveformSet
+from autotune import BlockSizeTuner
+from profiles import read_profile, apply_profile
+from stream import Stream
+from completion import wait_for_trigger
+
+class Oscilloscope(ScpiInstrument):
+    '''
+    What the Rigol oscilloscope drivers have in common.
+
+    Subclasses open the transport, create their channels, trigger and
+    timebase, and implement `get_screenshot()`.
+
+    Attributes:
+        measure_query (str): Measurement query, formatted with the item
+            and channel number.
+    '''
+    # Set by the subclasses: one object per channel, in channel order.
+    _channels = ()
+
+    def __getitem__(self, i):
+        assert 1 <= i <= len(self._channels), 'Not a valid channel.'
+        return self._channels[i-1]
+
+    def __len__(self):
+        return len(self._channels)
+
+    def autoscale(self):
+        self._write(':aut')
+
+    def clear(self):
+        self._write(':clear')
+
+    def run(self):
+        self._write(':run')
+
+    def stop(self):
+        self._write(':stop')
+
+    def force(self):
+        self._write(':tfor')
+
+    def set_single_shot(self):
+        # Until `:sing` is processed, `:trig:stat?` can still read the
+        # 'STOP' of the previous capture.
+        self._write(':sing')
+        self._sync()
+
+    def get_id(self):
+        return self._ask('*IDN?')
+
+    def get_averaging(self):
+        return self._ask(':acq:aver?')
+
+    def set_averaging(self, count):
+        assert count in [2**n for n in range(1, 11)]
+        self._write(':acq:aver %i' % count)
+        return self.get_averaging()
+
+    def set_averaging_mode(self):
+        self._write(':acq:type aver')
+        return self.get_mode()
+
+    def set_normal_mode(self):
+        self._write(':acq:type norm')
+        return self.get_mode()
+
+    def set_high_resolution_mode(self):
+        self._write(':acq:type hres')
+        return self.get_mode()
+
+    def set_peak_mode(self):
+        self._write(':acq:type peak')
+        return self.get_mode()
+
+    def get_mode(self):
+        modes = {
+            'NORM': 'normal',
+            'AVER': 'averages',
+            'PEAK': 'peak',
+            'HRES': 'high_resolution'
+        }
+        return modes[self._ask(':acq:type?')]
+
+    def get_sampling_rate(self):
+        return float(self._ask(':acq:srat?'))
+
+    def get_memory_depth(self):
+        md = self._ask(':acq:mdep?')
+        if md != 'AUTO':
+           md = int(md)
+        return md
+
+    def get_channels_enabled(self):
+        return [c.enabled() for c in self._channels]
+
+    def get_data_multi(self, channels=None, mode='norm', dtype='float64',
+                       out=None):
+        '''
+        Download several channels of the same acquisition.
+
+        The oscilloscope is stopped and set up once, then each channel is
+        downloaded into one row of a shared buffer.
+
+        Args:
+            channels (None, list): Channel numbers to download.  Default is
+                `None`; all enabled channels.
+            mode (str): 'norm' or 'raw'; see `get_data()`.  Default is
+                'norm'.
+            dtype (str, numpy.dtype): Float type the voltages are converted
+                to.  Default is 'float64'.
+            out (None, numpy.ndarray, `shm.SharedBuffer`, `shm.MemmapBuffer`):
+                Where to download the codes; see `get_data()`.  Default is
+                `None`; a new array.
+
+        Returns:
+            `WaveformSet`: The waveforms, indexed by channel number, with a
+                shared time axis `t`.
+        '''
+        if channels is None:
+            channels = [i+1 for i, e in enumerate(self.get_channels_enabled())
+                        if e]
+        downloader = BlockDownloader(self)
+        codes, preambles = download_channels(self, channels, mode, downloader,
+                                             out)
+        return WaveformSet(channels, codes, preambles, dtype)
+
+    def wait_for_trigger(self, timeout_s=None):
+        '''
+        Wait for a single shot acquisition to trigger and finish; see
+        `completion.wait_for_trigger()`.
+
+        Args:
+            timeout_s (None, float): Seconds to wait.  Default is `None`;
+                forever.
+
+        Returns:
+            bool: `True` if the acquisition finished, `False` on timeout.
+        '''
+        return wait_for_trigger(self._ask, timeout_s)
+
+    def acquire_single(self, timeout_s=10., channels=None, mode='norm',
+                       dtype='float64', force=False, out=None):
+        '''
+        Take one triggered acquisition and download it.
+
+        Arms single shot mode, polls the trigger status with a backoff
+        until the acquisition has finished, then downloads the channels
+        straight away.
+
+        Args:
+            timeout_s (None, float): Seconds to wait for the trigger.
+                Default is 10s.
+            channels (None, list): Channel numbers to download.  Default is
+                `None`; all enabled channels.
+            mode (str): 'norm' or 'raw'; see `get_data()`.  Default is
+                'norm'.
+            dtype (str, numpy.dtype): Float type the voltages are converted
+                to.  Default is 'float64'.
+            force (bool): Force a trigger straight after arming.  Default is
+                `False`.
+            out (None, numpy.ndarray, `shm.SharedBuffer`, `shm.MemmapBuffer`):
+                Where to download the codes; see `get_data()`.  Default is
+                `None`; a new array.
+
+        Returns:
+            `WaveformSet`: The waveforms; see `get_data_multi()`.
+        '''
+        self.set_single_shot()
+        if force:
+            self.force()
+        if not self.wait_for_trigger(timeout_s):
+            raise TimeoutError('No trigger within %gs.' % timeout_s)
+        return self.get_data_multi(channels, mode, dtype, out)
+
+    def stream(self, channels=None, mode='norm', dtype='float64', slots=4,
+               max_frames=None, force=False):
+        '''
+        Acquire continuously, yielding one frame per acquisition.
+
+        Frames are downloaded by a background thread into a ring of
+        `slots` preallocated buffers; see `stream.Stream`.
+
+            with osc.stream([1, 2]) as s:
+                for frame in s:
+                    frame[1].volts()
+
+        Args:
+            channels (None, list): Channel numbers.  Default is `None`; all
+                enabled channels.
+            mode (str): 'norm' or 'raw'; see `get_data()`.  Default is
+                'norm'.
+            dtype (str, numpy.dtype): Float type the voltages are converted
+                to.  Default is 'float64'.
+            slots (int): Frames in the ring buffer.  Default is 4.
+            max_frames (None, int): Stop after this many frames.  Default
+                is `None`; run until closed.
+            force (bool): Force a trigger after arming.  Default is `False`.
+
+        Returns:
+            `stream.Stream`: Iterable and async iterable of `stream.Frame`s,
+                with `frames`, `dropped` and `fps` counters.
+        '''
+        return Stream(self, channels, mode, dtype, slots, max_frames, force)
+
+    def measure(self, names=None, channels=None, source='scope'):
+        '''
+        Make many measurements on many channels in one exchange; see
+        `measure.measure()`.
+
+        Args:
+            names (None, list): Measurement names, e.g. `['vpp', 'freq']`;
+                see `measure.items`.  Default is `None`;
+                `measure.default_items`.
+            channels (None, list): Channel numbers.  Default is `None`; all
+                enabled channels.
+            source (str): 'scope' to have the oscilloscope measure, 'host'
+                to download the channels and measure with NumPy.  Default
+                is 'scope'.
+
+        Returns:
+            `measure.Measurements`: One record per channel.
+        '''
+        if names is None:
+            names = measure.default_items
+        return measure.measure(self, names, channels, source)
+
+    def get_profile(self):
+        '''
+        Read all settings in one exchange.
+
+        Returns:
+            `profiles.Profile`: The current settings.
+        '''
+        return read_profile(self)
+
+    def apply(self, profile):
+        '''
+        Configure the oscilloscope from a profile, only sending the
+        settings that differ from the current ones.
+
+        Args:
+            profile (`profiles.Profile`, dict): The desired settings.
+
+        Returns:
+            list: The commands that were sent.
+        '''
+        return apply_profile(self, profile)
+
+    def autotune(self, retune=False):
+        '''
+        Pick the waveform block size and timeout giving the fastest
+        downloads with this oscilloscope and connection.
+
+        The result is cached per serial number, so later calls only read
+        the cache.  See `autotune.BlockSizeTuner`.
+
+        Args:
+            retune (bool): Measure again even if a cached result exists.
+                Default is `False`.
+
+        Returns:
+            dict: The chosen `block_pts` and `timeout_s`, and the measured
+                `points_per_s`.
+        '''
+        return BlockSizeTuner(self).tune(retune)
+
+    def selected_channel(self):
+        return self._ask(':MEAS:SOUR?')
+
+    def screenshot_stream(self, period_s=0., max_frames=None, **kwargs):
+        '''
+        Take screenshots repeatedly, e.g. to mirror the screen.
+
+            for t, image in osc.screenshot_stream(period_s=0.2):
+                show(image)
+
+        Args:
+            period_s (float): Minimum seconds between screenshots.  Default
+                is 0; as fast as the oscilloscope allows.
+            max_frames (None, int): Stop after this many screenshots.
+                Default is `None`; never stop.
+            **kwargs: Passed on to `get_screenshot()`.
+
+        Returns:
+            generator: `(timestamp, image bytes)` tuples.
+        '''
+        return screenshot.stream(lambda: self.get_screenshot(**kwargs),
+                                 period_s, max_frames)
@@ -0,0 +1,214 @@
+import os
+import json
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+_acq_types = {'normal': 'NORM', 'averages': 'AVER', 'peak': 'PEAK',
+              'high_resolution': 'HRES'}
+
+def _upper(value):
+    return str(value).upper()
+
+def _word(value):
+    # Rigol answers enumerations with their four letter short form.
+    return str(value).upper()[:4]
+
+def _mdep(value):
+    return 'AUTO' if str(value).upper() == 'AUTO' else int(float(value))
+
+# Setting name: (SCPI header, value -> SCPI argument, response -> value).
+channel_settings = [
+    ('enabled', ':disp', lambda v: '%i' % bool(v), lambda r: bool(int(r))),
+    ('probe_ratio', ':prob', lambda v: '%s' % v, float),
+    ('coupling', ':coup', _upper, _upper),
+    ('units', ':unit', lambda v: str(v).lower(), _word),
+    ('vertical_scale_V', ':scal', lambda v: '%.4e' % v, float),
+    ('offset_V', ':off', lambda v: '%.4e' % v, float),
+]
+
+timebase_settings = [
+    ('mode', ':tim:mode', lambda v: str(v).lower(), _word),
+    ('scale_s_div', ':tim:scal', lambda v: '%.4e' % v, float),
+    # The driver's `set_timebase_offset_s` negates the offset.
+    ('offset_s', ':tim:offs', lambda v: '%.4e' % -v, lambda r: -float(r)),
+]
+
+trigger_settings = [
+    ('level_V', ':trig:edg:lev', lambda v: '%.3e' % v, float),
+    ('holdoff_s', ':trig:hold', lambda v: '%.3e' % v, float),
+]
+
+acquisition_settings = [
+    ('type', ':acq:type', lambda v: _acq_types.get(v, v).lower(),
+     lambda r: dict((s, l) for l, s in _acq_types.items()).get(r.upper(), r)),
+    ('averages', ':acq:aver', lambda v: '%i' % v, int),
+    ('memory_depth', ':acq:mdep', lambda v: str(_mdep(v)), _mdep),
+]
+
+def _table(channels):
+    '''
+    `(section, key, setting, header, fmt, parse)` for every setting, in the
+    order they have to be applied: probe ratios change the scale and offset,
+    and the valid memory depths depend on the enabled channels.
+    '''
+    rows = []
+    for c in range(1, channels+1):
+        for name, header, fmt, parse in channel_settings:
+            rows.append(('channels', c, name, ':chan%i%s' % (c, header),
+                         fmt, parse))
+    for section, settings in (('timebase', timebase_settings),
+                              ('trigger', trigger_settings),
+                              ('acquisition', acquisition_settings)):
+        for name, header, fmt, parse in settings:
+            rows.append((section, None, name, header, fmt, parse))
+    return rows
+
+def _equal(a, b):
+    if isinstance(a, float) or isinstance(b, float):
+        try:
+            a, b = float(a), float(b)
+        except (TypeError, ValueError):
+            return False
+        return abs(a - b) <= 1e-6*max(abs(a), abs(b), 1e-12)
+    return a == b
+
+class Profile(object):
+    '''
+    A desired oscilloscope configuration.
+
+    Only the settings given are applied; everything else is left as it is.
+    As a dictionary:
+
+        {
+            'channels': {1: {'enabled': True, 'coupling': 'DC',
+                             'probe_ratio': 10, 'vertical_scale_V': 0.5,
+                             'offset_V': 0., 'units': 'volt'}},
+            'timebase': {'mode': 'main', 'scale_s_div': 1e-3,
+                         'offset_s': 0.},
+            'trigger': {'level_V': 0.1, 'holdoff_s': 1e-6},
+            'acquisition': {'type': 'normal', 'averages': 16,
+                            'memory_depth': 'AUTO'},
+        }
+
+    Args:
+        settings (None, dict): The settings.  Default is `None`; empty.
+    '''
+    sections = ('channels', 'timebase', 'trigger', 'acquisition')
+
+    def __init__(self, settings=None):
+        settings = settings or {}
+        for section in settings:
+            assert section in self.sections, 'Unknown section %s.' % section
+        self.settings = {
+            'channels': dict((int(c), dict(s)) for c, s in
+                             settings.get('channels', {}).items()),
+            'timebase': dict(settings.get('timebase', {})),
+            'trigger': dict(settings.get('trigger', {})),
+            'acquisition': dict(settings.get('acquisition', {})),
+        }
+
+    @classmethod
+    def from_json(cls, text_or_filename):
+        '''
+        Load a profile from a JSON string or file.
+        '''
+        text = text_or_filename
+        if not text.lstrip().startswith('{'):
+            with open(text_or_filename) as fs:
+                text = fs.read()
+        return cls(json.loads(text))
+
+    @classmethod
+    def from_yaml(cls, text_or_filename):
+        '''
+        Load a profile from a YAML string or file.  Needs PyYAML.
+        '''
+        assert yaml is not None, 'PyYAML is needed to read YAML profiles.'
+        text = text_or_filename
+        # Paths can contain ':', e.g. 'C:\profiles\a.yaml'.
+        if os.path.exists(text) or ('\n' not in text and ':' not in text):
+            with open(text_or_filename) as fs:
+                text = fs.read()
+        return cls(yaml.safe_load(text))
+
+    def to_dict(self):
+        d = dict((s, v) for s, v in self.settings.items() if v)
+        return d
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2, sort_keys=True)
+
+    def get(self, section, key, name):
+        values = self.settings[section]
+        if key is not None:
+            values = values.get(key, {})
+        return values.get(name)
+
+    def set(self, section, key, name, value):
+        values = self.settings[section]
+        if key is not None:
+            values = values.setdefault(key, {})
+        values[name] = value
+
+    def __repr__(self):
+        return 'Profile(%s)' % self.to_dict()
+
+def read_profile(osc, profile=None):
+    '''
+    Read the oscilloscope's current settings in one exchange.
+
+    Args:
+        osc: The oscilloscope.
+        profile (None, `Profile`): Only read the settings this profile
+            gives.  Default is `None`; read all settings.
+
+    Returns:
+        `Profile`: The current settings.
+    '''
+    rows = [r for r in _table(len(osc))
+            if profile is None or profile.get(r[0], r[1], r[2]) is not None]
+    with osc.batch() as b:
+        responses = [b.ask(r[3] + '?') for r in rows]
+    current = Profile()
+    for (section, key, name, _, _, parse), d in zip(rows, responses):
+        current.set(section, key, name, parse(d.value))
+    return current
+
+def apply_profile(osc, profile):
+    '''
+    Bring the oscilloscope to a profile, sending only what differs.
+
+    The current values of the profile's settings are read in one
+    exchange, compared with the profile, and the settings that differ are
+    written in one batch.
+
+    Args:
+        osc: The oscilloscope.
+        profile (`Profile`, dict): The desired settings.
+
+    Returns:
+        list: The commands that were sent.
+    '''
+    if not isinstance(profile, Profile):
+        profile = Profile(profile)
+    current = read_profile(osc, profile)
+
+    cmds = []
+    for section, key, name, header, fmt, parse in _table(len(osc)):
+        want = profile.get(section, key, name)
+        if want is None:
+            continue
+        if not _equal(parse(fmt(want)), current.get(section, key, name)):
+            if name == 'memory_depth':
+                # The memory depth can only be changed while running.
+                cmds.append(':run')
+            cmds.append('%s %s' % (header, fmt(want)))
+
+    if cmds:
+        with osc.batch():
+            for cmd in cmds:
+                osc._write(cmd)
+    return cmds
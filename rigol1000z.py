@@ -1,36 +1,11 @@
-import time
-import usbtmc
-import os
-import numpy as np
-import tqdm
-from usb_usbtmc_info import usbtmc_info
-
-class _Usbtmc:
-    """
-    Simple usbmtc device
-    """
-
-    def __init__(self, vid, pid):
-        self.file = usbtmc.Instrument(vid, pid)
-
-    def _write(self, cmd):
-        ret = self.file.write(cmd)
-        time.sleep(0.3)
-        return ret
-
-    def _read(self, num_bytes=-1):
-        return self.file.read(num_bytes).strip()
-
-    def _read_raw(self, num_bytes=-1):
-        return self.file.read_raw(num_bytes)
-
-    def _ask(self, cmd, num_bytes=-1):
-        self._write(cmd)
-        return self._read(num_bytes)
-
-    def _ask_raw(self, cmd, num_bytes=-1):
-        self._write(cmd)
-        return self._read_raw(num_bytes)
+import shm
+import screenshot
+import discovery
+from transport import PyUsbtmcTransport
+from download import BlockDownloader
+from waveform import Waveform, TimeAxis
+from writers import make_writer
+from oscilloscope import Oscilloscope
 
 class _Rigol1054zChannel:
     def __init__(self, channel, osc):
@@ -44,12 +19,19 @@ class _Rigol1054zChannel:
         return self._osc._read()
 
     def _ask(self, cmd):
-        self._write(cmd)
-        r = self._read()
-        return r
+        return self._osc._ask(':chan%i%s' % (self._channel, cmd))
 
     def get_voltage_rms_V(self):
-        return self._osc.ask(':MEAS:ITEM? VRMS,CHAN%i' % self._channel)
+        return self.measure(['vrms']).vrms
+
+    def measure(self, names=None, source='scope'):
+        '''
+        Make many measurements on this channel; see `measure.measure()`.
+
+        Returns:
+            `measure.Measurement`: The measurements, by name.
+        '''
+        return self._osc.measure(names, [self._channel], source)[self._channel]
 
     def select_channel(self):
         self._osc.write(':MEAS:SOUR CHAN%i' % self._channel)
@@ -137,7 +119,8 @@ class _Rigol1054zChannel:
         }
         return pre_dict
 
-    def get_data(self, mode='norm', filename=None):
+    def get_data(self, mode='norm', filename=None, dtype='float64', fmt=None,
+                 keep_data=True, sinks=(), out=None):
         '''
         Download the captured voltage points from the oscilloscope.
 
@@ -146,54 +129,64 @@ class _Rigol1054zChannel:
                 downloaded, and 'raw' if all the points the ADC has captured
                 should be downloaded.  Default is 'norm'.
             filename (None, str): Filename the data should be saved to.  Default
-                is `None`; the data is not saved to a file.
+                is `None`; the data is not saved to a file.  The data is
+                written block by block as it is downloaded.
+            fmt (None, str): File format; 'csv', 'raw' (uint8 codes plus a
+                JSON preamble sidecar), 'npy', 'npz' or 'hdf5'.  Default is
+                `None`; chosen from the extension of `filename`, falling
+                back to 'csv'.  See `writers.make_writer()`.
+            keep_data (bool): Keep the downloaded data in memory.  If `False`
+                the data is only written to `filename` and `None` is
+                returned in place of the voltages.  Default is `True`.
+            dtype (str, numpy.dtype): Float type the voltages are converted
+                to, e.g. 'float32' to halve their memory.  Default is
+                'float64'.
+            sinks (list): More objects given each block as it arrives, e.g.
+                decimators from `decimate` for a reduced view of a deep
+                capture.  Default is none.
+            out (None, numpy.ndarray, `shm.SharedBuffer`, `shm.MemmapBuffer`):
+                Where to download the codes, e.g. shared memory other
+                processes can attach to; see `shm.allocate()`.  Default is
+                `None`; a new array.
 
         Returns:
-            2-tuple: A tuple of two lists.  The first list is the time values
-                and the second list is the voltage values.
+            2-tuple: The time values as a `TimeAxis` and the voltage values.
+                The time axis is relative to the trigger.  The voltages
+                are a `Waveform` holding the raw 8-bit codes; they are only
+                converted to volts when indexed, used with NumPy or when
+                `volts()` is called.
 
         '''
         assert mode in ('norm', 'raw')
 
         # Setup scope
-        self._osc._write(':stop')
-        self._osc._write(':wav:sour chan%i' % self._channel)
-        self._osc._write(':wav:mode %s' % mode)
-        self._osc._write(':wav:form byte')
-
-        info = self.get_data_premable()
-
-        max_num_pts = 250000
-        num_blocks = info['points'] // max_num_pts
-        last_block_pts = info['points'] % max_num_pts
-
-        datas = []
-        for i in tqdm.tqdm(range(num_blocks+1), ncols=60):
-            if i < num_blocks:
-                self._osc._write(':wav:star %i' % (1+i*250000))
-                self._osc._write(':wav:stop %i' % (250000*(i+1)))
-            else:
-                if last_block_pts:
-                    self._osc._write(':wav:star %i' % (1+num_blocks*250000))
-                    self._osc._write(':wav:stop %i' % (num_blocks*250000+last_block_pts))
-                else:
-                    break
-            data = self._osc._ask_raw(':wav:data?')[11:]
-            data = np.frombuffer(data, 'B')
-            datas.append(data)
-
-        datas = np.concatenate(datas)
-        v = (datas - info['yorigin'] - info['yreference']) * info['yincrement']
-
-        t = np.arange(0, info['points']*info['xincrement'], info['xincrement'])
-        # info['xorigin'] + info['xreference']
+        with self._osc.batch():
+            self._osc._write(':stop')
+            self._osc._write(':wav:sour chan%i' % self._channel)
+            self._osc._write(':wav:mode %s' % mode)
+            self._osc._write(':wav:form byte')
+
+            info = self.get_data_premable()
 
+        downloader = BlockDownloader(self._osc)
+        sinks = list(sinks)
         if filename:
-            try:
-                os.remove(filename)
-            except OSError:
-                pass
-            np.savetxt(filename, np.c_[t, v], '%.12e', ',')
+            sinks.append(make_writer(filename, fmt))
+        opened = []
+        try:
+            for sink in sinks:
+                sink.open(info, info['points'])
+                opened.append(sink)
+            datas = downloader.download(
+                info['points'], shm.allocate(out, (info['points'],))
+                if keep_data else None, sinks=sinks, keep=keep_data)
+        finally:
+            # Only the sinks that opened, e.g. releasing an archive's lock.
+            for sink in opened:
+                sink.close()
+
+        t = TimeAxis.from_preamble(info)
+        v = Waveform(datas, info, dtype) if keep_data else None
 
         return t, v
 
@@ -226,9 +219,7 @@ class _Rigol1054zTimebase:
         return self._osc._read()
 
     def _ask(self, cmd):
-        self._write(cmd)
-        r = self._read()
-        return r
+        return self._osc._ask(':tim%s' % cmd)
 
     def get_timebase_scale_s_div(self):
         return float(self._ask(':scal?'))
@@ -254,7 +245,7 @@ class _Rigol1054zTimebase:
         self._write(':offs %.4e' % -offset)
         return self.get_timebase_offset_s()
 
-class Rigol1054z(_Usbtmc):
+class Rigol1054z(Oscilloscope):
     '''
     Rigol 1000z USB driver.
 
@@ -267,95 +258,43 @@ class Rigol1054z(_Usbtmc):
             related to the oscilloscope trigger.
         timebase (`_Rigol1054zTimebase`): Timebase object containing functions
             related to the oscilloscope timebase.
+        completion (`Completion`): Decides how to wait for the oscilloscope
+            to finish a command.
+
+    Args:
+        completion (str, `Completion`): How to wait for the oscilloscope to
+            finish processing a command; see `completion.Completion`.
+            'sleep' restores the old fixed 0.3s delay after every command.
+            Default is 'opc'.
+        transport (None, `transport.Transport`): Connection to the
+            oscilloscope, e.g. a `SocketTransport` for LAN or a
+            `SimulatedTransport`.  Default is `None`; a DS1000z found
+            over USB using python-usbtmc.
+        serial (None, str): Serial number of the oscilloscope to open when
+            several are attached.  Default is `None`; the first found.
     '''
-    def __init__(self):
-        # If the device is rebooted, the python-usbtmc driver won't work.
-        # Somehow, by sending any command using the kernel driver, then
-        # python-usbtmc works with this scope.  The following searches
-        # the usbtmc numbers and finds the corresponding usb pid, vid
-        # and serial, and then issues a command via the kernel driver.
-        rigol_vid = '0x1ab1'
-        rigol_pid = '0x04ce'
-        usb_id_usbtmc = usbtmc_info()
-        for dev in usb_id_usbtmc:
-            if dev[0] == rigol_vid and dev[1] == rigol_pid:
-                os.system('echo *IDN? >> /dev/%s' % dev[3])
-
-        _Usbtmc.__init__(self, int(rigol_vid, 16), int(rigol_pid, 16))
-
-        self._channels = [_Rigol1054zChannel(c, self) for c in range(1,5)]
-        self.trigger = _Rigol1054zTrigger(self)
-        self.timebase = _Rigol1054zTimebase(self)
-
-    def __getitem__(self, i):
-        assert 1 <= i <= 4, 'Not a valid channel.'
-        return self._channels[i-1]
-
-    def __len__(self):
-        return len(self._channels)
-
-    def autoscale(self):
-        self._write(':aut')
-
-    def clear(self):
-        self._write(':clear')
-
-    def run(self):
-        self._write(':run')
+    # Measurement query, formatted with the item and channel number.
+    measure_query = ':meas:item? %s,chan%i'
 
-    def stop(self):
-        self._write(':stop')
+    def __init__(self, completion='opc', transport=None, serial=None):
+        if transport is None:
+            # If the device is rebooted, the python-usbtmc driver won't work.
+            # Somehow, by sending any command using the kernel driver, then
+            # python-usbtmc works with this scope.  The following finds the
+            # matching scopes and issues a command via the kernel driver.
+            rigol_vid = '0x1ab1'
+            rigol_pid = '0x04ce'
+            for dev in discovery.find(serial, vid=rigol_vid, pid=rigol_pid):
+                discovery.wake(dev)
 
-    def force(self):
-        self._write(':tfor')
+            transport = PyUsbtmcTransport(int(rigol_vid, 16), int(rigol_pid, 16),
+                                          serial)
 
-    def set_single_shot(self):
-        self._write(':sing')
+        Oscilloscope.__init__(self, transport, completion)
 
-    def get_id(self):
-        return self._ask('*IDN?')
-
-    def get_averaging(self):
-        return self._ask(':acq:aver?')
-
-    def set_averaging(self, count):
-        assert count in [2**n for n in range(1, 11)]
-        self._write(':acq:aver %i' % count)
-        return self.get_averaging()
-
-    def set_averaging_mode(self):
-        self._write(':acq:type aver')
-        return self.get_mode()
-
-    def set_normal_mode(self):
-        self._write(':acq:type norm')
-        return self.get_mode()
-
-    def set_high_resolution_mode(self):
-        self._write(':acq:type hres')
-        return self.get_mode()
-
-    def set_peak_mode(self):
-        self._write(':acq:type peak')
-        return self.get_mode()
-
-    def get_mode(self):
-        modes = {
-            'NORM': 'normal',
-            'AVER': 'averages',
-            'PEAK': 'peak',
-            'HRES': 'high_resolution'
-        }
-        return modes[self._ask(':acq:type?')]
-
-    def get_sampling_rate(self):
-        return float(self._ask(':acq:srat?'))
-
-    def get_memory_depth(self):
-        md = self._ask(':acq:mdep?')
-        if md != 'AUTO':
-           md = int(md)
-        return md
+        self._channels = [_Rigol1054zChannel(c, self) for c in range(1,5)]
+        self.trigger = _Rigol1054zTrigger(self)
+        self.timebase = _Rigol1054zTimebase(self)
 
     def set_memory_depth(self, pts):
         num_enabled_chans = sum(self.get_channels_enabled())
@@ -375,46 +314,47 @@ class Rigol1054z(_Usbtmc):
 
         return r
 
-    def get_channels_enabled(self):
-        return [c.enabled() for c in self._channels]
-
-    def selected_channel(self):
-        return self._ask(':MEAS:SOUR?')
-
-    def get_screenshot(self, filename, type='png'):
+    def get_screenshot(self, filename=None, type='png', timeout_s=10.):
         '''
         Downloads a screenshot from the oscilloscope.
 
         Args:
-            filename (str): The name of the image file.  The appropriate
+            filename (None, str, file): The name of the image file, or a
+                file-like object to write the image to.  The appropriate
                 extension should be included (i.e. jpg, png, bmp or tif).
+                Default is `None`; the image is only returned.
             type (str): The format image that should be downloaded.  Options
-                are 'jpeg, 'png', 'bmp8', 'bmp24' and 'tiff'.  It appears that
-                'jpeg' takes <3sec to download while all the other formats take
-                <0.5sec.  Default is 'png'.
+                are 'jpeg, 'png', 'bmp8', 'bmp24' and 'tiff'.  'jpeg' takes
+                the oscilloscope the longest to encode.  Default is 'png'.
+            timeout_s (float): Seconds to wait for the image.  Default is
+                10s.
 
         Returns:
-            list: Raw datastream containing the image data.
+            bytes: The image file contents.
         '''
-        self.file.timeout = 0
-        self._write(':disp:data? on,off,%s' % type)
-
         assert type in ('jpeg', 'png', 'bmp8', 'bmp24', 'tiff')
+        raw_img = screenshot.read_screenshot(
+            self, ':disp:data? on,off,%s' % type, timeout_s)
+        screenshot.save(raw_img, filename)
+        return raw_img
+
+    def screenshot_stream(self, type='png', period_s=0., max_frames=None):
+        '''
+        Take screenshots repeatedly, e.g. to mirror the screen.
 
-        if type == 'jpeg':
-            s = 3
-        elif type == 'png':
-            s = 0.5
-        elif type == 'bmp8':
-            s = 0.5
-        elif type == 'bmp24':
-            s = 0.5
-        elif type == 'tiff':
-            s = 0.5
-        time.sleep(s)
-        raw_img = self._read_raw(3850780)[11:-4]
-
-        with open(filename, 'wb') as fs:
-            fs.write(raw_img)
+            for t, image in osc.screenshot_stream('png', period_s=0.2):
+                show(image)
 
-        return raw_img
+        Args:
+            type (str): Image format; see `get_screenshot()`.  Default is
+                'png'.
+            period_s (float): Minimum seconds between screenshots.  Default
+                is 0; as fast as the oscilloscope allows.
+            max_frames (None, int): Stop after this many screenshots.
+                Default is `None`; never stop.
+
+        Returns:
+            generator: `(timestamp, image bytes)` tuples.
+        '''
+        return Oscilloscope.screenshot_stream(self, period_s, max_frames,
+                                              type=type)
@@ -1,71 +1,12 @@
-import time
 import os
-import numpy as np
-import tqdm
-from usb_usbtmc_info import usbtmc_info
-
-class _Usbtmc(object):
-    '''
-    Basic read/write interface to USBTMC _devices.
-
-    The PM100USB is USBTMC complant, so this class
-    allows low level communication to it.
-
-    Args:
-        usbtmc_dev_number (int): USBTMC device number the
-            power meter is.
-    '''
-    def __init__(self, usbtmc_dev_number):
-        usbtmc = '/dev/usbtmc' + str(usbtmc_dev_number)
-        self._dev = os.open(usbtmc, os.O_RDWR)
-
-    def _write(self, command):
-        '''
-        Send a string to the USBTMC device.
-
-        Args:
-            command (str): String to send.
-        '''
-        os.write(self._dev, str.encode(command))
-
-    def _read(self, number_of_characters=100):
-        '''
-        Read a string from the USBTMC device.
-
-        Args:
-            number_of_characters (int): Maximum number of
-                characters to read.
-
-        Returns:
-            str: Response from the USBTMC device.
-        '''
-        resp = os.read(self._dev, number_of_characters).decode().strip()
-        return resp
-
-    def _read_raw(self, number_of_characters=100):
-        resp = os.read(self._dev, number_of_characters)
-        return resp
-
-    def _ask(self, command, number_of_characters=100):
-        '''
-        Write to, and then read from the USBTMC device.
-
-        Args:
-            command (str): String to send.
-            number_of_characters (int): Maximum number of
-                characters to read.
-
-        Returns:
-            str: Response from the USBTMC device.
-        '''
-        self._write(command)
-        resp = self._read(number_of_characters)
-        return resp
-
-    def _ask_raw(self, command, number_of_characters=100):
-        self._write(command)
-        resp = self._read_raw(number_of_characters)
-        return resp
+import shm
+import screenshot
+import discovery
+from transport import KernelUsbtmcTransport
+from download import BlockDownloader
+from waveform import Waveform, TimeAxis
+from writers import make_writer
+from oscilloscope import Oscilloscope
 
 class _Rigol2072aChannel:
     def __init__(self, channel, osc):
@@ -79,14 +20,19 @@ class _Rigol2072aChannel:
         return self._osc._read()
 
     def _ask(self, cmd):
-        self._write(cmd)
-        r = self._read()
-        return r
+        return self._osc._ask(':chan%i%s' % (self._channel, cmd))
 
     def get_voltage_rms_V(self):
-        channel = int(channel)
-        assert 1 <= channel <= 4, 'Invalid channel.'
-        return self._osc.ask(':MEAS:ITEM? VRMS,CHAN%i' % channel)
+        return self.measure(['vrms']).vrms
+
+    def measure(self, names=None, source='scope'):
+        '''
+        Make many measurements on this channel; see `measure.measure()`.
+
+        Returns:
+            `measure.Measurement`: The measurements, by name.
+        '''
+        return self._osc.measure(names, [self._channel], source)[self._channel]
 
     def select_channel(self):
         self._osc.write(':MEAS:SOUR CHAN%i' % self._channel)
@@ -168,54 +114,71 @@ class _Rigol2072aChannel:
         }
         return pre_dict
 
-    def get_data(self, mode='norm', filename=None):
+    def get_data(self, mode='norm', filename=None, dtype='float64', fmt=None,
+                 keep_data=True, sinks=(), out=None):
+        '''
+        Download the captured voltage points from the oscilloscope.
+
+        Args:
+            mode (str): 'norm' if only the points on the screen should be
+                downloaded, and 'raw' if all the points the ADC has captured
+                should be downloaded.  Default is 'norm'.
+            filename (None, str): Filename the data should be saved to.  Default
+                is `None`; the data is not saved to a file.  The data is
+                written block by block as it is downloaded.
+            fmt (None, str): File format; 'csv', 'raw' (uint8 codes plus a
+                JSON preamble sidecar), 'npy', 'npz' or 'hdf5'.  Default is
+                `None`; chosen from the extension of `filename`, falling
+                back to 'csv'.  See `writers.make_writer()`.
+            keep_data (bool): Keep the downloaded data in memory.  If `False`
+                the data is only written to `filename` and `None` is
+                returned in place of the voltages.  Default is `True`.
+            dtype (str, numpy.dtype): Float type the voltages are converted
+                to.  Default is 'float64'.
+            sinks (list): More objects given each block as it arrives, e.g.
+                decimators from `decimate` for a reduced view of a deep
+                capture.  Default is none.
+            out (None, numpy.ndarray, `shm.SharedBuffer`, `shm.MemmapBuffer`):
+                Where to download the codes, e.g. shared memory other
+                processes can attach to; see `shm.allocate()`.  Default is
+                `None`; a new array.
+
+        Returns:
+            2-tuple: The time values as a `TimeAxis`, relative to the
+                trigger, and the voltage values as a `Waveform`.
+        '''
         assert mode in ('norm', 'raw')
 
         # Setup scope
-        self._osc._write(':wav:sour chan%i' % self._channel)
-        self._osc._write(':wav:mode %s' % mode)
-        self._osc._write(':wav:form byte')
+        with self._osc.batch():
+            self._osc._write(':wav:sour chan%i' % self._channel)
+            self._osc._write(':wav:mode %s' % mode)
+            self._osc._write(':wav:form byte')
 
-        info = self.get_data_premable()
+            info = self.get_data_premable()
 
         if mode == 'raw':
             self._osc._write(':stop')
-            max_num_pts = 1800000 # Reading more than this results in the 5sec USBTMC kernel driver.
-            num_blocks = info['points'] // max_num_pts
-            last_block_pts = info['points'] % max_num_pts
-
-            datas = []
-            for i in tqdm.tqdm(range(num_blocks+1), ncols=60):
-                if i < num_blocks:
-                    self._osc._write(':wav:star %i' % (1+i*max_num_pts))
-                    self._osc._write(':wav:stop %i' % (max_num_pts*(i+1)))
-                else:
-                    if last_block_pts:
-                        self._osc._write(':wav:star %i' % (1+num_blocks*max_num_pts))
-                        self._osc._write(':wav:stop %i' % (num_blocks*max_num_pts+last_block_pts))
-                    else:
-                        break
-                data = self._osc._ask_raw(':wav:data?', max_num_pts+10000)[11:]
-                data = np.frombuffer(data, 'B')
-                datas.append(data)
-            datas = np.concatenate(datas)
-        elif mode == 'norm':
-            self._osc._write(':wav:star 1')
-            self._osc._write(':wav:stop 1400')
-            data = self._osc._ask_raw(':wav:data?', 1500)
-            datas = np.frombuffer(data, 'B')
-
-        v = (datas - info['yorigin'] - info['yreference']) * info['yincrement']
-
-        t = np.linspace(0, info['points']*info['xincrement'], v.size)
-        # info['xorigin'] + info['xreference']
 
+        downloader = BlockDownloader(self._osc)
+        sinks = list(sinks)
         if filename:
-            try:
-                os.remove(filename)
-            except OSError:
-                pass
-            np.savetxt(filename, np.c_[t, v], '%.12e', ',')
+            sinks.append(make_writer(filename, fmt))
+        opened = []
+        try:
+            for sink in sinks:
+                sink.open(info, info['points'])
+                opened.append(sink)
+            datas = downloader.download(
+                info['points'], shm.allocate(out, (info['points'],))
+                if keep_data else None, sinks=sinks, keep=keep_data)
+        finally:
+            # Only the sinks that opened, e.g. releasing an archive's lock.
+            for sink in opened:
+                sink.close()
+
+        t = TimeAxis.from_preamble(info)
+        v = Waveform(datas, info, dtype) if keep_data else None
 
         return t, v
 
@@ -248,9 +211,7 @@ class _Rigol2072aTimebase:
         return self._osc._read()
 
     def _ask(self, cmd):
-        self._write(cmd)
-        r = self._read()
-        return r
+        return self._osc._ask(':tim%s' % cmd)
 
     def get_timebase_scale_s_div(self):
         return float(self._ask(':scal?'))
@@ -276,91 +237,41 @@ class _Rigol2072aTimebase:
         self._write(':offs %.4e' % -offset)
         return self.get_timebase_offset_s()
 
-class Rigol2072a(_Usbtmc):
-    def __init__(self):
-        rigol_vid = '0x1ab1'
-        rigol_pid = '0x04b0'
-        usb_id_usbtmc = usbtmc_info()
-        for dev in usb_id_usbtmc:
-            if dev[0] == rigol_vid and dev[1] == rigol_pid:
-                usbtmc_num = dev[3][-1]
-                break
-
-        _Usbtmc.__init__(self, usbtmc_num)
-
-        self._channels = [_Rigol2072aChannel(c, self) for c in range(1,3)]
-        self.trigger = _Rigol2072aTrigger(self)
-        self.timebase = _Rigol2072aTimebase(self)
-
-    def __getitem__(self, i):
-        assert 1 <= i <= 4, 'Not a valid channel.'
-        return self._channels[i-1]
-
-    def __len__(self):
-        return len(self._channels)
-
-    def autoscale(self):
-        self._write(':aut')
-
-    def clear(self):
-        self._write(':clear')
-
-    def run(self):
-        self._write(':run')
-
-    def stop(self):
-        self._write(':stop')
-
-    def force(self):
-        self._write(':tfor')
-
-    def set_single_shot(self):
-        self._write(':sing')
-
-    def get_id(self):
-        return self._ask('*IDN?')
-
-    def get_averaging(self):
-        return self._ask(':acq:aver?')
-
-    def set_averaging(self, count):
-        assert count in [2**n for n in range(1, 11)]
-        self._write(':acq:aver %i' % count)
-        return self.get_averaging()
-
-    def set_averaging_mode(self):
-        self._write(':acq:type aver')
-        return self.get_mode()
+class Rigol2072a(Oscilloscope):
+    '''
+    Rigol 2000a USB driver.
 
-    def set_normal_mode(self):
-        self._write(':acq:type norm')
-        return self.get_mode()
+    Args:
+        completion (str, `Completion`): How to wait for the oscilloscope to
+            finish processing a command; see `completion.Completion`.
+            Default is 'none'.
+        transport (None, `transport.Transport`): Connection to the
+            oscilloscope.  Default is `None`; a DS2000a found using the
+            kernel USBTMC driver.
+        serial (None, str): Serial number of the oscilloscope to open when
+            several are attached.  Default is `None`; the first found.
+    '''
+    # Reading more than this results in the 5sec USBTMC kernel driver
+    # timeout.
+    block_pts = 1800000
 
-    def set_high_resolution_mode(self):
-        self._write(':acq:type hres')
-        return self.get_mode()
+    # Measurement query, formatted with the item and channel number.
+    measure_query = ':meas:%s? chan%i'
 
-    def set_peak_mode(self):
-        self._write(':acq:type peak')
-        return self.get_mode()
+    def __init__(self, completion='none', transport=None, serial=None):
+        if transport is None:
+            rigol_vid = '0x1ab1'
+            rigol_pid = '0x04b0'
+            dev = discovery.find_one(serial, vid=rigol_vid, pid=rigol_pid)
+            usbtmc_num = dev.usbtmc[len('usbtmc'):]
 
-    def get_mode(self):
-        modes = {
-            'NORM': 'normal',
-            'AVER': 'averages',
-            'PEAK': 'peak',
-            'HRES': 'high_resolution'
-        }
-        return modes[self._ask(':acq:type?')]
+            transport = KernelUsbtmcTransport(usbtmc_num)
 
-    def get_sampling_rate(self):
-        return float(self._ask(':acq:srat?'))
+        Oscilloscope.__init__(self, transport, completion)
 
-    def get_memory_depth(self):
-        md = self._ask(':acq:mdep?')
-        if md != 'AUTO':
-           md = int(md)
-        return md
+        self._channels = [_Rigol2072aChannel(c, self) for c in range(1,3)]
+        self.trigger = _Rigol2072aTrigger(self)
+        self.timebase = _Rigol2072aTimebase(self)
 
     def set_memory_depth(self, pts):
         num_enabled_chans = sum(self.get_channels_enabled())
@@ -381,21 +292,25 @@ class Rigol2072a(_Usbtmc):
             r = self._write(':acq:mdep %s' % pts)
         return r
 
-    def get_channels_enabled(self):
-        return [c.enabled() for c in self._channels]
-
-    def selected_channel(self):
-        return self._ask(':MEAS:SOUR?')
-
-    def get_screenshot(self, filename):
-        fn, _ = os.path.splitext(filename)
-        filename = fn + '.bmp'
+    def get_screenshot(self, filename=None, timeout_s=10.):
+        '''
+        Downloads a bmp screenshot from the oscilloscope.
 
-        self._write(':disp:data?')
-        time.sleep(0.3)
-        raw_img = self._read_raw(3850780)[11:-4]
+        Args:
+            filename (None, str, file): The name of the image file, whose
+                extension is replaced by '.bmp', or a file-like object to
+                write the image to.  Default is `None`; the image is only
+                returned.
+            timeout_s (float): Seconds to wait for the image.  Default is
+                10s.
 
-        with open(filename, 'wb') as fs:
-            fs.write(raw_img)
+        Returns:
+            bytes: The image file contents.
+        '''
+        if isinstance(filename, str):
+            fn, _ = os.path.splitext(filename)
+            filename = fn + '.bmp'
 
+        raw_img = screenshot.read_screenshot(self, ':disp:data?', timeout_s)
+        screenshot.save(raw_img, filename)
         return raw_img
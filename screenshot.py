@@ -0,0 +1,73 @@
+import time
+from download import read_block, parse_block_header
+
+def read_screenshot(osc, query, timeout_s=10.):
+    '''
+    Ask for a screenshot and read exactly the image the oscilloscope sends.
+
+    The image is a definite length block; its header gives the image size,
+    and the image is read in as many transfers as needed instead of after
+    a fixed sleep.  The oscilloscope can take a few seconds to encode the
+    image, so the transport timeout is raised to `timeout_s` meanwhile.
+
+    Args:
+        osc: The oscilloscope.
+        query (str): The screenshot query, e.g. ':disp:data? on,off,png'.
+        timeout_s (float): Seconds to wait for the image.  Default is 10s.
+
+    Returns:
+        bytes: The image file contents.
+    '''
+    timeout = osc.timeout_s
+    if timeout is not None and timeout < timeout_s:
+        osc.timeout_s = timeout_s
+    try:
+        raw, head = read_block(osc._ask_raw, osc._read_raw, query)
+    finally:
+        if osc.timeout_s != timeout:
+            osc.timeout_s = timeout
+    _, length = parse_block_header(raw)
+    return raw[head:head+length]
+
+def save(image, filename):
+    '''
+    Write an image to a file.
+
+    Args:
+        image (bytes): The image.
+        filename (None, str, file): File name, or file-like object with a
+            `write()` method, e.g. `io.BytesIO`.  `None` does nothing.
+    '''
+    if filename is None:
+        return
+    if hasattr(filename, 'write'):
+        filename.write(image)
+        return
+    with open(filename, 'wb') as fs:
+        fs.write(image)
+
+def stream(grab, period_s=0., max_frames=None):
+    '''
+    Take screenshots repeatedly.
+
+    Args:
+        grab (callable): Returns one screenshot.
+        period_s (float): Minimum seconds between the starts of two
+            screenshots.  Default is 0; as fast as the oscilloscope allows.
+        max_frames (None, int): Stop after this many screenshots.  Default
+            is `None`; never stop.
+
+    Yields:
+        2-tuple: `time.time()` when the screenshot was asked for, and the
+            image.
+    '''
+    count = 0
+    t_next = time.perf_counter()
+    while max_frames is None or count < max_frames:
+        delay = t_next - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        t_next = max(t_next + period_s, time.perf_counter())
+        timestamp = time.time()
+        yield timestamp, grab()
+        count += 1
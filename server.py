@@ -0,0 +1,457 @@
+import os
+import io
+import stat
+import errno
+import pickle
+import socket
+import struct
+import argparse
+import threading
+import contextlib
+import collections
+import socketserver
+import numpy as np
+import fleet
+import shm
+
+# Arrays at least this large are handed over through shared memory
+# instead of through the socket.
+shm_threshold_bytes = 1 << 16
+
+def default_path():
+    '''
+    The server's socket: `$XDG_RUNTIME_DIR/rigol.sock`, or
+    `/tmp/rigol-<uid>.sock`.
+    '''
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime:
+        return os.path.join(runtime, 'rigol.sock')
+    return '/tmp/rigol-%i.sock' % os.getuid()
+
+class FairLock(object):
+    '''
+    A lock granted in the order it was asked for.
+
+    Each client has at most one request outstanding, so first come first
+    served gives every client its turn; a busy client cannot starve the
+    others as it can with `threading.Lock`.
+    '''
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._queue = collections.deque()
+        self._owner = None
+
+    def acquire(self, owner):
+        with self._cond:
+            if self._owner == owner:
+                return
+            ticket = object()
+            self._queue.append(ticket)
+            self._cond.wait_for(lambda: self._owner is None and
+                                self._queue[0] is ticket)
+            self._queue.popleft()
+            self._owner = owner
+
+    def release(self, owner):
+        with self._cond:
+            if self._owner == owner:
+                self._owner = None
+                self._cond.notify_all()
+
+    @property
+    def owner(self):
+        return self._owner
+
+def _send(sock, data):
+    sock.sendall(struct.pack('<Q', len(data)) + data)
+
+def _recv_exactly(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if not n:
+            raise EOFError('Connection closed.')
+        received += n
+    return bytes(buf)
+
+def _recv(sock):
+    size, = struct.unpack('<Q', _recv_exactly(sock, 8))
+    return _recv_exactly(sock, size)
+
+def _remove_stale(path):
+    # The socket of a server that died, but nothing else: not a live
+    # server's socket, nor a file that merely has the same name.
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if stat.S_ISSOCK(mode):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            os.unlink(path)
+            return
+        finally:
+            probe.close()
+    raise OSError(errno.EADDRINUSE, 'Address already in use', path)
+
+def _address(array):
+    return array.__array_interface__['data'][0]
+
+class _ShmPickler(pickle.Pickler):
+    # Large arrays go through shared memory; only the block's name goes
+    # through the socket.  Arrays downloaded into a `shm.SharedBuffer` are
+    # not even copied.
+    def __init__(self, fs, protocol, created):
+        pickle.Pickler.__init__(self, fs, protocol)
+        self._copies = {}
+        self._created = created
+
+    def persistent_id(self, obj):
+        if type(obj) is not np.ndarray or obj.nbytes < shm_threshold_bytes \
+                or obj.dtype.hasobject or not obj.flags.c_contiguous:
+            return None
+        found = shm.shared_name(obj)
+        if found is None:
+            # Views of one array, e.g. the rows of a `WaveformSet`, share
+            # one copy.
+            root = obj
+            while isinstance(root.base, np.ndarray) and \
+                    root.base.flags.c_contiguous:
+                root = root.base
+            if id(root) not in self._copies:
+                self._copies[id(root)] = (root, shm.share(root))
+            name, offset, created = self._copies[id(root)][1]
+            found = (name, offset + _address(obj) - _address(root), created)
+        name, offset, created = found
+        if created:
+            self._created.add(name)
+        return ('shm', name, offset, obj.shape, obj.dtype.str, created)
+
+class _ShmUnpickler(pickle.Unpickler):
+    def __init__(self, fs):
+        pickle.Unpickler.__init__(self, fs)
+        self.created = set()
+
+    def persistent_load(self, pid):
+        kind, name, offset, shape, dtype, created = pid
+        assert kind == 'shm', 'Unknown persistent object.'
+        if created:
+            # Blocks the server created are handed over to the client.
+            self.created.add(name)
+        return shm.attach_array(name, shape, dtype, offset)
+
+def _dumps(obj, created):
+    '''
+    Pickle a response, handing large arrays over through shared memory.
+
+    Args:
+        obj: The response.
+        created (set): The names of the blocks handed over to the client,
+            which unlinks them, are added to this.  If pickling fails they
+            are unlinked straight away.
+
+    Returns:
+        bytes: The pickle.
+    '''
+    fs = io.BytesIO()
+    try:
+        _ShmPickler(fs, pickle.HIGHEST_PROTOCOL, created).dump(obj)
+    except Exception:
+        for name in created:
+            shm.unlink(name)
+        raise
+    return fs.getvalue()
+
+def _loads(data):
+    unpickler = _ShmUnpickler(io.BytesIO(data))
+    try:
+        return unpickler.load()
+    finally:
+        # The arrays stay mapped; the memory is freed with them.
+        for name in unpickler.created:
+            shm.unlink(name)
+
+def _error(e):
+    # The client must always get an answer, even for an exception that
+    # cannot be pickled, e.g. one holding a lock.
+    try:
+        response = pickle.dumps(('error', e), pickle.HIGHEST_PROTOCOL)
+        pickle.loads(response)
+    except Exception:
+        e = RuntimeError('%s: %s' % (type(e).__name__, e))
+        response = pickle.dumps(('error', e), pickle.HIGHEST_PROTOCOL)
+    return response
+
+class ScopeServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    '''
+    Shares oscilloscopes between processes over a Unix socket.
+
+    The server keeps one open connection to each oscilloscope, opened on
+    first use and kept warm afterwards, so clients pay neither discovery
+    nor USB setup.  Every call is run with the oscilloscope's `FairLock`
+    held, so exchanges of different clients never interleave and clients
+    are served in turn.  A client can hold an oscilloscope across several
+    calls with `ScopeClient.session()`.
+
+    Results are pickled back to the client, except large NumPy arrays
+    (e.g. the codes of a `Waveform`) which are handed over through shared
+    memory.  Downloads given `out=shm.SharedBuffer()` go straight into
+    shared memory and reach the client without any copy.
+
+    The socket is only accessible to the user running the server, since
+    requests are pickles.
+
+    Args:
+        path (None, str): Socket path.  Default is `None`; `default_path()`.
+        scopes (None, dict): Drivers keyed by serial number.  Default is
+            `None`; attached oscilloscopes are opened when first used.
+        **kwargs: Passed on to the drivers opened, e.g. `completion`.
+    '''
+    daemon_threads = True
+
+    def __init__(self, path=None, scopes=None, **kwargs):
+        self.path = path or default_path()
+        _remove_stale(self.path)
+        self._fixed = scopes is not None
+        self.scopes = dict(scopes or {})
+        self.locks = {}
+        self._locks_lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._kwargs = kwargs
+        # Only the user may connect, from the moment the socket exists.
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, self.path, _Handler)
+        finally:
+            os.umask(umask)
+
+    def lock(self, serial):
+        '''
+        The `FairLock` of an oscilloscope; every client gets the same one.
+        '''
+        with self._locks_lock:
+            lock = self.locks.get(serial)
+            if lock is None:
+                lock = self.locks[serial] = FairLock()
+            return lock
+
+    def serials(self):
+        if self._fixed:
+            return sorted(self.scopes)
+        return sorted(set(self.scopes) | set(fleet.find_scopes()))
+
+    def scope(self, serial=None):
+        '''
+        The driver of an oscilloscope, opening it if needed.
+
+        Args:
+            serial (None, str): Serial number.  Default is `None`; the first
+                oscilloscope.
+        '''
+        if serial is None:
+            serials = self.serials()
+            assert serials, 'No oscilloscope attached.'
+            serial = serials[0]
+        with self._open_lock:
+            osc = self.scopes.get(serial)
+            if osc is None:
+                assert not self._fixed, 'Oscilloscope %s not served.' % serial
+                found = fleet.find_scopes()
+                assert serial in found, 'Oscilloscope %s not found.' % serial
+                osc = found[serial](serial=serial, **self._kwargs)
+                self.scopes[serial] = osc
+        return serial, osc
+
+    def call(self, serial, path, args, kwargs):
+        serial, obj = self.scope(serial)
+        for kind, key in path:
+            if kind == 'item':
+                obj = obj[key]
+            else:
+                assert not key.startswith('__'), 'Not an accessible attribute.'
+                obj = getattr(obj, key)
+        if callable(obj):
+            return obj(*args, **kwargs)
+        return obj
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        for osc in self.scopes.values():
+            osc.close()
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        held = set()
+        # Blocks handed over with the last response, until the client has
+        # claimed them by sending its next request.
+        unclaimed = set()
+        try:
+            while True:
+                try:
+                    request = pickle.loads(_recv(self.request))
+                except EOFError:
+                    return
+                unclaimed = set()
+                op, serial = request[:2]
+                try:
+                    if serial is None and op != 'serials':
+                        serial = server.scope(None)[0]
+                    if op == 'serials':
+                        result = server.serials()
+                    elif op == 'acquire':
+                        server.lock(serial).acquire(self)
+                        held.add(serial)
+                        result = None
+                    elif op == 'release':
+                        server.lock(serial).release(self)
+                        held.discard(serial)
+                        result = None
+                    else:
+                        path, args, kwargs = request[2:]
+                        lock = server.lock(serial)
+                        session = lock.owner is self
+                        lock.acquire(self)
+                        try:
+                            result = server.call(serial, path, args, kwargs)
+                        finally:
+                            if not session:
+                                lock.release(self)
+                    response = _dumps(('ok', result), unclaimed)
+                except Exception as e:
+                    response = _error(e)
+                _send(self.request, response)
+        finally:
+            for name in unclaimed:
+                shm.unlink(name)
+            for serial in held:
+                server.lock(serial).release(self)
+
+class _Remote(object):
+    def __init__(self, client, serial, path=()):
+        self._client = client
+        self._serial = serial
+        self._path = path
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return _Remote(self._client, self._serial,
+                       self._path + (('attr', name),))
+
+    def __getitem__(self, key):
+        return _Remote(self._client, self._serial,
+                       self._path + (('item', key),))
+
+    def __call__(self, *args, **kwargs):
+        return self._client.call(self._serial, self._path, args, kwargs)
+
+    def __repr__(self):
+        return '_Remote(%r, %r)' % (self._serial, self._path)
+
+class ScopeClient(object):
+    '''
+    Connection to a `ScopeServer`.
+
+        client = ScopeClient()
+        osc = client.scope()
+        t, v = osc[1].get_data('raw')
+        with client.session():
+            osc.stop()
+            ws = osc.get_data_multi()
+
+    Args:
+        path (None, str): Socket path.  Default is `None`; `default_path()`.
+    '''
+    def __init__(self, path=None):
+        self.path = path or default_path()
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(self.path)
+        self._lock = threading.Lock()
+
+    def _request(self, request):
+        with self._lock:
+            _send(self._sock, pickle.dumps(request, pickle.HIGHEST_PROTOCOL))
+            status, value = _loads(_recv(self._sock))
+        if status == 'error':
+            raise value
+        return value
+
+    def serials(self):
+        '''
+        Returns:
+            list: Serial numbers of the oscilloscopes served.
+        '''
+        return self._request(('serials', None))
+
+    def scope(self, serial=None):
+        '''
+        A proxy for a served oscilloscope: calling any method of it, its
+        channels, `trigger` or `timebase` runs the call on the server.
+
+        Args:
+            serial (None, str): Serial number.  Default is `None`; the first
+                oscilloscope.
+        '''
+        return _Remote(self, serial)
+
+    def call(self, serial, path, args=(), kwargs=None):
+        return self._request(('call', serial, tuple(path), tuple(args),
+                              kwargs or {}))
+
+    @contextlib.contextmanager
+    def session(self, serial=None):
+        '''
+        Hold an oscilloscope for several calls, so no other client's calls
+        come in between.
+
+        Args:
+            serial (None, str): Serial number.  Default is `None`; the first
+                oscilloscope.
+        '''
+        self._request(('acquire', serial))
+        try:
+            yield self.scope(serial)
+        finally:
+            self._request(('release', serial))
+
+    def close(self):
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Share the attached Rigol oscilloscopes between processes.')
+    parser.add_argument('--path', help='Socket path.')
+    parser.add_argument('--simulate', nargs='*', metavar='MODEL',
+                        help='Serve simulated oscilloscopes instead.')
+    args = parser.parse_args(argv)
+
+    scopes = None
+    if args.simulate is not None:
+        import simulator
+        scopes = {}
+        for i, model in enumerate(args.simulate or ['DS1054Z']):
+            serial = 'SIM%04i' % i
+            scopes[serial] = simulator.connect(model, serial=serial)
+    server = ScopeServer(args.path, scopes)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+import os
+import mmap
+import uuid
+import weakref
+import collections
+import numpy as np
+from waveform import Waveform, WaveformSet
+
+# POSIX shared memory; blocks here are the blocks of
+# `multiprocessing.shared_memory.SharedMemory` with the same name.
+shm_dir = '/dev/shm/'
+
+Handle = collections.namedtuple(
+    'Handle', 'kind location shape channels preambles dtype')
+Handle.__doc__ = '''
+Describes a capture held in shared memory or in a memory-mapped file, so
+another process can `attach()` to it without copying.  Small and
+picklable.
+
+Attributes:
+    kind (str): 'shm' or 'memmap'.
+    location (str): Shared memory block name or file name.
+    shape (tuple): Shape of the uint8 codes; `(points,)` for one channel,
+        `(channels, points)` for several.
+    channels (None, list): Channel numbers of the rows, or `None` for one
+        channel.
+    preambles (list): The preamble of each channel.
+    dtype (str): Float type volts are returned as.
+'''
+
+# Maps of the blocks this module has mapped, so `shared_name()` can find
+# the block behind an array.
+_blocks = weakref.WeakValueDictionary()
+
+class _Map(mmap.mmap):
+    # mmap itself cannot be weakly referenced.
+    pass
+
+def _open(name, size=None):
+    path = shm_dir + name
+    if size is None:
+        fd = os.open(path, os.O_RDWR)
+    else:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_RDWR, 0o600)
+    try:
+        if size is None:
+            size = os.fstat(fd).st_size
+        else:
+            os.ftruncate(fd, size)
+        return _Map(fd, max(size, 1))
+    finally:
+        os.close(fd)
+
+def _view(mm, shape, dtype='B', offset=0):
+    dtype = np.dtype(dtype)
+    count = int(np.prod(shape))
+    return np.frombuffer(mm, dtype, count, offset).reshape(shape)
+
+def create(nbytes):
+    '''
+    Create a shared memory block.
+
+    Args:
+        nbytes (int): Size of the block.
+
+    Returns:
+        2-tuple: The block's name and its map.
+    '''
+    name = 'rigol-%s' % uuid.uuid4().hex
+    mm = _open(name, nbytes)
+    _register(mm, name, True)
+    return name, mm
+
+def _register(mm, name, created):
+    mm.name = name
+    mm.created = created
+    _blocks[id(mm)] = mm
+
+def unlink(name):
+    '''
+    Remove a shared memory block's name.  The memory is freed once no
+    process maps it any more.
+    '''
+    try:
+        os.unlink(shm_dir + name)
+    except FileNotFoundError:
+        pass
+
+def shared_name(array):
+    '''
+    The shared memory block behind an array, if it is mapped by this
+    module.
+
+    Args:
+        array (numpy.ndarray): A C-contiguous array or view.
+
+    Returns:
+        None, 3-tuple: The block's name, the array's offset in it, and
+            whether this process created the block.
+    '''
+    base = array
+    while isinstance(base, np.ndarray):
+        base = base.base
+    if isinstance(base, memoryview):
+        base = base.obj
+    if base is None or _blocks.get(id(base)) is not base \
+            or not array.flags.c_contiguous:
+        return None
+    start = np.frombuffer(base, 'B', 1).__array_interface__['data'][0]
+    return base.name, array.__array_interface__['data'][0] - start, base.created
+
+def share(array):
+    '''
+    An array in shared memory: the array itself if it already is in a
+    block mapped by this process, else a copy in a new block.
+
+    Args:
+        array (numpy.ndarray): The array.
+
+    Returns:
+        3-tuple: The block's name, the array's offset in it, and whether
+            this process created the block.
+    '''
+    found = shared_name(array)
+    if found is not None:
+        return found
+    name, mm = create(array.nbytes)
+    _view(mm, array.shape, array.dtype)[...] = array
+    return name, 0, True
+
+def attach_array(name, shape, dtype='B', offset=0):
+    '''
+    Map an array from a shared memory block.
+
+    Args:
+        name (str): The block's name.
+        shape (tuple): Shape of the array.
+        dtype (str, numpy.dtype): Its dtype.  Default is uint8.
+        offset (int): Its offset in bytes.  Default is 0.
+
+    Returns:
+        numpy.ndarray: The array; the memory stays mapped as long as it is
+            referenced.
+    '''
+    return _view(_open(name), shape, dtype, offset)
+
+class SharedBuffer(object):
+    '''
+    Downloads into shared memory.
+
+    Given as `out` to `get_data()` or `get_data_multi()`, the codes are
+    downloaded straight into a shared memory block, and `handle()` then
+    describes the capture so worker processes can `attach()` to it
+    without the codes being pickled or copied.
+
+        buf = shm.SharedBuffer()
+        ws = osc.get_data_multi(mode='raw', out=buf)
+        h = buf.handle(ws)
+        pool.map(analyse, [h]*n)          # each worker calls shm.attach(h)
+        buf.unlink()
+
+    Args:
+        name (None, str): Name of an existing block to download into, e.g.
+            the `name` of a `multiprocessing.shared_memory.SharedMemory`.
+            It must be large enough.  Default is `None`; a block of the
+            right size is created when the download starts.
+
+    Attributes:
+        name (str): The block's name.
+        array (numpy.ndarray): The codes downloaded.
+    '''
+    def __init__(self, name=None):
+        self.name = name
+        self.array = None
+        self._created = False
+
+    def allocate(self, shape):
+        '''
+        Returns:
+            numpy.ndarray: A uint8 array of `shape` in the block.
+        '''
+        nbytes = int(np.prod(shape))
+        if self.name is None:
+            self.name, mm = create(nbytes)
+            self._created = True
+        else:
+            mm = _open(self.name)
+            assert len(mm) >= nbytes, 'Shared memory block too small.'
+            _register(mm, self.name, False)
+        self.array = _view(mm, shape)
+        return self.array
+
+    def handle(self, result):
+        '''
+        Describe a capture downloaded into this buffer.
+
+        Args:
+            result (`Waveform`, `WaveformSet`): The capture.
+
+        Returns:
+            `Handle`: The handle.
+        '''
+        return _handle('shm', self.name, result)
+
+    def unlink(self):
+        '''
+        Free the block once every process has dropped its arrays.
+        '''
+        if self.name is not None:
+            unlink(self.name)
+
+    def __reduce__(self):
+        return (SharedBuffer, (None if self._created else self.name,))
+
+class MemmapBuffer(object):
+    '''
+    Downloads into a memory-mapped file, e.g. on a RAM disk or fast SSD.
+    Like `SharedBuffer`, but the capture outlives the processes and can be
+    larger than memory.
+
+    Args:
+        filename (str): The file; created or overwritten.
+
+    Attributes:
+        array (numpy.memmap): The codes downloaded.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.array = None
+
+    def allocate(self, shape):
+        self.array = np.memmap(self.filename, 'B', 'w+', shape=tuple(shape))
+        return self.array
+
+    def handle(self, result):
+        self.array.flush()
+        return _handle('memmap', self.filename, result)
+
+def _handle(kind, location, result):
+    dtype = result.dtype.str
+    if isinstance(result, WaveformSet):
+        return Handle(kind, location, result.codes.shape, list(result.channels),
+                      list(result.preambles), dtype)
+    return Handle(kind, location, result.codes.shape, None, [result.preamble],
+                  dtype)
+
+def allocate(out, shape):
+    '''
+    The uint8 array to download into.
+
+    Args:
+        out (None, numpy.ndarray, `SharedBuffer`, `MemmapBuffer`): An
+            array of at least `shape`, e.g. a `numpy.memmap`, or a buffer
+            with an `allocate(shape)` method.  `None` allocates an array.
+        shape (tuple): Shape of the codes.
+
+    Returns:
+        numpy.ndarray: The array.
+    '''
+    if out is None:
+        return np.empty(shape, 'B')
+    if isinstance(out, np.ndarray):
+        assert out.dtype == np.uint8, 'Codes are uint8.'
+        assert out.size >= int(np.prod(shape)), 'Buffer too small.'
+        if out.shape != tuple(shape):
+            out = out.reshape(-1)[:int(np.prod(shape))].reshape(shape)
+        return out
+    return out.allocate(shape)
+
+def attach(handle, writable=False):
+    '''
+    Attach to a capture described by a `Handle`, without copying.
+
+    Args:
+        handle (`Handle`): From `SharedBuffer.handle()` or
+            `MemmapBuffer.handle()`.
+        writable (bool): Map a memmap file writable.  Default is `False`.
+
+    Returns:
+        `Waveform`, `WaveformSet`: The capture.
+    '''
+    if handle.kind == 'shm':
+        codes = attach_array(handle.location, handle.shape)
+    else:
+        assert handle.kind == 'memmap', 'Unknown handle kind.'
+        codes = np.memmap(handle.location, 'B', 'r+' if writable else 'r',
+                          shape=tuple(handle.shape))
+    if handle.channels is None:
+        return Waveform(codes, handle.preambles[0], handle.dtype)
+    return WaveformSet(handle.channels, codes, handle.preambles, handle.dtype)
@@ -0,0 +1,329 @@
+import re
+import time
+import numpy as np
+from transport import SimulatedTransport
+import measure
+import analysis
+from waveform import Waveform
+
+# Long forms of the SCPI mnemonics used by the drivers, mapped to the short
+# forms the simulator stores settings under.
+_aliases = {
+    'channel': 'chan', 'display': 'disp', 'coupling': 'coup',
+    'offset': 'off', 'offs': 'off', 'scale': 'scal', 'probe': 'prob',
+    'range': 'rang', 'units': 'unit', 'timebase': 'tim', 'trigger': 'trig',
+    'edge': 'edg', 'level': 'lev', 'holdoff': 'hold', 'status': 'stat',
+    'acquire': 'acq', 'averages': 'aver', 'mdepth': 'mdep', 'srate': 'srat',
+    'waveform': 'wav', 'source': 'sour', 'format': 'form', 'start': 'star',
+    'preamble': 'pre', 'measure': 'meas', 'autoscale': 'aut', 'single': 'sing',
+    'tforce': 'tfor', 'system': 'syst', 'locked': 'lock', 'clear': 'cle',
+    'clea': 'cle', 'autos': 'aut', 'sweep': 'swe', 'mode': 'mode',
+}
+
+_models = {
+    'DS1054Z': {'channels': 4, 'max_block_pts': 250000, 'max_mdep': 24000000},
+    'DS1104Z': {'channels': 4, 'max_block_pts': 250000, 'max_mdep': 24000000},
+    'DS2072A': {'channels': 2, 'max_block_pts': 1800000, 'max_mdep': 14000000},
+}
+
+_screenshot_bytes = {
+    'png': 60000, 'jpeg': 90000, 'bmp8': 385078, 'bmp24': 1152054,
+    'tiff': 1152200, 'bmp': 1152054,
+}
+
+_mnemonics = set(measure.items.values())
+
+def normalize(header):
+    '''
+    Short lower case form of a SCPI header, e.g. ':CHANnel1:OFFSet' becomes
+    'chan1:off'.
+    '''
+    nodes = []
+    for node in header.strip().lstrip(':').lower().split(':'):
+        m = re.match(r'([a-z*]+)(\d*)(\??)$', node)
+        if not m:
+            nodes.append(node)
+            continue
+        name, num, q = m.groups()
+        nodes.append(_aliases.get(name, name) + num + q)
+    return ':'.join(nodes)
+
+class SimulatedScope(object):
+    '''
+    An oscilloscope simulated in-process, answering the SCPI commands the
+    drivers use.
+
+    Settings are kept in a dictionary keyed by the normalised command
+    header, so any setting written can be read back.  Waveforms are
+    synthetic: channel `n` sees a sine wave of `n` kHz with noise, scaled
+    by the channel's vertical scale and offset.  Waveform blocks larger
+    than the model's limit fail like a USB timeout.
+
+    Args:
+        model (str): 'DS1054Z', 'DS1104Z' or 'DS2072A'.  Default is
+            'DS1054Z'.
+        serial (str): Serial number reported by `*IDN?`.
+        trigger_delay_s (float): Time from arming a single shot to the
+            trigger firing.  Default is 10ms.
+        seed (int): Seed of the noise.  Default is 0.
+    '''
+    def __init__(self, model='DS1054Z', serial='DS1ZA000000001',
+                 trigger_delay_s=10e-3, seed=0):
+        assert model in _models, 'Not a simulated model.'
+        self.model = model
+        self.serial = serial
+        self.trigger_delay_s = trigger_delay_s
+        self.seed = seed
+        self.limits = _models[model]
+        self.reset()
+
+    def reset(self):
+        self.settings = {
+            'tim:scal': 1e-3, 'tim:mode': 'MAIN', 'tim:off': 0.,
+            'trig:edg:lev': 0., 'trig:hold': 1.6e-8, 'trig:swe': 'AUTO',
+            'acq:aver': 2, 'acq:type': 'NORM', 'acq:mdep': 'AUTO',
+            'wav:sour': 'CHAN1', 'wav:mode': 'NORM', 'wav:form': 'BYTE',
+            'wav:star': 1, 'wav:stop': 1200, 'meas:sour': 'CHAN1',
+            'syst:lock': 0,
+        }
+        for c in range(1, self.limits['channels']+1):
+            self.settings.update({
+                'chan%i:disp' % c: 1 if c == 1 else 0,
+                'chan%i:coup' % c: 'DC', 'chan%i:off' % c: 0.,
+                'chan%i:scal' % c: 1., 'chan%i:prob' % c: 1.,
+                'chan%i:unit' % c: 'VOLT',
+            })
+        self.status = 'RUN'
+        self.frame = 0
+        self._armed_at = None
+        self._esr = 0
+
+    def handle(self, message):
+        '''
+        Process one SCPI message.
+
+        Args:
+            message (str): One or more commands separated by semicolons.
+
+        Returns:
+            None, bytes: The response if the message contained queries.
+        '''
+        responses = []
+        for cmd in message.strip().split(';'):
+            if not cmd.strip():
+                continue
+            parts = cmd.strip().split(None, 1)
+            header = normalize(parts[0])
+            arg = parts[1].strip() if len(parts) > 1 else ''
+            r = self._command(header, arg)
+            if r is not None:
+                responses.append(r)
+        if not responses:
+            return None
+        if len(responses) == 1 and isinstance(responses[0], bytes):
+            return responses[0]
+        return ';'.join(str(r) for r in responses).encode() + b'\n'
+
+    def _command(self, header, arg):
+        self._update_trigger()
+        query = header.endswith('?')
+        key = header.rstrip('?')
+
+        if key == '*idn':
+            return 'RIGOL TECHNOLOGIES,%s,%s,00.04.04.SP3' % (self.model,
+                                                            self.serial)
+        if key == '*opc':
+            if query:
+                return '1'
+            self._esr |= 1
+            return None
+        if key == '*esr':
+            esr, self._esr = self._esr, 0
+            return str(esr)
+        if key == '*rst':
+            self.reset()
+            return None
+        if key == 'run':
+            self.status = 'RUN'
+            return None
+        if key == 'stop':
+            # Stopping an already stopped oscilloscope keeps its capture.
+            if self.status != 'STOP':
+                self.frame += 1
+            self.status = 'STOP'
+            return None
+        if key == 'sing':
+            self.status = 'WAIT'
+            self._armed_at = time.perf_counter()
+            return None
+        if key == 'tfor':
+            if self.status == 'WAIT':
+                self._armed_at = -float('inf')
+                self._update_trigger()
+            return None
+        if key in ('aut', 'cle'):
+            if key == 'aut':
+                self.settings['tim:scal'] = 2e-4
+                for c in range(1, self.limits['channels']+1):
+                    self.settings['chan%i:scal' % c] = 0.5
+            return None
+        if key == 'trig:stat':
+            return self.status
+        if key == 'acq:srat':
+            return '%e' % self._sample_rate()
+        m = re.match(r'chan(\d):rang$', key)
+        if m:
+            scal = 'chan%s:scal' % m.group(1)
+            if query:
+                return '%e' % (8*self.settings[scal])
+            self.settings[scal] = float(arg) / 8
+            return None
+        if key == 'wav:pre':
+            return ','.join(str(v) for v in self._preamble())
+        if key == 'wav:data':
+            return self._wav_data()
+        if key == 'disp:data':
+            return self._screenshot(arg)
+        if key == 'meas:item':
+            return self._measure(arg)
+        if query and key[5:].upper() in _mnemonics and key.startswith('meas:'):
+            return self._measure('%s,%s' % (key[5:], arg or ''))
+
+        if query:
+            return self._format(self.settings.get(key, 0))
+        self.settings[key] = self._parse(arg)
+        if key == 'acq:mdep':
+            self.frame += 1
+        return None
+
+    @staticmethod
+    def _parse(arg):
+        try:
+            return int(arg)
+        except ValueError:
+            pass
+        try:
+            return float(arg)
+        except ValueError:
+            return arg.upper()
+
+    @staticmethod
+    def _format(value):
+        if isinstance(value, float):
+            return '%e' % value
+        return str(value)
+
+    def _update_trigger(self):
+        if self.status == 'WAIT' and self._armed_at is not None and \
+                time.perf_counter() - self._armed_at >= self.trigger_delay_s:
+            self.status = 'STOP'
+            self.frame += 1
+            self._armed_at = None
+
+    def _enabled(self):
+        return [c for c in range(1, self.limits['channels']+1)
+                if self.settings['chan%i:disp' % c]]
+
+    def memory_depth(self):
+        mdep = self.settings['acq:mdep']
+        if mdep == 'AUTO':
+            n = max(1, len(self._enabled()))
+            return 120000 // (4 if n > 2 else n)
+        return int(mdep)
+
+    def _sample_rate(self):
+        return self.memory_depth() / (12*self.settings['tim:scal'])
+
+    def _source(self):
+        return int(str(self.settings['wav:sour'])[-1])
+
+    def _preamble(self):
+        c = self._source()
+        if str(self.settings['wav:mode']).startswith('RAW'):
+            points = self.memory_depth()
+            xinc = 1 / self._sample_rate()
+        else:
+            points = 1200
+            xinc = 12*self.settings['tim:scal'] / points
+        yinc = self.settings['chan%i:scal' % c] / 25
+        xorigin = -points/2 * xinc + self.settings['tim:off']
+        return (0, 0 if points == 1200 else 1, points, 1, xinc, xorigin, 0,
+                yinc, 0, 127)
+
+    def waveform(self, channel, start, stop):
+        '''
+        Codes of points `start` to `stop` (zero based, exclusive) of the
+        current capture of `channel`.
+        '''
+        saved = self.settings['wav:sour']
+        self.settings['wav:sour'] = 'CHAN%i' % channel
+        pre = self._preamble()
+        self.settings['wav:sour'] = saved
+
+        _, _, _, _, xinc, xorigin, _, yinc, _, yref = pre
+        scal = self.settings['chan%i:scal' % channel]
+        off = self.settings['chan%i:off' % channel]
+        frame = self.frame if self.status == 'STOP' else int(time.time()*50)
+        rng = np.random.default_rng((self.seed, channel, frame, start))
+
+        t = xorigin + np.arange(start, stop, dtype='float64')*xinc
+        v = 3*scal*np.sin(2*np.pi*1e3*channel*t + 0.1*frame)
+        v += rng.normal(0, 0.05*scal, v.size)
+        codes = np.rint((v + off)/yinc + yref)
+        return np.clip(codes, 0, 255).astype('B')
+
+    def _wav_data(self):
+        pre = self._preamble()
+        points = pre[2]
+        start = max(int(self.settings['wav:star']), 1)
+        stop = min(int(self.settings['wav:stop']), points)
+        if stop - start + 1 > self.limits['max_block_pts']:
+            return None
+        data = self.waveform(self._source(), start-1, stop).tobytes()
+        return b'#9%09i' % len(data) + data + b'\n'
+
+    def _screenshot(self, arg):
+        fmt = arg.split(',')[-1].strip().lower() if arg else 'bmp'
+        size = _screenshot_bytes.get(fmt, _screenshot_bytes['bmp'])
+        data = b'\x89PNG\r\n\x1a\n' if fmt == 'png' else b'BM'
+        data += bytes(size - len(data))
+        return b'#9%09i' % len(data) + data + b'\n'
+
+    def _measure(self, arg):
+        item, _, source = [a.strip().lower() for a in arg.partition(',')]
+        c = int(source[-1]) if source else self._source()
+        names = {m.lower(): n for n, m in measure.items.items()}
+        if item not in names:
+            return '%e' % 9.9e37
+        saved = self.settings['wav:mode']
+        self.settings['wav:mode'] = 'NORM'
+        keys = ('format', 'type', 'points', 'count', 'xincrement', 'xorigin',
+                'xreference', 'yincrement', 'yorigin', 'yreference')
+        pre = dict(zip(keys, self._preamble()))
+        w = Waveform(self.waveform(c, 0, 1200), pre)
+        self.settings['wav:mode'] = saved
+        value = analysis.analyze(w, [names[item]])[names[item]]
+        return '%e' % (9.9e37 if np.isnan(value) else value)
+
+def connect(model='DS1054Z', latency_s=0.5e-3, bytes_per_s=1e6,
+            serial='DS1ZA000000001', **kwargs):
+    '''
+    A driver connected to a new simulated oscilloscope.
+
+    Args:
+        model (str): 'DS1054Z', 'DS1104Z' or 'DS2072A'.
+        latency_s (float): Latency of each transfer.
+        bytes_per_s (float): Transfer rate.
+        serial (str): Serial number of the simulated oscilloscope.
+        **kwargs: Passed on to the driver, e.g. `completion`.
+
+    Returns:
+        `rigol1000z.Rigol1054z`, `rigol2000a.Rigol2072a`: The driver.
+    '''
+    scope = SimulatedScope(model, serial)
+    transport = SimulatedTransport(scope, latency_s, bytes_per_s)
+    if model.startswith('DS2'):
+        import rigol2000a
+        return rigol2000a.Rigol2072a(transport=transport, **kwargs)
+    import rigol1000z
+    return rigol1000z.Rigol1054z(transport=transport, **kwargs)
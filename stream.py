@@ -0,0 +1,281 @@
+import time
+import asyncio
+import threading
+import collections
+import numpy as np
+from download import BlockDownloader, download_channels
+from waveform import WaveformSet
+from completion import wait_for_trigger
+
+class Frame(WaveformSet):
+    '''
+    One acquisition of a `Stream`.
+
+    The codes live in a slot of the stream's ring buffer and are reused
+    once the consumer has moved on; copy them (`frame.codes.copy()`) to
+    keep a frame beyond the next iteration.
+
+    Attributes:
+        index (int): Number of the acquisition since the stream started.
+        timestamp (float): `time.time()` when the acquisition was read.
+    '''
+    def __init__(self, index, timestamp, channels, codes, preambles, dtype):
+        WaveformSet.__init__(self, channels, codes, preambles, dtype)
+        self.index = index
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return 'Frame(%i, channels=%r, %i points)' % (self.index, self.channels,
+                                                      self.codes.shape[1])
+
+class Stream(object):
+    '''
+    Continuous acquisition into a ring of preallocated buffers.
+
+    A background thread repeatedly takes a single shot acquisition and
+    downloads the channels into the next free slot of the ring, while the
+    consumer processes the previous frame.  Iterating (or `async for`)
+    yields the oldest frame not yet consumed.  If the consumer falls
+    behind, the oldest unconsumed frame is overwritten and counted in
+    `dropped`, so memory stays constant however long the stream runs.
+
+    The waveform preambles are read once, and again only after a setting
+    is written through the driver or every `preamble_check_s` seconds, to
+    notice changes made at the front panel.  While the stream runs, talk
+    to the oscilloscope only while holding `lock`:
+
+        with osc.stream([1, 2]) as s:
+            for frame in s:
+                v = frame[1].volts()
+                with s.lock:
+                    osc.timebase.set_timebase_scale_s_div(1e-3)
+
+    Args:
+        osc: The oscilloscope.
+        channels (None, list): Channel numbers.  Default is `None`; all
+            enabled channels.
+        mode (str): 'norm' or 'raw'; see `get_data()`.  Default is 'norm'.
+        dtype (str, numpy.dtype): Float type the frames' volts are
+            converted to.  Default is 'float64'.
+        slots (int): Number of frames in the ring.  At least 3: one being
+            written, one held by the consumer and one ready.  Default is 4.
+        max_frames (None, int): Stop after this many frames.  Default is
+            `None`; run until `close()`.
+        force (bool): Force a trigger straight after arming, for untriggered
+            signals.  Default is `False`.
+        preamble_check_s (None, float): Seconds after which the preambles
+            are re-read.  Default is 1s; `None` only re-reads after
+            settings are written through the driver.
+        poll_s (float): Initial interval between polls of the trigger
+            status; see `completion.wait_for_trigger()`.  Default is 1ms.
+
+    Attributes:
+        frames (int): Frames acquired.
+        dropped (int): Frames overwritten before they were consumed.
+        lock (threading.RLock): Held by the stream while it talks to the
+            oscilloscope.
+    '''
+    def __init__(self, osc, channels=None, mode='norm', dtype='float64',
+                 slots=4, max_frames=None, force=False, preamble_check_s=1.,
+                 poll_s=1e-3):
+        assert mode in ('norm', 'raw')
+        assert slots >= 3, 'A stream needs at least 3 slots.'
+        if channels is None:
+            channels = [i+1 for i, e in enumerate(osc.get_channels_enabled())
+                        if e]
+        self.osc = osc
+        self.channels = list(channels)
+        self.mode = mode
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        self.max_frames = max_frames
+        self.force = force
+        self.preamble_check_s = preamble_check_s
+        self.poll_s = poll_s
+
+        self.frames = 0
+        self.dropped = 0
+        self.lock = threading.RLock()
+        self._ring = None
+        self._preambles = None
+        self._preamble_version = None
+        self._preamble_time = 0.
+        self._ready = collections.deque()
+        self._held = None
+        self._cond = threading.Condition()
+        self._stop = False
+        self._error = None
+        self._started = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._started = time.time()
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    @property
+    def fps(self):
+        '''
+        Frames acquired per second since the stream started.
+        '''
+        if self._started is None or self.frames == 0:
+            return 0.
+        return self.frames / (time.time() - self._started)
+
+    def stats(self):
+        '''
+        Returns:
+            dict: `frames`, `dropped`, `fps` and `pending` (frames ready
+                but not yet consumed).
+        '''
+        return {'frames': self.frames, 'dropped': self.dropped,
+                'fps': self.fps, 'pending': len(self._ready)}
+
+    def _stale(self):
+        if self._preambles is None:
+            return True
+        if self.osc.settings_version != self._preamble_version:
+            return True
+        return self.preamble_check_s is not None and \
+            time.time() - self._preamble_time > self.preamble_check_s
+
+    def _acquire(self):
+        osc = self.osc
+        osc.set_single_shot()
+        if self.force:
+            osc.force()
+        return wait_for_trigger(osc._ask, poll_s=self.poll_s,
+                                cancelled=lambda: self._stop)
+
+    def _free_slot(self):
+        with self._cond:
+            used = set(slot for slot, _ in self._ready)
+            used.add(self._held)
+            for slot in range(self.slots):
+                if slot not in used:
+                    return slot
+            # The consumer is behind; overwrite the oldest frame.
+            self.dropped += 1
+            return self._ready.popleft()[0]
+
+    def _read_preambles(self):
+        osc = self.osc
+        version = osc.settings_version
+        preambles = []
+        with osc.batch():
+            osc._write(':wav:mode %s' % self.mode)
+            osc._write(':wav:form byte')
+            for c in self.channels:
+                osc._write(':wav:sour chan%i' % c)
+                preambles.append(osc[c].get_data_premable())
+        assert len(set(p['points'] for p in preambles)) == 1, \
+            'Channels have different numbers of points.'
+        self._preambles = preambles
+        self._preamble_version = version
+        self._preamble_time = time.time()
+
+    def _slot(self, slot):
+        # The ring is reallocated when the number of points changes;
+        # frames still held by the consumer keep the old one alive.
+        points = self._preambles[0]['points']
+        if self._ring is None or self._ring.shape[2] != points:
+            self._ring = np.empty((self.slots, len(self.channels), points), 'B')
+        return self._ring[slot]
+
+    def _run(self):
+        downloader = BlockDownloader(self.osc, progress=False)
+        try:
+            while not self._stop and (self.max_frames is None or
+                                      self.frames < self.max_frames):
+                with self.lock:
+                    if not self._acquire():
+                        break
+                    if self._stale():
+                        self._read_preambles()
+                    slot = self._free_slot()
+                    codes = self._slot(slot)
+                    download_channels(self.osc, self.channels, self.mode,
+                                      downloader, codes, self._preambles)
+                frame = Frame(self.frames, time.time(), self.channels, codes,
+                              self._preambles, self.dtype)
+                with self._cond:
+                    self._ready.append((slot, frame))
+                    self.frames += 1
+                    self._cond.notify_all()
+        except Exception as e:
+            self._error = e
+        finally:
+            with self._cond:
+                self._stop = True
+                self._cond.notify_all()
+
+    def next(self, timeout=None):
+        '''
+        The oldest frame not yet consumed, waiting for one if needed.
+
+        Args:
+            timeout (None, float): Seconds to wait.  Default is `None`;
+                forever.
+
+        Returns:
+            `Frame`: The frame.
+        '''
+        frame = self._next(timeout)
+        if frame is None:
+            raise StopIteration
+        return frame
+
+    def _next(self, timeout=None):
+        self.start()
+        with self._cond:
+            self._held = None
+            if not self._cond.wait_for(lambda: self._ready or self._stop,
+                                       timeout):
+                raise TimeoutError('No frame within %gs.' % timeout)
+            if not self._ready:
+                if self._error is not None:
+                    raise self._error
+                return None
+            self._held, frame = self._ready.popleft()
+            return frame
+
+    __next__ = next
+
+    def __iter__(self):
+        return self.start()
+
+    def __aiter__(self):
+        return self.start()
+
+    async def __anext__(self):
+        loop = asyncio.get_running_loop()
+        frame = await loop.run_in_executor(None, self._next)
+        if frame is None:
+            raise StopAsyncIteration
+        return frame
+
+    def close(self):
+        '''
+        Stop streaming and leave the oscilloscope running.
+        '''
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            with self.lock:
+                self.osc.run()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return 'Stream(channels=%r, %i frames, %i dropped, %.1f fps)' % (
+            self.channels, self.frames, self.dropped, self.fps)
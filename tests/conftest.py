@@ -0,0 +1,53 @@
+import os
+import sys
+import socket
+import threading
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import simulator
+
+@pytest.fixture
+def osc():
+    '''
+    A DS1054Z driver on the simulator, without transfer delays.
+    '''
+    o = simulator.connect(latency_s=0, bytes_per_s=1e12)
+    o.progress = False
+    yield o
+    o.close()
+
+@pytest.fixture
+def lan_scope():
+    '''
+    A simulated oscilloscope served over TCP like the LAN interface: one
+    newline terminated message per write, responses sent as they are.
+
+    Yields:
+        2-tuple: The `simulator.SimulatedScope` and the port.
+    '''
+    scope = simulator.SimulatedScope()
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+
+    def serve():
+        conn, _ = server.accept()
+        buf = b''
+        with conn:
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    return
+                buf += data
+                while b'\n' in buf:
+                    line, buf = buf.split(b'\n', 1)
+                    response = scope.handle(line.decode())
+                    if response is not None:
+                        conn.sendall(response)
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield scope, server.getsockname()[1]
+    server.close()
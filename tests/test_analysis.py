@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+import analysis
+from waveform import Waveform
+
+preamble = {'xincrement': 1e-6, 'xorigin': 0., 'xreference': 0,
+            'yincrement': 0.01, 'yorigin': 0, 'yreference': 128}
+
+def test_analyze_empty():
+    r = analysis.analyze(Waveform(np.empty(0, 'B'), preamble))
+    assert sorted(r) == sorted(analysis.names)
+    assert all(np.isnan(v) for v in r.values())
+
+def square(periods=50, period=100, duty=0.3):
+    high = int(period*duty)
+    one = np.r_[np.full(high, 200, 'B'), np.full(period - high, 56, 'B')]
+    return Waveform(np.tile(one, periods), preamble)
+
+def test_analyze_square_wave():
+    r = analysis.analyze(square())
+    assert r['freq'] == pytest.approx(1e4)
+    assert r['period'] == pytest.approx(1e-4)
+    assert r['pos_duty'] == pytest.approx(30.)
+    assert r['vtop'] == pytest.approx(0.72)
+    assert r['vbase'] == pytest.approx(-0.72)
+    assert r['vpp'] == pytest.approx(1.44)
+    assert r['vrms'] == pytest.approx(0.72)
+    assert r['vavg'] == pytest.approx(0.3*0.72 - 0.7*0.72)
+    assert r['pos_edges'] == 49 and r['neg_edges'] == 50
+    assert r['overshoot'] == 0.
+
+def test_analyze_chunks_agree():
+    w = square(periods=37, period=97)
+    whole = analysis.analyze(w)
+    # Chunk boundaries that split edges and pulses.
+    chunked = analysis.analyze(w, chunk=61)
+    for name in analysis.names:
+        assert chunked[name] == pytest.approx(whole[name], nan_ok=True)
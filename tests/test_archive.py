@@ -0,0 +1,37 @@
+import threading
+import pytest
+import numpy as np
+import archive
+from writers import Writer
+
+class FailingWriter(Writer):
+    def open(self, preamble, points):
+        raise IOError('Disk full.')
+
+def test_failed_sink_releases_archive(osc, tmp_path):
+    a = archive.Archive(str(tmp_path))
+    with pytest.raises(IOError):
+        osc[1].get_data('raw', keep_data=False,
+                        sinks=[a.writer(1, 'S1'), FailingWriter('x')])
+    # Nothing was indexed, and other threads can still append.
+    assert a.find() == []
+    t, v = osc[1].get_data('raw')
+    thread = threading.Thread(target=a.add, args=(v, 1), daemon=True)
+    thread.start()
+    thread.join(2.)
+    assert not thread.is_alive()
+    w = a.writer(1, 'S1', 'raw')
+    t, v = osc[1].get_data('raw', sinks=[w])
+    r = a.find(channels=[1])[-1]
+    assert r.acquisition == w.acquisition
+    assert np.array_equal(a.load(r)[1].codes, v.codes)
+    a.close()
+
+def test_record_and_find(osc, tmp_path):
+    with archive.Archive(str(tmp_path)) as a:
+        osc.stop()
+        acq = a.record(osc, [1, 2], mode='raw')
+        ws = a.load_acquisition(acq)
+        assert ws.channels == [1, 2]
+        assert len(a.find(settings={'timebase.scale_s_div': 1e-3})) == 2
+        assert a.find(serial='other') == []
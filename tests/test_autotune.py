@@ -0,0 +1,36 @@
+import pytest
+from autotune import BlockSizeTuner
+
+def test_tune_default_memory_depth(osc):
+    # AUTO memory depth holds fewer points than the smallest candidate.
+    osc.run()
+    result = BlockSizeTuner(osc, repeats=1, cache=False).tune()
+    assert result['block_pts'] == 120000
+    assert osc.block_pts == 120000
+
+def test_tune_restores_waveform_settings(osc):
+    osc._write(':wav:mode norm')
+    osc._write(':wav:sour chan2')
+    osc.run()
+    BlockSizeTuner(osc, repeats=1, cache=False).measure()
+    scope = osc.transport.scope
+    assert scope.settings['wav:mode'] == 'NORM'
+    assert scope.settings['wav:sour'] == 'CHAN2'
+    assert scope.status == 'RUN'
+
+def test_failed_block_is_cleared(osc):
+    osc._write(':acq:mdep 600000')
+    osc.transport.scope.limits = dict(osc.transport.scope.limits,
+                                      max_block_pts=300000)
+    osc.timeout_s = 0.01
+    results = BlockSizeTuner(osc, candidates=[250000, 500000], repeats=1,
+                             cache=False).measure()
+    assert [r[0] for r in results] == [250000]
+    assert osc._ask('*IDN?').startswith('RIGOL')
+
+def test_no_block_size_raises(osc):
+    osc.transport.scope.limits = dict(osc.transport.scope.limits,
+                                      max_block_pts=1000)
+    osc.timeout_s = 0.01
+    with pytest.raises(IOError):
+        BlockSizeTuner(osc, repeats=1, cache=False).tune()
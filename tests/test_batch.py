@@ -0,0 +1,55 @@
+import pytest
+import batch
+
+def test_batch_splits_messages_and_responses(osc):
+    writes = []
+    write = osc.transport.write
+    osc.transport.write = lambda cmd: writes.append(cmd) or write(cmd)
+    with osc.batch(max_length=40) as b:
+        osc[1].set_coupling('ac')
+        osc[2].set_vertical_scale_V(0.2)
+        queries = [b.ask(':chan%i:%s?' % (c, s)) for c in (1, 2)
+                   for s in ('coup', 'scal', 'disp')]
+        assert not any(d.done for d in queries)
+    assert all(len(w) <= 40 for w in writes)
+    assert len(writes) > 1
+    values = [d.value for d in queries]
+    assert values[0] == 'AC' and float(values[4]) == 0.2
+    osc.transport.write = write
+    assert values == [osc._ask(d.query) for d in queries]
+
+def test_batch_query_sends_queued_writes(osc):
+    writes = []
+    write = osc.transport.write
+    osc.transport.write = lambda cmd: writes.append(cmd) or write(cmd)
+    with osc.batch():
+        osc._write(':chan1:off 0.1')
+        assert float(osc._ask(':chan1:off?')) == 0.1
+    assert writes[0] == ':chan1:off 0.1;:chan1:off?'
+
+def test_batch_response_containing_separator(osc, monkeypatch):
+    scope = osc.transport.scope
+    command = scope._command
+    error = ['a;b']
+    def _command(header, arg):
+        return error[0] if header == 'syst:err?' else command(header, arg)
+    monkeypatch.setattr(scope, '_command', _command)
+
+    def ask(max_length):
+        with osc.batch(max_length=max_length) as b:
+            queries = [b.ask(q) for q in (':chan1:coup?', ':syst:err?',
+                                          ':chan2:coup?')]
+        return [d.value for d in queries]
+
+    # One query per message: the whole line is the response.
+    assert ask(15) == ['DC', 'a;b', 'DC']
+    # Several queries per message: quoted strings are kept whole.
+    error[0] = '-113,"Undefined; header"'
+    assert ask(500) == ['DC', error[0], 'DC']
+
+def test_batch_split_quoted():
+    assert batch._split('0,"No error";DC', 2) == ['0,"No error"', 'DC']
+    assert batch._split('-113,"Undefined; header";DC', 2) == \
+        ['-113,"Undefined; header"', 'DC']
+    with pytest.raises(IOError):
+        batch._split('a;b;c', 2)
@@ -0,0 +1,52 @@
+import time
+from cache import settings_queries
+
+def test_refresh_settings_in_one_exchange(osc):
+    osc.enable_cache()
+    writes = []
+    write = osc.transport.write
+    osc.transport.write = lambda cmd: writes.append(cmd) or write(cmd)
+    osc.refresh_settings()
+    assert len(writes) < len(settings_queries(len(osc))) // 4
+    osc.transport.write = write
+    for query in settings_queries(len(osc)):
+        assert osc.cache.peek(query) == osc._ask_uncached(query)
+
+def counting(osc):
+    writes = []
+    write = osc.transport.write
+    osc.transport.write = lambda cmd: writes.append(cmd) or write(cmd)
+    return writes
+
+def test_cache_serves_and_invalidates(osc):
+    osc.enable_cache()
+    writes = counting(osc)
+    scale = osc._ask(':chan1:scal?')
+    assert osc._ask(':chan1:scal?') == scale
+    osc._ask(':chan1:rang?')
+    assert len(writes) == 2
+
+    # Writing the scale updates it and forgets the range it changes.
+    osc._write(':chan1:scal 0.5')
+    assert osc.cache.peek(':chan1:scal?') == '0.5'
+    assert osc.cache.peek(':chan1:rang?') is None
+    assert float(osc._ask(':chan1:rang?')) == 4.
+
+    osc.cache.invalidate(':chan1:scal')
+    assert osc.cache.peek(':chan1:scal?') is None
+    assert osc.cache.peek(':chan1:rang?') is not None
+
+    # Autoscale forgets everything; the trigger status is never cached.
+    osc.autoscale()
+    assert osc.cache.peek(':chan1:rang?') is None
+    assert osc.cache.key(':trig:stat?') is None
+
+def test_cache_ttl_unless_locked(osc, monkeypatch):
+    osc.enable_cache(ttl_s=10.)
+    osc._ask(':tim:scal?')
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 20.)
+    assert osc.cache.peek(':tim:scal?') is None
+    writes = counting(osc)
+    osc._ask(':tim:scal?')
+    assert writes == [':syst:lock?', ':tim:scal?']
@@ -0,0 +1,49 @@
+import pytest
+import simulator
+from completion import wait_for_trigger
+
+def test_wait_for_trigger_polls_until_stop():
+    states = iter(['WAIT', 'WAIT', 'TD', 'STOP'])
+    asked = []
+
+    def ask(cmd):
+        asked.append(cmd)
+        return next(states)
+
+    assert wait_for_trigger(ask, timeout_s=1., poll_s=1e-4)
+    assert len(asked) == 4
+
+def test_wait_for_trigger_timeout():
+    assert not wait_for_trigger(lambda cmd: 'WAIT', timeout_s=0.02)
+
+@pytest.mark.parametrize('model', ['DS1054Z', 'DS2072A'])
+def test_single_shot_is_synchronised(model):
+    # With any completion mode, `:sing` is confirmed before the trigger
+    # status is polled, so a 'STOP' from before arming is never seen.
+    osc = simulator.connect(model, latency_s=0, bytes_per_s=1e12,
+                            completion='none')
+    osc.progress = False
+    writes = []
+    write = osc.transport.write
+    osc.transport.write = lambda cmd: (writes.append(cmd), write(cmd))[1]
+    osc.stop()
+    scope = osc.transport.scope
+    frame = scope.frame
+    ws = osc.acquire_single(timeout_s=1., channels=[1])
+    i = writes.index(':sing')
+    assert writes[i+1] == '*OPC?'
+    assert scope.frame == frame + 1
+    assert ws.codes.shape[0] == 1
+
+def test_acquire_single(osc):
+    ws = osc.acquire_single(timeout_s=2., channels=[1, 2])
+    assert ws.channels == [1, 2]
+    assert osc._ask(':trig:stat?') == 'STOP'
+
+def test_acquire_single_timeout(osc):
+    osc.transport.scope.trigger_delay_s = float('inf')
+    with pytest.raises(TimeoutError):
+        osc.acquire_single(timeout_s=0.05)
+    # Forcing the trigger still works.
+    ws = osc.acquire_single(timeout_s=0.05, channels=[1], force=True)
+    assert ws.codes.shape == (1, 1200)
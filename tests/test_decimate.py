@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+import decimate
+
+preamble = {'xincrement': 1e-6, 'xorigin': 0., 'xreference': 0,
+            'yincrement': 0.01, 'yorigin': 0, 'yreference': 128}
+
+def feed(d, codes, block=997):
+    # Blocks that do not line up with the buckets.
+    d.open(preamble, codes.size)
+    for start in range(0, codes.size, block):
+        d.write_block(start, codes[start:start+block])
+    d.close()
+    return d
+
+@pytest.fixture
+def codes():
+    return np.random.RandomState(0).randint(0, 256, 10000).astype('B')
+
+def test_minmax(codes):
+    d = feed(decimate.MinMax(factor=40), codes)
+    assert np.array_equal(d.lo, codes.reshape(-1, 40).min(1))
+    assert np.array_equal(d.hi, codes.reshape(-1, 40).max(1))
+    lo, hi = d.volts()
+    assert lo.size == hi.size == d.count == 250
+
+def test_mean(codes):
+    d = feed(decimate.Mean(factor=40), codes)
+    assert np.allclose(d.means, codes.reshape(-1, 40).mean(1))
+
+def test_shorter_last_bucket(codes):
+    d = feed(decimate.MinMax(300), codes)
+    assert d.factor == 34 and d.count == 295
+    assert d.lo[-1] == codes[294*34:].min()
+    assert d.hi[-1] == codes[294*34:].max()
+    m = feed(decimate.Mean(300), codes)
+    assert m.means[-1] == pytest.approx(codes[294*34:].mean())
+
+@pytest.mark.parametrize('points', [100, 333, 5000])
+def test_lttb(codes, points):
+    d = feed(decimate.Lttb(points), codes)
+    assert d.count == -(-codes.size // d.factor)
+    assert d.index[0] == 0 and d.index[d.count-1] == codes.size - 1
+    assert np.all(np.diff(d.index[:d.count]) > 0)
+    assert np.array_equal(d.codes[:d.count], codes[d.index[:d.count]])
+    assert d.t.size == d.volts().size == d.count
+
+def test_sink_of_get_data(osc):
+    osc.stop()
+    d = decimate.MinMax(1000)
+    _, v = osc[1].get_data('raw', sinks=[d])
+    assert np.array_equal(d.hi, v.codes.reshape(-1, d.factor).max(1))
@@ -0,0 +1,35 @@
+import os
+import pytest
+import discovery
+
+def _plug(tmp_path, path, serial, pid='0x04ce'):
+    base = tmp_path / 'usb' / path
+    base.mkdir(parents=True)
+    (base / 'idVendor').write_text('1ab1\n')
+    (base / 'idProduct').write_text(pid[2:] + '\n')
+    (base / 'serial').write_text(serial + '\n')
+    misc = tmp_path / 'usbtmc' / (path + ':1.0') / 'usbmisc'
+    misc.mkdir(parents=True)
+    (misc / ('usbtmc%i' % len(os.listdir(str(tmp_path / 'usbtmc'))))).mkdir()
+
+@pytest.fixture
+def sysfs(tmp_path, monkeypatch):
+    (tmp_path / 'usbtmc').mkdir()
+    monkeypatch.setattr(discovery, 'root_usb', str(tmp_path / 'usb') + '/')
+    monkeypatch.setattr(discovery, 'root_usbtmc', str(tmp_path / 'usbtmc') + '/')
+    discovery.invalidate()
+    yield tmp_path
+    discovery.invalidate()
+
+def test_find(sysfs):
+    _plug(sysfs, '1-1', 'DS1ZA1')
+    _plug(sysfs, '1-2', 'DS2A1', pid='0x04b0')
+    assert [d.serial for d in discovery.devices()] == ['DS1ZA1', 'DS2A1']
+    assert discovery.find(serial='DS2A1')[0].model == 'DS2000A'
+    assert [d.path for d in discovery.find(model='DS1000Z')] == ['1-1']
+    assert discovery.find(serial='DS1ZA1', model='DS2000A') == []
+    assert discovery.find_one(pid='0x04b0').serial == 'DS2A1'
+
+    os.rename(str(sysfs / 'usbtmc' / '1-1:1.0'), str(sysfs / 'usbtmc' / 'gone'))
+    assert discovery.find(serial='DS1ZA1') == []
+    assert discovery.find(model='DS1000Z') == []
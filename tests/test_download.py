@@ -0,0 +1,46 @@
+import pytest
+from download import read_block, parse_block_header
+
+def test_parse_block_header():
+    assert parse_block_header(b'#9000001200') == (11, 1200)
+    assert parse_block_header(b'#15hello') == (3, 5)
+
+def test_read_block_continues_short_reads():
+    block = b'#9000000010' + b'0123456789' + b'\n'
+    parts = [block[11:15], block[15:]]
+    asked = []
+
+    def read_raw(num_bytes):
+        asked.append(num_bytes)
+        return parts.pop(0)
+
+    raw, head = read_block(lambda cmd, n: block[:11], read_raw, ':wav:data?')
+    assert raw[head:head+10] == b'0123456789'
+    # Never asks for more than the rest of the block and its newline.
+    assert asked == [11, 7]
+
+def test_read_block_truncated():
+    with pytest.raises(IOError):
+        read_block(lambda cmd, n: b'#9000000010012', lambda n: b'', ':wav:data?')
+
+def test_get_data_with_short_transport_reads(osc):
+    osc.stop()
+    _, full = osc[1].get_data('raw')
+    osc.transport.block_read_bytes = lambda count: 1000
+    reads = []
+    read_raw = osc.transport.read_raw
+    osc.transport.read_raw = lambda n=-1: reads.append(n) or read_raw(n)
+    _, v = osc[1].get_data('raw')
+    assert (v.codes == full.codes).all()
+    # The first read is short; the rest of the block is read after it.
+    assert reads[-2:] == [1000, 11 + 120000 + 1 - 1000]
+
+def test_read_block_split_header():
+    block = b'#9000000010' + b'0123456789' + b'\n'
+    parts = [block[3:11], block[11:]]
+    raw, head = read_block(lambda cmd, n: block[:3],
+                           lambda n: parts.pop(0)[:n] if n <= 8 else parts.pop(0),
+                           ':disp:data?')
+    assert head == 11 and raw[head:head+10] == b'0123456789'
+    with pytest.raises(IOError):
+        read_block(lambda cmd, n: b'#90', lambda n: b'', ':disp:data?')
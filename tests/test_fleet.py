@@ -0,0 +1,23 @@
+import pytest
+import fleet
+
+class FakeScope(object):
+    opened = []
+
+    def __init__(self, serial):
+        if serial == 'BAD':
+            raise IOError('Device busy.')
+        self.serial = serial
+        self.closed = False
+        FakeScope.opened.append(self)
+
+    def close(self):
+        self.closed = True
+
+def test_open_closes_scopes_on_failure(monkeypatch):
+    monkeypatch.setattr(fleet, 'find_scopes', lambda: dict.fromkeys(
+        ['S1', 'BAD', 'S2'], FakeScope))
+    with pytest.raises(IOError):
+        fleet.Fleet.open()
+    assert sorted(s.serial for s in FakeScope.opened) == ['S1', 'S2']
+    assert all(s.closed for s in FakeScope.opened)
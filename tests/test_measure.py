@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+import simulator
+import measure
+
+@pytest.mark.parametrize('model', ['DS1054Z', 'DS2072A'])
+def test_scope_and_host_agree(model):
+    osc = simulator.connect(model, latency_s=0, bytes_per_s=1e12)
+    osc.progress = False
+    osc.stop()
+    names = list(measure.items)
+    scope = osc.measure(names, [1, 2], 'scope')
+    host = osc.measure(names, [1, 2], 'host')
+    assert scope.names == host.names == tuple(names)
+    assert np.allclose(scope.values, host.values, rtol=1e-6, atol=1e-12)
+    assert scope[2].freq == 2000.
+    osc.close()
+
+def test_scope_measurements_in_one_exchange(osc):
+    writes = []
+    write = osc.transport.write
+    osc.transport.write = lambda cmd: writes.append(cmd) or write(cmd)
+    m = osc.measure(['vpp', 'freq', 'vrms'], channels=[1, 2, 3])
+    assert len(writes) == 1
+    assert m.values.shape == (3, 3)
+    assert m.to_dict()[1]['vpp'] == m[1].vpp
+
+def test_invalid_measurement_is_nan():
+    assert np.isnan(measure._parse('9.9E37'))
+    assert np.isnan(measure._parse('****'))
+    assert measure._parse('1.5e-3') == 1.5e-3
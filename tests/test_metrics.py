@@ -0,0 +1,58 @@
+import re
+import json
+import numpy as np
+import rigol1000z
+import metrics
+
+def test_json_export(osc, tmp_path):
+    m = osc.enable_metrics(labels={'station': 'A'})
+    for _ in range(3):
+        osc._ask(':chan1:scal?')
+    osc._ask(':chan2:scal?')
+    osc.stop()
+    d = json.loads(m.to_json(str(tmp_path / 'metrics.json')))
+    assert d == json.loads((tmp_path / 'metrics.json').read_text())
+    assert d['labels'] == {'station': 'A'}
+    scale = d['commands'][':chanN:scal?']
+    assert scale['count'] == 4
+    assert scale['bytes_written'] == 4*len(':chan1:scal?')
+    assert scale['bytes_read'] > 0
+    assert d['totals']['count'] == sum(c['count'] for c in d['commands'].values())
+
+def test_prometheus_export(osc):
+    m = osc.enable_metrics(labels={'station': 'A'})
+    osc._ask(':chan1:scal?')
+    osc.stop()
+    osc[1].get_data('raw')
+    text = m.to_prometheus()
+    lines = text.splitlines()
+    sample = re.compile(r'^[a-z_]+\{[^}]*\} \S+$')
+    assert all(l.startswith('# ') or sample.match(l) for l in lines)
+    assert 'rigol_scpi_requests_total{station="A",command=":chanN:scal?"} 1' \
+        in lines
+    # Cumulative buckets ending in +Inf, equal to the count.
+    buckets = [int(l.rsplit(' ', 1)[1]) for l in lines if l.startswith(
+        'rigol_scpi_latency_seconds_bucket{station="A",command=":wav:data?"')]
+    assert buckets == sorted(buckets)
+    count = [l for l in lines if l.startswith(
+        'rigol_scpi_latency_seconds_count{station="A",command=":wav:data?"')]
+    assert count == ['rigol_scpi_latency_seconds_count{station="A",'
+                     'command=":wav:data?"} %i' % buckets[-1]]
+
+def test_trace_replay(osc, tmp_path):
+    trace = str(tmp_path / 'session.jsonl')
+    osc.enable_metrics(trace=trace)
+    osc.stop()
+    _, recorded = osc[1].get_data('raw')
+    ws = osc.get_data_multi([1, 2], 'norm')
+    osc.disable_metrics()
+
+    replayed = rigol1000z.Rigol1054z(transport=metrics.ReplayTransport(trace))
+    replayed.progress = False
+    replayed.stop()
+    _, v = replayed[1].get_data('raw')
+    assert np.array_equal(v.codes, recorded.codes)
+    assert v.preamble == recorded.preamble
+    assert np.array_equal(replayed.get_data_multi([1, 2], 'norm').codes,
+                          ws.codes)
+    assert replayed.transport.remaining == 0
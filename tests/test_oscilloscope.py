@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+import simulator
+from oscilloscope import Oscilloscope
+
+@pytest.mark.parametrize('model', ['DS1054Z', 'DS2072A'])
+def test_drivers_share_the_base(model):
+    osc = simulator.connect(model, latency_s=0, bytes_per_s=1e12)
+    osc.progress = False
+    assert isinstance(osc, Oscilloscope)
+    osc.stop()
+    ws = osc.get_data_multi([1, 2], 'norm')
+    assert ws.codes.shape[0] == 2
+    with pytest.raises(AssertionError):
+        osc[len(osc) + 1]
+    osc.close()
+
+def test_get_data_multi_out_like_get_data(osc):
+    # A flat buffer larger than the capture, as `get_data()` accepts.
+    osc.stop()
+    buf = np.zeros(4*1200*2, 'B')
+    ws = osc.get_data_multi([1, 2], 'norm', out=buf)
+    assert np.shares_memory(ws.codes, buf)
+    _, v = osc[2].get_data('norm', out=np.zeros(4*1200, 'B'))
+    assert np.array_equal(ws.codes[1], v.codes)
@@ -0,0 +1,42 @@
+import pytest
+import profiles
+from profiles import Profile
+
+@pytest.mark.skipif(profiles.yaml is None, reason='PyYAML is not installed.')
+def test_from_yaml_path_with_colon(tmp_path):
+    path = tmp_path / 'line:a.yaml'
+    path.write_text('timebase:\n  scale_s_div: 0.001\n')
+    assert Profile.from_yaml(str(path)).get('timebase', None, 'scale_s_div') \
+        == 0.001
+    text = 'trigger: {level_V: 0.5}'
+    assert Profile.from_yaml(text).get('trigger', None, 'level_V') == 0.5
+
+def test_apply_sends_only_differences(osc):
+    profile = osc.get_profile()
+    profile.set('channels', 1, 'coupling', 'AC')
+    profile.set('trigger', None, 'level_V', 0.25)
+    assert osc.apply(profile) == [':chan1:coup AC', ':trig:edg:lev 2.500e-01']
+    assert osc.apply(profile) == []
+    assert osc.get_profile().get('channels', 1, 'coupling') == 'AC'
+
+def test_apply_order(osc):
+    osc.stop()
+    depth = osc.get_memory_depth()
+    profile = Profile({
+        'acquisition': {'memory_depth': 12000 if depth != 12000 else 120000},
+        'channels': {2: {'offset_V': 1., 'vertical_scale_V': 2.,
+                         'probe_ratio': 1 if osc[2].get_probe_ratio() != 1
+                         else 10}},
+    })
+    writes = []
+    write = osc.transport.write
+    osc.transport.write = lambda cmd: writes.append(cmd) or write(cmd)
+    cmds = osc.apply(profile)
+    headers = [c.split()[0] for c in cmds]
+    assert headers.index(':chan2:prob') < headers.index(':chan2:scal')
+    assert headers.index(':chan2:prob') < headers.index(':chan2:off')
+    assert headers[-2:] == [':run', ':acq:mdep']
+    # Sent in this order, in one batch.
+    assert ';'.join(writes).find(';'.join(cmds)) >= 0
+    osc.transport.write = write
+    assert osc.apply(profile) == []
@@ -0,0 +1,42 @@
+import io
+import screenshot
+
+def short_first_read(osc, size):
+    # The first transfer of the response brings only `size` bytes, e.g.
+    # part of the block header.
+    read_raw = osc.transport.read_raw
+    reads = []
+    def read(num_bytes=-1):
+        if not reads:
+            num_bytes = size
+        reads.append(num_bytes)
+        return read_raw(num_bytes)
+    osc.transport.read_raw = read
+    return reads
+
+def test_screenshot(osc):
+    image = osc.get_screenshot(type='png')
+    assert image.startswith(b'\x89PNG')
+
+def test_screenshot_short_reads(osc):
+    image = osc.get_screenshot(type='png')
+    read_raw = osc.transport.read_raw
+    for size in (1, 5, 11, 64):
+        reads = short_first_read(osc, size)
+        fs = io.BytesIO()
+        assert osc.get_screenshot(fs, type='png') == image
+        assert fs.getvalue() == image
+        osc.transport.read_raw = read_raw
+        assert len(reads) >= 2
+    # Nothing is left over for the next query.
+    assert osc.get_id().startswith('RIGOL')
+
+def test_read_screenshot_restores_timeout(osc):
+    osc.timeout_s = 1.
+    screenshot.read_screenshot(osc, ':disp:data? on,off,png', timeout_s=5.)
+    assert osc.timeout_s == 1.
+
+def test_stream(osc):
+    frames = list(osc.screenshot_stream('bmp24', max_frames=3))
+    assert len(frames) == 3
+    assert frames[0][0] <= frames[1][0] <= frames[2][0]
@@ -0,0 +1,138 @@
+import os
+import glob
+import time
+import stat
+import pickle
+import socket
+import threading
+import numpy as np
+import pytest
+import server
+import shm
+
+@pytest.fixture
+def served(osc, tmp_path):
+    path = str(tmp_path / 'rigol.sock')
+    srv = server.ScopeServer(path, {'S1': osc})
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+def test_socket_is_private(served):
+    mode = stat.S_IMODE(os.stat(served.path).st_mode)
+    assert mode & 0o077 == 0
+
+def test_one_lock_per_scope(served):
+    locks = []
+    threads = [threading.Thread(target=lambda: locks.append(served.lock('S2')))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(l is locks[0] for l in locks)
+
+def test_calls_and_shared_memory(served, osc):
+    with server.ScopeClient(served.path) as c:
+        assert c.serials() == ['S1']
+        scope = c.scope()
+        with c.session():
+            scope.stop()
+            ws = scope.get_data_multi([1, 2], 'raw', out=shm.SharedBuffer())
+        osc.stop()
+        assert np.array_equal(ws.codes, osc.get_data_multi([1, 2], 'raw').codes)
+        with pytest.raises(AttributeError):
+            scope.nope()
+
+def test_refuses_a_live_socket(served, osc):
+    with pytest.raises(OSError):
+        server.ScopeServer(served.path, {'S1': osc})
+    with server.ScopeClient(served.path) as c:
+        assert c.serials() == ['S1']
+
+def test_refuses_a_file(osc, tmp_path):
+    path = tmp_path / 'notes.txt'
+    path.write_text('keep me')
+    with pytest.raises(OSError):
+        server.ScopeServer(str(path), {'S1': osc})
+    assert path.read_text() == 'keep me'
+
+def test_replaces_a_stale_socket(osc, tmp_path):
+    path = str(tmp_path / 'rigol.sock')
+    dead = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    dead.bind(path)
+    dead.close()
+    srv = server.ScopeServer(path, {})
+    srv.server_close()
+
+class LockedError(Exception):
+    def __init__(self, message):
+        Exception.__init__(self, message)
+        self.lock = threading.Lock()
+
+class Faulty(object):
+    def fail(self):
+        raise LockedError('Device busy.')
+
+    def close(self):
+        pass
+
+def test_unpicklable_error(tmp_path):
+    srv = server.ScopeServer(str(tmp_path / 'rigol.sock'), {'S1': Faulty()})
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    try:
+        with server.ScopeClient(srv.path) as c:
+            with pytest.raises(RuntimeError, match='LockedError: Device busy.'):
+                c.scope().fail()
+            assert c.serials() == ['S1']
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+class Big(object):
+    def codes(self):
+        return np.ones(1 << 20, 'B')
+
+    def broken(self):
+        # The array is put in shared memory before the lock fails.
+        return np.ones(1 << 20, 'B'), threading.Lock()
+
+    def close(self):
+        pass
+
+def blocks():
+    return set(glob.glob(shm.shm_dir + 'rigol-*'))
+
+@pytest.fixture
+def big_served(tmp_path):
+    srv = server.ScopeServer(str(tmp_path / 'rigol.sock'), {'S1': Big()})
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+def test_blocks_freed_when_pickling_fails(big_served):
+    before = blocks()
+    with server.ScopeClient(big_served.path) as c:
+        with pytest.raises(Exception):
+            c.scope().broken()
+        assert c.scope().codes().sum() == 1 << 20
+    assert blocks() == before
+
+def test_blocks_freed_when_client_leaves(big_served):
+    before = blocks()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(big_served.path)
+    server._send(sock, pickle.dumps(('call', 'S1', (('attr', 'codes'),),
+                                     (), {})))
+    # The response is on its way, but the client never loads it.
+    sock.recv(8)
+    assert blocks() != before
+    sock.close()
+    for _ in range(100):
+        if blocks() == before:
+            break
+        time.sleep(0.02)
+    assert blocks() == before
@@ -0,0 +1,47 @@
+import time
+import pytest
+from stream import Stream
+
+def counting(osc, prefix):
+    sent = []
+    write = osc.transport.write
+    def counted(cmd):
+        sent.extend(c for c in cmd.split(';') if c.startswith(prefix))
+        return write(cmd)
+    osc.transport.write = counted
+    return sent
+
+def test_frames(osc):
+    with osc.stream([1, 2], max_frames=5, force=True) as s:
+        frames = [(f.index, f.codes.shape) for f in s]
+    assert s.frames == 5
+    assert [i for i, _ in frames] == sorted(i for i, _ in frames)
+    assert len(frames) + s.dropped == 5
+    assert frames[-1][0] == 4
+    assert all(shape == (2, 1200) for _, shape in frames)
+
+def test_dropped_when_consumer_stalls(osc):
+    with osc.stream([1], slots=3, max_frames=10, force=True) as s:
+        s.next(timeout=5.)
+        while s.frames < 10:
+            time.sleep(0.01)
+        rest = list(s)
+    # One frame held, two waiting in the ring; the rest were overwritten.
+    assert [f.index for f in rest] == [8, 9]
+    assert s.dropped == 7
+
+def test_preambles_reread_after_settings_write(osc):
+    queries = counting(osc, ':wav:pre?')
+    with Stream(osc, [1, 2], force=True, preamble_check_s=None) as s:
+        f = s.next(timeout=5.)
+        step = f.t.step
+        s.next(timeout=5.)
+        assert len(queries) == 2
+        with s.lock:
+            osc.timebase.set_timebase_scale_s_div(
+                10*osc.timebase.get_timebase_scale_s_div())
+        # Frames taken after the write carry the new preamble.
+        while f.t.step == step:
+            f = s.next(timeout=5.)
+        assert f.t.step == pytest.approx(10*step)
+        assert len(queries) == 4
@@ -0,0 +1,87 @@
+import time
+import socket
+import threading
+import pytest
+import rigol1000z
+from transport import SocketTransport
+
+@pytest.fixture
+def lan_osc(lan_scope):
+    scope, port = lan_scope
+    o = rigol1000z.Rigol1054z(transport=SocketTransport('127.0.0.1', port,
+                                                        timeout_s=2.))
+    o.progress = False
+    yield o
+    o.close()
+
+def test_socket_short_responses(lan_osc):
+    # '1\n' is shorter than a block header; reading it must not block.
+    assert lan_osc._ask('*OPC?') == '1'
+    assert lan_osc[1].enabled() in (True, 1, '1')
+    assert lan_osc._ask(':trig:swe?') == 'AUTO'
+
+def test_socket_opc_completion(lan_osc):
+    lan_osc[1].set_vertical_scale_V(0.5)
+    assert float(lan_osc._ask(':chan1:scal?')) == 0.5
+
+def test_socket_block(lan_scope, lan_osc):
+    scope, _ = lan_scope
+    lan_osc.stop()
+    t, v = lan_osc[1].get_data('raw')
+    assert v.codes.size == 120000
+    assert (v.codes == scope.waveform(1, 0, 120000)).all()
+
+def test_socket_sized_reads(lan_scope):
+    _, port = lan_scope
+    t = SocketTransport('127.0.0.1', port, timeout_s=2.)
+    t.write('*IDN?')
+    data = t.read_raw(5) + t.read_raw(-1)
+    assert data.startswith(b'RIGOL TECHNOLOGIES,DS1054Z')
+    assert data.endswith(b'\n')
+    t.close()
+
+def trickle(chunks):
+    # Serves one connection, sending `chunks` one by one once a message
+    # has arrived, so responses reach the client split at awkward points.
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+
+    def serve():
+        conn, _ = server.accept()
+        with conn:
+            conn.recv(65536)
+            for chunk in chunks:
+                conn.sendall(chunk)
+                time.sleep(0.01)
+            conn.recv(65536)
+        server.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return server.getsockname()[1]
+
+def test_socket_block_split_in_header():
+    data = bytes(range(256)) * 4
+    block = b'#9%09i' % len(data) + data + b'\n'
+    port = trickle([block[:1], block[1:5], block[5:300], block[300:]])
+    t = SocketTransport('127.0.0.1', port, timeout_s=2.)
+    t.write(':wav:data?')
+    assert t.read_raw() == block
+    t.close()
+
+def test_socket_responses_in_one_segment():
+    port = trickle([b'1\n0.5\n#15hello\n'])
+    t = SocketTransport('127.0.0.1', port, timeout_s=2.)
+    t.write('*OPC?;:chan1:scal?;:disp:data?')
+    assert t.read_raw() == b'1\n'
+    assert t.read_raw() == b'0.5\n'
+    assert t.read_raw() == b'#15hello\n'
+    t.close()
+
+def test_simulated_sized_reads(osc):
+    osc.transport.write('*IDN?')
+    data = osc.transport.read_raw(4) + osc.transport.read_raw(-1)
+    assert data.startswith(b'RIGO') and data.endswith(b'\n')
+    with pytest.raises(IOError):
+        osc.transport.timeout_s = 0.01
+        osc.transport.read_raw()
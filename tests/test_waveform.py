@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+from waveform import Waveform, TimeAxis
+
+def test_time_axis_float32_beyond_2_24():
+    count = 2**24 + 10
+    t = TimeAxis(-1e-3, 1e-9, count, 'float32')
+    v = t.values()
+    assert v.dtype == np.float32
+    i = np.arange(count - 20, count)
+    assert np.array_equal(v[-20:], (-1e-3 + 1e-9*i).astype(np.float32))
+
+def test_waveform_out_raises():
+    preamble = {'yincrement': 0.1, 'yorigin': 0, 'yreference': 128}
+    w = Waveform(np.arange(256, dtype='B'), preamble)
+    with pytest.raises(TypeError):
+        np.multiply(w, 2, out=w)
+    out = np.empty(256)
+    np.multiply(w, 2, out=out)
+    assert np.allclose(out, 2*w.volts())
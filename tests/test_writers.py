@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+import writers
+
+@pytest.mark.parametrize('fmt', ['raw', 'npy', 'npz', 'hdf5'])
+@pytest.mark.parametrize('block_pts', [250000, 7000])
+def test_round_trip(osc, tmp_path, fmt, block_pts):
+    if fmt == 'hdf5' and writers.h5py is None:
+        pytest.skip('h5py is not installed.')
+    osc.stop()
+    osc.block_pts = block_pts
+    filename = str(tmp_path / 'capture')
+    t, v = osc[1].get_data('raw', filename, fmt=fmt)
+    lt, lv = writers.load(filename, fmt)
+    assert np.array_equal(np.asarray(lv.codes), v.codes)
+    assert lv.preamble == v.preamble
+    assert (lt.start, lt.step, lt.count) == (t.start, t.step, t.count)
+    assert np.array_equal(lv.volts(), v.volts())
+
+def test_csv(osc, tmp_path):
+    osc.stop()
+    filename = str(tmp_path / 'capture.csv')
+    t, v = osc[1].get_data('norm', filename)
+    rows = np.loadtxt(filename, delimiter=',')
+    assert np.allclose(rows[:, 0], t.values(), rtol=1e-12, atol=0)
+    assert np.allclose(rows[:, 1], v.volts(), rtol=1e-12, atol=0)
@@ -0,0 +1,462 @@
+import os
+import time
+import fcntl
+import socket
+import struct
+from completion import make_completion
+from cache import SettingsCache, settings_queries, changes_settings
+from batch import Batch
+from download import parse_block_header
+
+class Transport(object):
+    '''
+    Moves SCPI messages between the host and an oscilloscope.
+
+    Subclasses implement `write()` and `read_raw()` for one kind of
+    connection; the drivers only talk to this interface, so any
+    oscilloscope can be driven over any transport, including the
+    in-process simulator.
+
+    Attributes:
+        name (str): Short name of the transport, used e.g. to key cached
+            autotuning results.
+    '''
+    name = ''
+
+    def write(self, cmd):
+        '''
+        Send one SCPI message.
+
+        Args:
+            cmd (str): The message, without a terminating newline.
+        '''
+        raise NotImplementedError
+
+    def read_raw(self, num_bytes=-1):
+        '''
+        Read a response.
+
+        Args:
+            num_bytes (int): Maximum number of bytes to read.  Default is
+                -1; the whole response.
+
+        Returns:
+            bytes: The response.
+        '''
+        raise NotImplementedError
+
+    def read(self, num_bytes=-1):
+        return self.read_raw(num_bytes).decode()
+
+    def block_read_bytes(self, count):
+        '''
+        Number of bytes to ask `read_raw()` for when reading a waveform
+        block of `count` points.
+        '''
+        return -1
+
+    def clear(self):
+        '''
+        Discard any response still queued, e.g. the rest of a block whose
+        read failed, so the next query reads its own response.
+        '''
+        timeout = self.timeout_s
+        self.timeout_s = 0.1
+        try:
+            while self.read_raw():
+                pass
+        except Exception:
+            pass
+        finally:
+            self.timeout_s = timeout
+
+    @property
+    def timeout_s(self):
+        return self._timeout_s
+
+    @timeout_s.setter
+    def timeout_s(self, timeout):
+        self._timeout_s = timeout
+
+    def close(self):
+        pass
+
+class PyUsbtmcTransport(Transport):
+    '''
+    USBTMC using python-usbtmc.
+
+    Args:
+        vid (int): USB vendor id.
+        pid (int): USB product id.
+        serial (None, str): Serial number, to choose between several
+            instruments with the same ids.  Default is `None`; the first.
+    '''
+    name = 'python-usbtmc'
+
+    def __init__(self, vid, pid, serial=None):
+        import usbtmc
+        self.file = usbtmc.Instrument(vid, pid, serial)
+
+    def write(self, cmd):
+        return self.file.write(cmd)
+
+    def read_raw(self, num_bytes=-1):
+        return self.file.read_raw(num_bytes)
+
+    def read(self, num_bytes=-1):
+        return self.file.read(num_bytes)
+
+    def clear(self):
+        self.file.clear()
+
+    @property
+    def timeout_s(self):
+        return self.file.timeout
+
+    @timeout_s.setter
+    def timeout_s(self, timeout):
+        self.file.timeout = timeout
+
+    def close(self):
+        self.file.close()
+
+class KernelUsbtmcTransport(Transport):
+    '''
+    USBTMC using the Linux kernel driver's `/dev/usbtmcN` files.
+
+    Args:
+        usbtmc_dev_number (int): USBTMC device number of the instrument.
+    '''
+    name = 'kernel-usbtmc'
+
+    def __init__(self, usbtmc_dev_number):
+        usbtmc = '/dev/usbtmc' + str(usbtmc_dev_number)
+        self._dev = os.open(usbtmc, os.O_RDWR)
+        self._timeout_s = 5.
+
+    def write(self, cmd):
+        os.write(self._dev, str.encode(cmd))
+
+    def read_raw(self, num_bytes=-1):
+        if num_bytes < 0:
+            num_bytes = 1 << 20
+        return os.read(self._dev, num_bytes)
+
+    def block_read_bytes(self, count):
+        # Header, data and newline, with room for a longer header.
+        return count + 64
+
+    def clear(self):
+        # USBTMC_IOCTL_CLEAR.
+        fcntl.ioctl(self._dev, 0x5b02)
+
+    @property
+    def timeout_s(self):
+        return self._timeout_s
+
+    @timeout_s.setter
+    def timeout_s(self, timeout):
+        # USBTMC_IOCTL_SET_TIMEOUT, only available from Linux 4.19.
+        try:
+            fcntl.ioctl(self._dev, 0x40045b0a, struct.pack('I', int(timeout*1000)))
+        except OSError:
+            return
+        self._timeout_s = timeout
+
+    def close(self):
+        os.close(self._dev)
+
+class SocketTransport(Transport):
+    '''
+    Raw SCPI over TCP, as served by Rigol oscilloscopes on port 5555 of
+    their LAN interface.
+
+    Responses are newline terminated, except definite length blocks whose
+    length is read from their header.
+
+    Args:
+        host (str): Hostname or IP address of the oscilloscope.
+        port (int): TCP port.  Default is 5555.
+        timeout_s (float): Socket timeout.  Default is 5s.
+    '''
+    name = 'socket'
+
+    def __init__(self, host, port=5555, timeout_s=5.):
+        self._sock = socket.create_connection((host, port), timeout_s)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._buf = b''
+
+    def write(self, cmd):
+        self._sock.sendall(str.encode(cmd) + b'\n')
+
+    def _recv(self, num_bytes):
+        while len(self._buf) < num_bytes:
+            data = self._sock.recv(max(65536, num_bytes - len(self._buf)))
+            if not data:
+                raise IOError('Connection closed.')
+            self._buf += data
+        data, self._buf = self._buf[:num_bytes], self._buf[num_bytes:]
+        return data
+
+    def _recv_line(self):
+        while b'\n' not in self._buf:
+            data = self._sock.recv(65536)
+            if not data:
+                raise IOError('Connection closed.')
+            self._buf += data
+        i = self._buf.index(b'\n') + 1
+        data, self._buf = self._buf[:i], self._buf[i:]
+        return data
+
+    def clear(self):
+        self._buf = b''
+        timeout = self._sock.gettimeout()
+        self._sock.settimeout(0.1)
+        try:
+            while self._sock.recv(65536):
+                pass
+        except OSError:
+            pass
+        finally:
+            self._sock.settimeout(timeout)
+
+    def read_raw(self, num_bytes=-1):
+        if num_bytes >= 0:
+            if not self._buf:
+                self._buf = self._sock.recv(max(num_bytes, 1))
+            data, self._buf = self._buf[:num_bytes], self._buf[num_bytes:]
+            return data
+        head = self._recv(2)
+        if head[:1] != b'#':
+            # Short responses, e.g. '1\n', may already hold the newline.
+            self._buf = head + self._buf
+            return self._recv_line()
+        head += self._recv(int(head[1:2]))
+        _, length = parse_block_header(head)
+        return head + self._recv(length) + self._recv_line()
+
+    @property
+    def timeout_s(self):
+        return self._sock.gettimeout()
+
+    @timeout_s.setter
+    def timeout_s(self, timeout):
+        self._sock.settimeout(timeout)
+
+    def close(self):
+        self._sock.close()
+
+class SimulatedTransport(Transport):
+    '''
+    Talks to an in-process `simulator.SimulatedScope`.
+
+    Args:
+        scope (`simulator.SimulatedScope`): The simulated oscilloscope.
+        latency_s (float): Time each write and read takes regardless of
+            its size.  Default is 0.5ms.
+        bytes_per_s (float): Transfer rate of responses.  Default is
+            1e6, roughly a DS1054Z over USB.
+    '''
+    name = 'simulated'
+
+    def __init__(self, scope, latency_s=0.5e-3, bytes_per_s=1e6):
+        self.scope = scope
+        self.latency_s = latency_s
+        self.bytes_per_s = bytes_per_s
+        self._timeout_s = 5.
+        self._response = b''
+
+    def write(self, cmd):
+        time.sleep(self.latency_s)
+        response = self.scope.handle(cmd)
+        if response is not None:
+            self._response += response
+
+    def clear(self):
+        self._response = b''
+
+    def read_raw(self, num_bytes=-1):
+        if not self._response:
+            time.sleep(self._timeout_s)
+            raise IOError('Timed out waiting for a response.')
+        if num_bytes < 0:
+            num_bytes = len(self._response)
+        data = self._response[:num_bytes]
+        self._response = self._response[num_bytes:]
+        time.sleep(self.latency_s + len(data)/self.bytes_per_s)
+        return data
+
+class ScpiInstrument(object):
+    '''
+    Basic SCPI read/write interface on top of a `Transport`.
+
+    Args:
+        transport (`Transport`): Connection to the instrument.
+        completion (str, `completion.Completion`): How to wait for the
+            instrument to finish processing a command.  Default is 'opc'.
+
+    Attributes:
+        transport (`Transport`): Connection to the instrument.
+        completion (`completion.Completion`): Decides how to wait for the
+            instrument to finish a command.
+        block_pts (int): Maximum number of points per waveform block.
+        progress (bool): Show progress bars while downloading.
+        cache (None, `cache.SettingsCache`): Cache of the instrument's
+            settings, or `None` if settings are always queried.
+        batching (bool): Let `batch()` coalesce commands into one message.
+            Set to `False` for instruments that do not accept several
+            commands per message.
+        settings_version (int): Incremented whenever a command that
+            changes the settings is written, so e.g. a stream knows when
+            to re-read the waveform preamble.
+        metrics (None, `metrics.Metrics`): Command statistics, once
+            `enable_metrics()` has been called.
+    '''
+    block_pts = 250000
+    progress = True
+    cache = None
+    batching = True
+    settings_version = 0
+    _batch = None
+
+    def __init__(self, transport, completion='opc'):
+        self.transport = transport
+        self.completion = make_completion(completion)
+
+    @property
+    def transport_name(self):
+        return self.transport.name
+
+    @property
+    def timeout_s(self):
+        return self.transport.timeout_s
+
+    @timeout_s.setter
+    def timeout_s(self, timeout):
+        self.transport.timeout_s = timeout
+
+    def _write(self, cmd):
+        if changes_settings(cmd):
+            self.settings_version += 1
+        if self.cache is not None:
+            self.cache.write(cmd)
+        if self._batch is not None:
+            return self._batch._write(cmd)
+        ret = self.transport.write(cmd)
+        self.completion.wait(cmd, self.transport.write, self._ask_nowait)
+        return ret
+
+    def _sync(self):
+        # Wait until everything written so far has been processed, even
+        # in completion modes that do not wait for every command.
+        if self.completion.mode not in ('opc', 'esr') and self._batch is None:
+            self._ask_nowait('*OPC?')
+
+    def _ask_nowait(self, cmd):
+        self.transport.write(cmd)
+        return self._read()
+
+    def _read(self, num_bytes=-1):
+        return self.transport.read(num_bytes).strip()
+
+    def _read_raw(self, num_bytes=-1):
+        return self.transport.read_raw(num_bytes)
+
+    def _ask(self, cmd, num_bytes=-1):
+        if self.cache is not None:
+            return self.cache.get(cmd, self._ask_uncached)
+        return self._ask_uncached(cmd, num_bytes)
+
+    def _ask_uncached(self, cmd, num_bytes=-1):
+        self._write(cmd)
+        return self._read(num_bytes)
+
+    def _ask_raw(self, cmd, num_bytes=-1):
+        self._write(cmd)
+        return self._read_raw(num_bytes)
+
+    def _block_read_bytes(self, count):
+        return self.transport.block_read_bytes(count)
+
+    def batch(self, max_length=500):
+        '''
+        Coalesce the commands sent inside a `with` block into as few
+        messages as possible; see `batch.Batch`.
+
+        Args:
+            max_length (int): Longest message sent, in characters.
+                Default is 500.
+
+        Returns:
+            `batch.Batch`: Context manager; its `ask()` defers queries
+                until the end of the block.
+        '''
+        return Batch(self, max_length, self.batching)
+
+    def enable_cache(self, ttl_s=None):
+        '''
+        Serve settings queries from a cache of the last known settings.
+
+        Args:
+            ttl_s (None, float): Seconds a cached setting is trusted while
+                the front panel is unlocked.  Default is `None`; forever.
+
+        Returns:
+            `cache.SettingsCache`: The cache.
+        '''
+        self.cache = SettingsCache(ttl_s)
+        return self.cache
+
+    def disable_cache(self):
+        self.cache = None
+
+    def enable_metrics(self, trace=None, labels=None):
+        '''
+        Record the latency, bytes and errors of every command; see
+        `metrics.Metrics`.
+
+        Args:
+            trace (None, str, `metrics.TraceLog`): Also log every transfer
+                to this trace file, which `metrics.ReplayTransport` can
+                play back.  Default is `None`; no trace.
+            labels (None, dict): Labels of the exported metrics.  Default
+                is none.
+
+        Returns:
+            `metrics.Metrics`: The metrics.
+        '''
+        import metrics
+        self.disable_metrics()
+        if isinstance(trace, str):
+            trace = metrics.TraceLog(trace)
+        self.transport = metrics.MetricsTransport(
+            self.transport, metrics.Metrics(labels), trace)
+        return self.transport.metrics
+
+    def disable_metrics(self):
+        import metrics
+        if isinstance(self.transport, metrics.MetricsTransport):
+            if self.transport.trace is not None:
+                self.transport.trace.close()
+            self.transport = self.transport.transport
+
+    @property
+    def metrics(self):
+        '''
+        The `metrics.Metrics` being recorded, or `None`.
+        '''
+        return getattr(self.transport, 'metrics', None)
+
+    def refresh_settings(self):
+        '''
+        Read all settings into the cache in one exchange.
+        '''
+        assert self.cache is not None, 'The cache is not enabled.'
+        self.cache.invalidate()
+        # The batch stores each response in the cache as it is resolved.
+        with self.batch() as b:
+            for query in settings_queries(len(self)):
+                b.ask(query)
+
+    def close(self):
+        self.transport.close()
@@ -0,0 +1,296 @@
+import numpy as np
+
+class Waveform(np.lib.mixins.NDArrayOperatorsMixin):
+    '''
+    Voltage waveform kept as the raw 8-bit codes from the oscilloscope.
+
+    The codes take a quarter of the memory of float32 volts and an eighth
+    of float64 volts.  Volts are only computed when asked for: indexing
+    or slicing converts just the selected points through a 256 entry
+    lookup table, and NumPy functions and arithmetic convert the whole
+    waveform in place in the result, so only the result is allocated.
+
+    Args:
+        codes (numpy.ndarray): uint8 codes from `:wav:data?`.
+        preamble (dict): Preamble from `get_data_premable()`.
+        dtype (str, numpy.dtype): Float type volts are returned as unless
+            asked otherwise.  Default is 'float64'.
+    '''
+    def __init__(self, codes, preamble, dtype='float64'):
+        self.codes = codes
+        self.preamble = preamble
+        self.dtype = np.dtype(dtype)
+        self._luts = {}
+
+    def lut(self, dtype=None):
+        '''
+        The volts corresponding to each of the 256 codes.
+
+        Args:
+            dtype (None, str, numpy.dtype): Float type.  Default is `None`;
+                the waveform's dtype.
+
+        Returns:
+            numpy.ndarray: 256 element lookup table.
+        '''
+        dtype = self.dtype if dtype is None else np.dtype(dtype)
+        lut = self._luts.get(dtype)
+        if lut is None:
+            pre = self.preamble
+            codes = np.arange(256, dtype='float64')
+            lut = (codes - pre['yorigin'] - pre['yreference']) * pre['yincrement']
+            lut = lut.astype(dtype)
+            self._luts[dtype] = lut
+        return lut
+
+    def volts(self, dtype=None, out=None):
+        '''
+        Convert the whole waveform to volts.
+
+        Args:
+            dtype (None, str, numpy.dtype): Float type of the result.
+                Default is `None`; the waveform's dtype, or the dtype of
+                `out` if given.
+            out (None, numpy.ndarray): Buffer of the same shape as the
+                waveform to write the volts into.  Default is `None`; a
+                new array is allocated.
+
+        Returns:
+            numpy.ndarray: The voltage values.
+        '''
+        if out is None:
+            dtype = self.dtype if dtype is None else np.dtype(dtype)
+            out = np.empty(self.codes.shape, dtype)
+        assert out.shape == self.codes.shape, 'Wrong shape.'
+        pre = self.preamble
+        np.copyto(out, self.codes, casting='unsafe')
+        out -= pre['yorigin'] + pre['yreference']
+        out *= pre['yincrement']
+        return out
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def size(self):
+        return self.codes.size
+
+    @property
+    def ndim(self):
+        return self.codes.ndim
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, key):
+        return self.lut()[self.codes[key]]
+
+    def __iter__(self):
+        return iter(self.volts())
+
+    def __array__(self, dtype=None, copy=None):
+        return self.volts(dtype)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        # Volts are computed from the codes, so cannot be written to.
+        if any(isinstance(o, Waveform) for o in kwargs.get('out', ())):
+            raise TypeError('A Waveform cannot be the output of a ufunc.')
+        inputs = [i.volts() if isinstance(i, Waveform) else i for i in inputs]
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def __repr__(self):
+        return 'Waveform(%i points, %s)' % (self.size, self.dtype)
+
+class TimeAxis(np.lib.mixins.NDArrayOperatorsMixin):
+    '''
+    Evenly spaced time values stored as a start, step and count.
+
+    Behaves like the array `start + step*arange(count)` but is only
+    materialised when used with NumPy or `values()` is called.  Slicing
+    returns another `TimeAxis`.
+
+    Args:
+        start (float): Time of the first point [s].
+        step (float): Time between points [s].
+        count (int): Number of points.
+        dtype (str, numpy.dtype): Float type of the materialised array.
+            Default is 'float64'.
+    '''
+    def __init__(self, start, step, count, dtype='float64'):
+        self.start = start
+        self.step = step
+        self.count = count
+        self.dtype = np.dtype(dtype)
+
+    @classmethod
+    def from_preamble(cls, preamble, count=None, dtype='float64'):
+        '''
+        Time axis of a waveform described by a preamble.
+
+        Point `i` is at `xorigin + (i - xreference)*xincrement`.
+
+        Args:
+            preamble (dict): Preamble from `get_data_premable()`.
+            count (None, int): Number of points.  Default is `None`; the
+                preamble's number of points.
+            dtype (str, numpy.dtype): Float type.  Default is 'float64'.
+
+        Returns:
+            TimeAxis: The time axis.
+        '''
+        if count is None:
+            count = preamble['points']
+        start = preamble['xorigin'] - preamble['xreference']*preamble['xincrement']
+        return cls(start, preamble['xincrement'], count, dtype)
+
+    @property
+    def stop(self):
+        '''
+        Time of the last point [s].
+        '''
+        return self.start + (self.count-1)*self.step
+
+    def index(self, t):
+        '''
+        Index of the point closest to time `t`.
+
+        Args:
+            t (float): Time [s].
+
+        Returns:
+            int: Index, clipped to the axis.
+        '''
+        i = int(round((t - self.start) / self.step))
+        return min(max(i, 0), self.count-1)
+
+    def values(self, dtype=None):
+        '''
+        Materialise the time axis.
+
+        Args:
+            dtype (None, str, numpy.dtype): Float type.  Default is `None`;
+                the axis' dtype.
+
+        Returns:
+            numpy.ndarray: The time values.
+        '''
+        dtype = self.dtype if dtype is None else np.dtype(dtype)
+        # In float64 whatever the dtype: float32 cannot count past 2**24.
+        t = np.arange(self.count, dtype=np.float64)
+        t *= self.step
+        t += self.start
+        return t.astype(dtype, copy=False)
+
+    @property
+    def shape(self):
+        return (self.count,)
+
+    @property
+    def size(self):
+        return self.count
+
+    @property
+    def ndim(self):
+        return 1
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            first, _, stride = key.indices(self.count)
+            count = len(range(*key.indices(self.count)))
+            return TimeAxis(self.start + first*self.step, self.step*stride,
+                            count, self.dtype)
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += self.count
+            if not 0 <= key < self.count:
+                raise IndexError('Time axis index out of range.')
+            return self.start + key*self.step
+        idx = np.asarray(key)
+        if idx.dtype == bool:
+            idx = np.flatnonzero(idx)
+        idx = np.where(idx < 0, idx + self.count, idx)
+        return (self.start + idx*self.step).astype(self.dtype)
+
+    def __iter__(self):
+        return iter(self.values())
+
+    def __array__(self, dtype=None, copy=None):
+        return self.values(dtype)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = [i.values() if isinstance(i, TimeAxis) else i for i in inputs]
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def __repr__(self):
+        return 'TimeAxis(start=%g, step=%g, count=%i)' % (self.start, self.step,
+                                                           self.count)
+
+class WaveformSet(object):
+    '''
+    Waveforms of several channels captured from the same acquisition.
+
+    The codes of all channels are held in one 2-D uint8 array, one row
+    per channel, and share one time axis.  Indexing with a channel number
+    returns that channel's `Waveform`.
+
+    Args:
+        channels (list): The channel numbers, in row order.
+        codes (numpy.ndarray): uint8 codes, shape `(len(channels), points)`.
+        preambles (list): The preamble of each channel.
+        dtype (str, numpy.dtype): Float type volts are returned as.
+            Default is 'float64'.
+
+    Attributes:
+        t (`TimeAxis`): The time axis shared by all channels.
+    '''
+    def __init__(self, channels, codes, preambles, dtype='float64'):
+        self.channels = list(channels)
+        self.codes = codes
+        self.preambles = preambles
+        self.dtype = np.dtype(dtype)
+        self.t = TimeAxis.from_preamble(preambles[0], codes.shape[1])
+        self._waveforms = [Waveform(c, p, dtype) for c, p in zip(codes, preambles)]
+
+    def __getitem__(self, channel):
+        return self._waveforms[self.channels.index(channel)]
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __iter__(self):
+        return iter(self._waveforms)
+
+    def items(self):
+        '''
+        Returns:
+            list: `(channel, Waveform)` tuples.
+        '''
+        return list(zip(self.channels, self._waveforms))
+
+    def volts(self, dtype=None, out=None):
+        '''
+        Convert all channels to volts.
+
+        Args:
+            dtype (None, str, numpy.dtype): Float type of the result.
+                Default is `None`; the set's dtype, or the dtype of `out`.
+            out (None, numpy.ndarray): Buffer of the same shape as `codes`.
+                Default is `None`; a new array is allocated.
+
+        Returns:
+            numpy.ndarray: Volts, one row per channel.
+        '''
+        if out is None:
+            dtype = self.dtype if dtype is None else np.dtype(dtype)
+            out = np.empty(self.codes.shape, dtype)
+        for row, w in zip(out, self._waveforms):
+            w.volts(out=row)
+        return out
+
+    def __repr__(self):
+        return 'WaveformSet(channels=%s, %i points)' % (self.channels,
+                                                       self.codes.shape[1])
@@ -0,0 +1,218 @@
+import os
+import json
+import zipfile
+import numpy as np
+from waveform import Waveform, TimeAxis
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+class Writer(object):
+    '''
+    Streams a waveform to a file block by block as it is downloaded.
+
+    Writers store the raw 8-bit codes and the preamble, except `CsvWriter`
+    which stores time and voltage text.  `open()` is called once with the
+    preamble, `write_block()` for each downloaded block in order, and
+    `close()` when the download has finished.
+
+    Args:
+        filename (str): The file to write.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+
+    def open(self, preamble, points):
+        self.preamble = preamble
+        self.points = points
+
+    def write_block(self, start, codes):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class RawWriter(Writer):
+    '''
+    Raw uint8 codes, with the preamble in a JSON sidecar `<filename>.json`.
+    '''
+    def open(self, preamble, points):
+        Writer.open(self, preamble, points)
+        with open(self.filename + '.json', 'w') as fs:
+            json.dump({'points': points, 'preamble': preamble}, fs, indent=2)
+        self._fs = open(self.filename, 'wb')
+
+    def write_block(self, start, codes):
+        self._fs.write(codes)
+
+    def close(self):
+        self._fs.close()
+
+class NpyWriter(Writer):
+    '''
+    A `.npy` file of the uint8 codes, with the preamble in a JSON sidecar
+    `<filename>.json`.
+    '''
+    def open(self, preamble, points):
+        Writer.open(self, preamble, points)
+        with open(self.filename + '.json', 'w') as fs:
+            json.dump({'points': points, 'preamble': preamble}, fs, indent=2)
+        self._fs = open(self.filename, 'wb')
+        _write_npy_header(self._fs, points)
+
+    def write_block(self, start, codes):
+        self._fs.write(codes)
+
+    def close(self):
+        self._fs.close()
+
+class NpzWriter(Writer):
+    '''
+    A `.npz` archive containing `codes` and `preamble` (a JSON string).
+    '''
+    def open(self, preamble, points):
+        Writer.open(self, preamble, points)
+        self._zip = zipfile.ZipFile(self.filename, 'w')
+        self._fs = self._zip.open('codes.npy', 'w', force_zip64=True)
+        _write_npy_header(self._fs, points)
+
+    def write_block(self, start, codes):
+        self._fs.write(codes)
+
+    def close(self):
+        self._fs.close()
+        with self._zip.open('preamble.npy', 'w') as fs:
+            np.lib.format.write_array(fs, np.array(json.dumps(self.preamble)))
+        self._zip.close()
+
+class Hdf5Writer(Writer):
+    '''
+    An HDF5 file with a `codes` dataset whose attributes are the preamble.
+    Needs h5py.
+    '''
+    def open(self, preamble, points):
+        assert h5py is not None, 'h5py is needed to write HDF5 files.'
+        Writer.open(self, preamble, points)
+        self._h5 = h5py.File(self.filename, 'w')
+        self._ds = self._h5.create_dataset('codes', (points,), 'u1',
+                                           chunks=True)
+        self._ds.attrs.update(preamble)
+
+    def write_block(self, start, codes):
+        self._ds[start:start+codes.size] = codes
+
+    def close(self):
+        self._h5.close()
+
+class CsvWriter(Writer):
+    '''
+    Comma separated time and voltage columns, formatted a block at a time.
+    The voltage of each of the 256 codes is formatted once, in `open()`.
+    '''
+    fmt = '%.12e,%.12e\n'
+
+    def open(self, preamble, points):
+        Writer.open(self, preamble, points)
+        self._t = TimeAxis.from_preamble(preamble, points)
+        t_fmt, v_fmt = self.fmt.split(',', 1)
+        self._row = t_fmt + ',%s'
+        self._volts = np.array([v_fmt % v for v in
+                                Waveform(None, preamble).lut().tolist()], object)
+        self._fs = open(self.filename, 'w')
+
+    def write_block(self, start, codes):
+        chunk = 65536
+        for i in range(0, codes.size, chunk):
+            c = codes[i:i+chunk]
+            fields = np.empty(2*c.size, object)
+            fields[0::2] = self._t[start+i:start+i+c.size].values().tolist()
+            fields[1::2] = self._volts[c]
+            self._fs.write((self._row * c.size) % tuple(fields))
+
+    def close(self):
+        self._fs.close()
+
+writers = {
+    'csv': CsvWriter,
+    'raw': RawWriter,
+    'npy': NpyWriter,
+    'npz': NpzWriter,
+    'hdf5': Hdf5Writer,
+}
+
+extensions = {
+    '.csv': 'csv',
+    '.dat': 'csv',
+    '.txt': 'csv',
+    '.bin': 'raw',
+    '.raw': 'raw',
+    '.npy': 'npy',
+    '.npz': 'npz',
+    '.h5': 'hdf5',
+    '.hdf5': 'hdf5',
+}
+
+def make_writer(filename, fmt=None):
+    '''
+    Pick a writer for a file.
+
+    Args:
+        filename (str): The file to write.
+        fmt (None, str): One of 'csv', 'raw', 'npy', 'npz' or 'hdf5'.
+            Default is `None`; chosen from the extension of `filename`,
+            falling back to 'csv'.
+
+    Returns:
+        Writer: The writer.
+    '''
+    if fmt is None:
+        ext = os.path.splitext(filename)[1].lower()
+        fmt = extensions.get(ext, 'csv')
+    assert fmt in writers, 'Not a valid file format.'
+    return writers[fmt](filename)
+
+def _write_npy_header(fs, points):
+    header = {'descr': '|u1', 'fortran_order': False, 'shape': (points,)}
+    np.lib.format.write_array_header_2_0(fs, header)
+
+def load(filename, fmt=None, mmap=True):
+    '''
+    Load a waveform saved by one of the binary writers.
+
+    Args:
+        filename (str): The file to load.
+        fmt (None, str): The file format; see `make_writer()`.
+        mmap (bool): Memory map raw and `.npy` files instead of reading
+            them.  Default is `True`.
+
+    Returns:
+        2-tuple: The `TimeAxis` and the `Waveform`.
+    '''
+    if fmt is None:
+        fmt = extensions.get(os.path.splitext(filename)[1].lower(), 'csv')
+    assert fmt in ('raw', 'npy', 'npz', 'hdf5'), 'Not a binary file format.'
+
+    if fmt == 'raw':
+        with open(filename + '.json') as fs:
+            preamble = json.load(fs)['preamble']
+        if mmap:
+            codes = np.memmap(filename, 'B', 'r')
+        else:
+            codes = np.fromfile(filename, 'B')
+    elif fmt == 'npy':
+        with open(filename + '.json') as fs:
+            preamble = json.load(fs)['preamble']
+        codes = np.load(filename, 'r' if mmap else None)
+    elif fmt == 'npz':
+        with np.load(filename) as npz:
+            codes = npz['codes']
+            preamble = json.loads(str(npz['preamble']))
+    else:
+        assert h5py is not None, 'h5py is needed to read HDF5 files.'
+        with h5py.File(filename, 'r') as h5:
+            codes = h5['codes'][:]
+            preamble = dict((k, v.item()) for k, v in h5['codes'].attrs.items())
+
+    return TimeAxis.from_preamble(preamble, codes.size), Waveform(codes, preamble)